@@ -1,24 +1,44 @@
 import os
+import json
+import math
+import base64
 import socket
 import secrets
 import string
 import logging
+import mimetypes
+import hashlib
+import shutil
 from datetime import datetime, timedelta
 from io import BytesIO
 from urllib.parse import quote
 
 import qrcode
-from flask import Flask, render_template, request, redirect, url_for, session, send_file, flash, jsonify, abort, make_response, send_from_directory
+from flask import Flask, render_template, request, redirect, url_for, session, send_file, flash, jsonify, abort, make_response, send_from_directory, get_template_attribute
 from werkzeug.utils import secure_filename
-from werkzeug.exceptions import RequestedRangeNotSatisfiable
+from werkzeug.exceptions import HTTPException
 from werkzeug.security import generate_password_hash, check_password_hash
-from PIL import Image
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from catalog import FileCatalog, MemoryCatalog, FILE_TYPES
+from transfer import TransferBody, ranged_file_response, not_modified, set_validators
+from resumable import UploadSessionStore, UploadSessionError
+from archive import ARCHIVE_FORMATS, plan_entries
+from thumbnails import ThumbnailCache, is_thumbnailable
+from ingest import ingest_multipart, cleanup_temp_files, IngestError, TEMP_PREFIX
+from server_state import ServerState
+from watcher import FolderWatcher
+from search import TrigramIndex
+from events import ChangeFeed, EventStream
+from blobs import BlobStore, file_sha256
+from chunkstore import ChunkStore
+from delta import DeltaError, SignatureCache, apply_delta, file_signature
+from utils import get_free_disk_space
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 
 app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
 
 # Configuration
 UPLOAD_FOLDER = 'uploads'
@@ -43,8 +63,44 @@ app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
 # Ensure upload directory exists
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# State shared by every worker process of this server run
+server_state = ServerState(UPLOAD_FOLDER)
+# Child processes (the reloader, pre-forked workers) join the same run
+os.environ.setdefault('FILESERVER_BOOT_ID', server_state.boot_id)
+
+app.secret_key = os.environ.get("SESSION_SECRET") or server_state.boot_setting('secret_key', lambda: secrets.token_hex(32))
+
+# Failed-login throttling, counted across all workers
+LOGIN_ATTEMPT_LIMIT = 20
+LOGIN_ATTEMPT_WINDOW = 300
+
+# Reverse proxies in front of the server (Render has one). Their
+# X-Forwarded-For/-Proto headers are trusted for that many hops, so
+# remote_addr, and with it the login throttle, is the real client.
+PROXY_HOPS = int(os.environ.get('FILESERVER_PROXY_HOPS', '1' if os.environ.get('RENDER') else '0'))
+if PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_HOPS, x_proto=PROXY_HOPS)
+
+# Store identical uploads once, as hard links to a content-addressed blob
+DEDUP_STORAGE = os.environ.get('FILESERVER_DEDUP', '').lower() in ('1', 'true', 'yes')
+
+# Where uploaded bytes live: 'files' keeps each upload as a plain file in the
+# upload folder, 'chunks' keeps them in the chunk-level dedup store
+STORAGE_BACKEND = os.environ.get('FILESERVER_STORAGE', 'files').lower()
+
+# Files shown per page on the file browser
+LIST_PAGE_SIZE = 200
+
+# Page size limits for the JSON listing API
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+
+# Part of the listing page validator so a template change invalidates cached pages
+LISTING_TEMPLATE_VERSION = int(os.path.getmtime(os.path.join(app.root_path, 'templates', 'files.html')))
+
 # Global variables for server info
 SERVER_PASSWORD = None
+SERVER_PASSWORD_HASH = None
 SERVER_URL = None
 SERVER_PORT = int(os.environ.get('PORT', 5000))
 
@@ -175,9 +231,41 @@ def format_file_size(size_bytes):
     return f"{size_bytes:.1f}{size_names[i]}"
 
 
+def encode_cursor(key):
+    """Encode a catalog keyset position as an opaque URL-safe cursor"""
+    raw = json.dumps(key, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, sort='name'):
+    """Decode a cursor produced by encode_cursor for a listing sorted by ``sort``
+
+    Returns None if the cursor is malformed or its position does not have
+    the type the sort key compares (a number for size/mtime, a string for
+    name/type), so a tampered cursor cannot reach the catalog's comparisons.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(key, list) or len(key) != 2 or not isinstance(key[1], str):
+        return None
+    if sort in ('size', 'mtime'):
+        valid = (isinstance(key[0], (int, float)) and not isinstance(key[0], bool)
+                 and math.isfinite(key[0]))
+    else:
+        valid = isinstance(key[0], str)
+    return tuple(key) if valid else None
+
+
+def compact_json(payload, status=200):
+    """Build a JSON response without insignificant whitespace"""
+    return app.response_class(json.dumps(payload, separators=(',', ':')), status, mimetype='application/json')
+
+
 def generate_qr_code():
     """Generate QR code containing server URL and password"""
-    global SERVER_URL, SERVER_PASSWORD
     if not SERVER_URL or not SERVER_PASSWORD:
         return None
     
@@ -198,25 +286,81 @@ def generate_qr_code():
 
 def initialize_server():
     """Initialize server settings"""
-    global SERVER_PASSWORD, SERVER_URL
-    if not SERVER_PASSWORD:
-        SERVER_PASSWORD = generate_password()
-    if not SERVER_URL:
-        SERVER_URL = get_server_url()
+    global SERVER_PASSWORD, SERVER_PASSWORD_HASH, SERVER_URL
+    # Every worker reads the values stored by whichever started first
+    SERVER_PASSWORD = server_state.boot_setting('password', generate_password)
+    SERVER_PASSWORD_HASH = server_state.boot_setting('password_hash', lambda: generate_password_hash(SERVER_PASSWORD))
+    SERVER_URL = server_state.boot_setting('server_url', get_server_url)
     app.logger.info(f"Server initialized - URL: {SERVER_URL}, Password: {SERVER_PASSWORD}")
 
 # Initialize server info at startup
 initialize_server()
 
+# Drop temp files from uploads interrupted before a restart
+cleanup_temp_files(UPLOAD_FOLDER)
+server_state.purge_expired()
+
+# Journaled sessions for resumable chunked uploads
+upload_sessions = UploadSessionStore(UPLOAD_FOLDER)
+try:
+    upload_sessions.cleanup_expired()
+except Exception as e:
+    app.logger.error(f"Error cleaning upload sessions: {e}")
+
+# Chunk store holding every upload when chunk storage is selected
+chunk_store = ChunkStore(UPLOAD_FOLDER) if STORAGE_BACKEND == 'chunks' else None
+
+# Content-addressed blobs behind the upload folder in dedup mode
+blob_store = BlobStore(UPLOAD_FOLDER, enabled=DEDUP_STORAGE and chunk_store is None)
+try:
+    blob_store.collect()
+except Exception as e:
+    app.logger.error(f"Error collecting unreferenced blobs: {e}")
+
+# Disk cache of image thumbnails rendered in background processes
+thumbnail_cache = ThumbnailCache(UPLOAD_FOLDER)
+
+# Block signatures served to delta uploaders, so a stored file is only
+# re-read and hashed after it changes
+delta_signatures = SignatureCache()
+
+# Persistent listing catalog mirrored in memory, reconciled against the
+# folder on startup and kept current by the watcher afterwards
+catalog = MemoryCatalog(FileCatalog(UPLOAD_FOLDER, get_file_type), TrigramIndex())
+file_watcher = FolderWatcher(UPLOAD_FOLDER, catalog)
+
+# Tails the catalog's change journal for /api/events and /api/changes
+# subscribers, keeps the journal compacted and replays other workers'
+# changes into the in-memory catalog. Created before the catalog is loaded
+# so nothing written in between is missed.
+try:
+    catalog.store.compact_changes()
+except Exception as e:
+    app.logger.error(f"Error compacting change log: {e}")
+change_feed = ChangeFeed(catalog.store, apply=catalog.apply_changes)
+catalog.listeners.append(change_feed.wake)
+
+try:
+    if chunk_store is not None:
+        catalog.reconcile(chunk_store.listing())
+        chunk_store.compact()
+        app.logger.info(f"Chunk storage: {chunk_store.stats()}")
+    else:
+        catalog.reconcile()
+except Exception as e:
+    app.logger.error(f"Error reconciling file catalog: {e}")
+if chunk_store is None:
+    # Chunk storage is only changed through the app; other workers' writes
+    # reach this one through the change feed
+    file_watcher.start()
+change_feed.start()
+
 
 @app.route('/')
 def index():
     """Main page showing server info and QR code"""
-    global SERVER_URL, SERVER_PASSWORD
-    if not SERVER_PASSWORD:
-        SERVER_PASSWORD = generate_password()
-    if not SERVER_URL:
-        SERVER_URL = get_server_url()
+    if not SERVER_PASSWORD or not SERVER_URL:
+        initialize_server()
     
     network_ips = get_all_network_ips()
     return render_template('index.html', 
@@ -228,9 +372,21 @@ def index():
 @app.route('/qr')
 def qr_code():
     """Generate and serve QR code"""
+    if not SERVER_URL or not SERVER_PASSWORD:
+        abort(404)
+    
+    # The image only depends on the URL and password it encodes
+    etag = hashlib.sha256(f"{SERVER_URL}\n{SERVER_PASSWORD}".encode('utf-8')).hexdigest()[:32]
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+    
     qr_img = generate_qr_code()
     if qr_img:
-        return send_file(qr_img, mimetype='image/png')
+        response = send_file(qr_img, mimetype='image/png')
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return set_validators(response, etag)
     else:
         abort(404)
 
@@ -239,13 +395,21 @@ def qr_code():
 def login():
     """Login page for password protection"""
     if request.method == 'POST':
-        password = request.form.get('password')
-        if password == SERVER_PASSWORD:
+        # Only failed attempts count, so logging in never uses up the budget
+        attempts_key = f"login:{request.remote_addr}"
+        if server_state.count(attempts_key, LOGIN_ATTEMPT_WINDOW) >= LOGIN_ATTEMPT_LIMIT:
+            app.logger.warning(f"Login rate limit reached for {request.remote_addr}")
+            flash('Too many login attempts. Please wait a few minutes.', 'error')
+            return render_template('login.html'), 429
+        
+        password = request.form.get('password') or ''
+        if check_password_hash(SERVER_PASSWORD_HASH, password):
             session['authenticated'] = True
             session['login_time'] = datetime.now().timestamp()
             flash('Successfully authenticated!', 'success')
             return redirect(url_for('files'))
         else:
+            server_state.hit(attempts_key, LOGIN_ATTEMPT_WINDOW, LOGIN_ATTEMPT_LIMIT)
             flash('Invalid password. Please try again.', 'error')
     
     return render_template('login.html')
@@ -281,85 +445,244 @@ def login_required(f):
     return decorated_function
 
 
+def has_thumbnail(filename):
+    """Whether the file browser shows a rendered thumbnail for a file"""
+    # Thumbnails render from a plain file on disk
+    return chunk_store is None and is_thumbnailable(filename)
+
+
+def listing_entry(entry):
+    """Template values for one catalog row in the file browser"""
+    file_info = {
+        'name': entry['name'],
+        'size': format_file_size(entry['size']),
+        'size_bytes': entry['size'],
+        'modified': datetime.fromtimestamp(entry['mtime']).strftime('%Y-%m-%d %H:%M:%S'),
+        'type': entry['type']
+    }
+    if has_thumbnail(entry['name']):
+        file_info['thumb_key'] = entry['hash'][:32] if entry['hash'] else None
+    return file_info
+
+
 @app.route('/files')
 @login_required
 def files():
     """File browser page"""
     files_list = []
+    stats = {'total': 0, 'media': 0, 'image': 0, 'other': 0}
+    sort = request.args.get('sort', 'name')
+    descending = request.args.get('order') == 'desc'
+    page = max(request.args.get('page', 1, type=int), 1)
+    pages = 1
+    
+    # Pending flash messages are only rendered by a full response
+    etag = f"{LISTING_TEMPLATE_VERSION}-{catalog.version()}-{sort}-{int(descending)}-{page}"
+    if '_flashes' not in session:
+        cached = not_modified(etag, weak=True)
+        if cached is not None:
+            return cached
     
     try:
-        for filename in os.listdir(UPLOAD_FOLDER):
-            if filename.startswith('.'):
-                continue
-                
-            file_path = os.path.join(UPLOAD_FOLDER, filename)
-            if os.path.isfile(file_path):
-                file_stats = os.stat(file_path)
-                files_list.append({
-                    'name': filename,
-                    'size': format_file_size(file_stats.st_size),
-                    'size_bytes': file_stats.st_size,
-                    'modified': datetime.fromtimestamp(file_stats.st_mtime).strftime('%Y-%m-%d %H:%M:%S'),
-                    'type': get_file_type(filename)
-                })
+        for entry in catalog.list_files(sort, descending, LIST_PAGE_SIZE, (page - 1) * LIST_PAGE_SIZE):
+            files_list.append(listing_entry(entry))
         
-        # Sort by name
-        files_list.sort(key=lambda x: x['name'].lower())
+        type_counts = catalog.type_counts()
+        stats['total'] = sum(type_counts.values())
+        stats['media'] = type_counts.get('video', 0) + type_counts.get('audio', 0)
+        stats['image'] = type_counts.get('image', 0)
+        stats['other'] = type_counts.get('other', 0)
+        pages = max((stats['total'] + LIST_PAGE_SIZE - 1) // LIST_PAGE_SIZE, 1)
         
     except Exception as e:
         app.logger.error(f"Error listing files: {e}")
         flash('Error accessing files directory.', 'error')
     
-    return render_template('files.html', files=files_list)
+    response = make_response(render_template('files.html', files=files_list, stats=stats,
+                                             sort=sort, descending=descending, page=page, pages=pages))
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return set_validators(response, etag, weak=True)
+
+
+def unique_upload_path(filename):
+    """Reserve a (filename, path) pair in the upload folder that is not taken yet
+    
+    The reservation is shared by all workers so two concurrent uploads of the
+    same name cannot pick the same target; release it with
+    server_state.release_name() once the file is in place.
+    """
+    name, ext = os.path.splitext(filename)
+    candidate = filename
+    attempt = 0
+    while True:
+        file_path = os.path.join(app.config['UPLOAD_FOLDER'], candidate)
+        if (not os.path.exists(file_path) and not catalog.exists(candidate)
+                and server_state.reserve_name(candidate)):
+            return candidate, file_path
+        # Add timestamp to filename to avoid conflicts
+        attempt += 1
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        candidate = f"{name}_{timestamp}{ext}" if attempt == 1 else f"{name}_{timestamp}_{attempt}{ext}"
+
+
+def queue_thumbnail(filename, content_hash=None):
+    """Render an image's thumbnail in the background so the listing finds it ready"""
+    if not has_thumbnail(filename):
+        return
+    try:
+        file_path = os.path.join(UPLOAD_FOLDER, filename)
+        key = thumbnail_cache.key_for(os.stat(file_path), content_hash)
+        thumbnail_cache.schedule(file_path, key)
+    except Exception as e:
+        app.logger.error(f"Error scheduling thumbnail: {e}")
+
+
+def store_upload(temp_path, filename, file_path, content_hash=None):
+    """Move a fully received temp file into storage as ``filename``
+
+    ``file_path`` is its place in the upload folder; with chunk storage the
+    content goes into the chunk store instead and the temp file is removed.
+    """
+    if chunk_store is not None:
+        try:
+            new_bytes = chunk_store.put(filename, temp_path, content_hash)
+        finally:
+            os.remove(temp_path)
+        stats = chunk_store.stat(filename)
+        catalog.upsert(filename, stats.st_size, stats.st_mtime, content_hash)
+        app.logger.info(f"Stored {filename} in the chunk store ({format_file_size(new_bytes)} new)")
+        return
+    entry = catalog.get(filename)
+    # A file being replaced gives up its reference to its blob
+    old_hash = blob_store.linked_digest(file_path, entry and entry['hash'])
+    os.replace(temp_path, file_path)
+    if blob_store.store(file_path, content_hash):
+        app.logger.info(f"Stored {filename} as a link to existing content")
+    catalog.add_path(filename, content_hash)
+    blob_store.release(old_hash)
+    queue_thumbnail(filename, content_hash)
+
+
+def stored_stat(filename):
+    """Size, mtime and (in chunk storage) hash of a stored file"""
+    if chunk_store is not None:
+        return chunk_store.stat(filename)
+    return os.stat(os.path.join(UPLOAD_FOLDER, filename))
+
+
+def open_stored(filename, offset=0, length=None):
+    """Readable byte window of a stored file"""
+    if chunk_store is not None:
+        return chunk_store.open_window(filename, offset, length)
+    return TransferBody(os.path.join(UPLOAD_FOLDER, filename), offset, length)
+
+
+def stored_file_response(filename, mime_type):
+    """Range-aware response for a stored file, from whichever backend holds it"""
+    if chunk_store is not None:
+        stats = chunk_store.stat(filename)
+        return ranged_file_response(filename, mime_type, stats, stats.hash, open_body=chunk_store.open_window)
+    file_path = os.path.join(UPLOAD_FOLDER, filename)
+    file_stats = os.stat(file_path)
+    return ranged_file_response(file_path, mime_type, file_stats, catalog.content_hash(filename, file_stats))
 
 
 @app.route('/upload', methods=['POST'])
 @login_required
 def upload_file():
-    """Handle file uploads"""
-    if 'file' not in request.files:
+    """Handle file uploads
+    
+    The multipart body is parsed straight off the request stream into a temp
+    file in the upload folder instead of going through request.files, which
+    would spool it to the system temp dir and copy it again on save.
+    """
+    boundary = request.mimetype_params.get('boundary')
+    if request.mimetype != 'multipart/form-data' or not boundary:
         flash('No file selected.', 'error')
         return redirect(url_for('files'))
     
-    file = request.files['file']
-    if file.filename == '':
-        flash('No file selected.', 'error')
+    try:
+        ingested = ingest_multipart(request.stream, boundary, app.config['UPLOAD_FOLDER'],
+                                    accept=allowed_file)
+    except IngestError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('files'))
+    except HTTPException:
+        # Too large or a dropped client: left to the error handlers
+        raise
+    except Exception as e:
+        app.logger.error(f"Error receiving file: {e}")
+        flash('Error uploading file. Please try again.', 'error')
         return redirect(url_for('files'))
     
-    if file and file.filename and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        
-        # Check if file already exists
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        if os.path.exists(file_path):
-            # Add timestamp to filename to avoid conflicts
-            name, ext = os.path.splitext(filename)
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"{name}_{timestamp}{ext}"
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        
-        try:
-            file.save(file_path)
-            flash(f'File "{filename}" uploaded successfully!', 'success')
-        except Exception as e:
-            app.logger.error(f"Error saving file: {e}")
-            flash('Error uploading file. Please try again.', 'error')
-    else:
-        flash('File type not allowed.', 'error')
+    filename, file_path = unique_upload_path(secure_filename(ingested.filename))
+    
+    try:
+        store_upload(ingested.temp_path, filename, file_path, ingested.sha256)
+        flash(f'File "{filename}" uploaded successfully!', 'success')
+    except Exception as e:
+        ingested.discard()
+        app.logger.error(f"Error saving file: {e}")
+        flash('Error uploading file. Please try again.', 'error')
+    finally:
+        server_state.release_name(filename)
     
     return redirect(url_for('files'))
 
 
+@app.route('/thumb/<filename>')
+@login_required
+def thumbnail(filename):
+    """Serve an image thumbnail
+    
+    Listing links carry the cache key as ``v``, so those URLs change with the
+    content and can be cached by the browser for good.
+    """
+    filename = secure_filename(filename)
+    file_path = os.path.join(UPLOAD_FOLDER, filename)
+    if not has_thumbnail(filename) or not catalog.exists(filename):
+        abort(404)
+    
+    file_stats = os.stat(file_path)
+    key = thumbnail_cache.key_for(file_stats, catalog.content_hash(filename, file_stats))
+    cached = not_modified(key)
+    if cached is not None:
+        return cached
+    
+    thumb_path = thumbnail_cache.get(file_path, key)
+    if thumb_path is None:
+        abort(404)
+    
+    response = send_file(thumb_path, mimetype=thumbnail_cache.mimetype, etag=False, conditional=False)
+    if request.args.get('v') == key:
+        response.cache_control.private = True
+        response.cache_control.no_cache = None
+        response.cache_control.max_age = 31536000
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    return set_validators(response, key)
+
+
 @app.route('/download/<filename>')
 @login_required
 def download_file(filename):
     """Download a file"""
     try:
-        file_path = os.path.join(UPLOAD_FOLDER, secure_filename(filename))
-        if not os.path.exists(file_path):
+        if not catalog.exists(secure_filename(filename)):
             abort(404)
         
-        return send_file(file_path, as_attachment=True, download_name=filename)
+        mime_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = stored_file_response(secure_filename(filename), mime_type)
+        response.headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(filename)}"
+        return response
+    except HTTPException:
+        raise
+    except FileNotFoundError:
+        # Deleted after the catalog lookup
+        abort(404)
     except Exception as e:
         app.logger.error(f"Error downloading file: {e}")
         abort(500)
@@ -370,44 +693,13 @@ def download_file(filename):
 def stream_file(filename):
     """Stream media files with range support"""
     try:
-        file_path = os.path.join(UPLOAD_FOLDER, secure_filename(filename))
-        if not os.path.exists(file_path):
+        if not catalog.exists(secure_filename(filename)):
             abort(404)
         
         file_type = get_file_type(filename)
         if file_type not in ['video', 'audio']:
             return download_file(filename)
         
-        # Handle range requests for media streaming
-        range_header = request.headers.get('Range', None)
-        byte_start = 0
-        byte_end = None
-        
-        file_size = os.path.getsize(file_path)
-        
-        if range_header:
-            match = range_header.replace('bytes=', '').split('-')
-            byte_start = int(match[0])
-            if match[1]:
-                byte_end = int(match[1])
-        
-        if byte_end is None:
-            byte_end = file_size - 1
-        
-        content_length = byte_end - byte_start + 1
-        
-        def generate():
-            with open(file_path, 'rb') as f:
-                f.seek(byte_start)
-                remaining = content_length
-                while remaining:
-                    chunk_size = min(1024 * 1024, remaining)  # 1MB chunks
-                    chunk = f.read(chunk_size)
-                    if not chunk:
-                        break
-                    remaining -= len(chunk)
-                    yield chunk
-        
         # Determine MIME type
         mime_type = 'application/octet-stream'
         if file_type == 'video':
@@ -427,48 +719,561 @@ def stream_file(filename):
             elif ext == 'ogg':
                 mime_type = 'audio/ogg'
         
-        response = app.response_class(
-            generate(),
-            206 if range_header else 200,
-            mimetype=mime_type,
-            direct_passthrough=True
-        )
-        
-        response.headers.add('Accept-Ranges', 'bytes')
-        response.headers.add('Content-Length', str(content_length))
-        
-        if range_header:
-            response.headers.add('Content-Range', f'bytes {byte_start}-{byte_end}/{file_size}')
-        
-        return response
+        return stored_file_response(secure_filename(filename), mime_type)
         
+    except HTTPException:
+        raise
+    except FileNotFoundError:
+        # Deleted after the catalog lookup
+        abort(404)
     except Exception as e:
         app.logger.error(f"Error streaming file: {e}")
         abort(500)
 
 
+@app.route('/export', methods=['GET', 'POST'])
+@login_required
+def export_files():
+    """Download several files as one archive
+    
+    ``files`` (repeatable) selects the files, or the whole folder when it is
+    absent; ``format`` is ``zip`` (store mode) or ``tar``. The archive is
+    generated while it is sent, with its exact length known up front.
+    """
+    archive_format = request.values.get('format', 'zip')
+    if archive_format not in ARCHIVE_FORMATS:
+        abort(400)
+    
+    names = [secure_filename(name) for name in request.values.getlist('files')]
+    if not names:
+        names = [entry['name'] for entry in catalog.list_files()]
+    
+    names = [name for name in names if name]
+    entries = chunk_store.plan_entries(names) if chunk_store is not None else plan_entries(UPLOAD_FOLDER, names)
+    if not entries:
+        flash('No files selected for download.', 'error')
+        return redirect(url_for('files'))
+    
+    stream = ARCHIVE_FORMATS[archive_format](entries)
+    archive_name = f"files_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{stream.extension}"
+    
+    response = app.response_class(stream, mimetype=stream.mimetype, direct_passthrough=True)
+    response.headers['Content-Length'] = str(stream.length)
+    response.headers['Content-Disposition'] = f'attachment; filename="{archive_name}"'
+    app.logger.info(f"Exporting {len(entries)} files as {archive_name} ({format_file_size(stream.length)})")
+    return response
+
+
+def delete_stored(filename):
+    """Delete a file from its backend and the catalog; False if it was not stored"""
+    if chunk_store is not None:
+        found = chunk_store.remove(filename)
+        catalog.remove(filename)
+        return found
+    file_path = os.path.join(UPLOAD_FOLDER, filename)
+    entry = catalog.get(filename)
+    old_hash = blob_store.linked_digest(file_path, entry and entry['hash'])
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        catalog.remove(filename)
+        return False
+    catalog.remove(filename)
+    blob_store.release(old_hash)
+    return True
+
+
 @app.route('/delete/<filename>', methods=['POST'])
 @login_required
 def delete_file(filename):
-    """Delete a file"""
+    """Delete a file
+    
+    Script clients asking for JSON get a status body instead of a redirect;
+    the listing itself is patched from the /api/events feed.
+    """
+    wants_json = request.accept_mimetypes.best == 'application/json'
     try:
-        file_path = os.path.join(UPLOAD_FOLDER, secure_filename(filename))
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            flash(f'File "{filename}" deleted successfully!', 'success')
+        if delete_stored(secure_filename(filename)):
+            message, category, status = f'File "{filename}" deleted successfully!', 'success', 200
         else:
-            flash('File not found.', 'error')
+            message, category, status = 'File not found.', 'error', 404
     except Exception as e:
         app.logger.error(f"Error deleting file: {e}")
-        flash('Error deleting file.', 'error')
+        message, category, status = 'Error deleting file.', 'error', 500
     
+    if wants_json:
+        return compact_json({'message': message}, status)
+    flash(message, category)
     return redirect(url_for('files'))
 
 
+@app.route('/files/card/<filename>')
+@login_required
+def file_card(filename):
+    """Render one file browser card, used to patch the listing after a change event"""
+    entry = catalog.get(secure_filename(filename))
+    if entry is None:
+        abort(404)
+    render_card = get_template_attribute('file_card.html', 'file_card')
+    return render_card(listing_entry(entry))
+
+
+@app.route('/api/events')
+@login_required
+def api_events():
+    """Server-Sent Events stream of file changes
+    
+    Each ``change`` event carries ``op`` (add/modify/remove), ``name``,
+    ``type`` and for additions ``size`` and ``mtime``; its id is the change
+    sequence number. Reconnecting clients resume from Last-Event-ID (or
+    ``since``); a ``reset`` event means that point is gone and the client
+    should reload its listing. Comment lines are sent as heartbeats.
+    """
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        last_id = int(last_id) if last_id else change_feed.latest()
+    except ValueError:
+        return compact_json({'error': 'Invalid event id'}, 400)
+    
+    response = app.response_class(EventStream(change_feed, last_id), mimetype='text/event-stream',
+                                  direct_passthrough=True)
+    response.cache_control.no_cache = True
+    # Stops nginx-style proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@app.route('/api/changes')
+@login_required
+def api_changes():
+    """Changes since a cursor, for clients that mirror the folder
+
+    ``since`` is the ``next`` value of the previous batch (0 the first time)
+    and ``limit`` caps the batch. Each entry is the latest state of a name:
+    ``add`` and ``modify`` carry size, mtime and hash when known, ``remove``
+    means the file is gone. ``more`` says another batch is waiting. When
+    ``reset`` is true the cursor is older than the compacted journal: fetch
+    the full listing, then continue from ``next``.
+    """
+    since = request.args.get('since', 0, type=int)
+    limit = min(max(request.args.get('limit', API_PAGE_SIZE, type=int), 1), API_MAX_PAGE_SIZE)
+    
+    # Taken first so a client resetting from it cannot miss later changes
+    latest = catalog.store.latest_change()
+    rows = change_feed.changes_after(since, limit)
+    if rows is None:
+        changes, next_seq, reset = [], latest, True
+    else:
+        changes = [[row['seq'], row['op'], row['name'], row['size'],
+                    int(row['mtime']) if row['mtime'] is not None else None, row['type'], row['hash']]
+                   for row in rows]
+        next_seq, reset = rows[-1]['seq'] if rows else max(since, 0), False
+    response = compact_json({
+        'fields': ['seq', 'op', 'name', 'size', 'mtime', 'type', 'hash'],
+        'changes': changes,
+        'next': next_seq,
+        'more': len(changes) == limit,
+        'reset': reset
+    })
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+@app.route('/api/storage')
+@login_required
+def api_storage():
+    """Storage backend in use; the chunk store adds its dedup totals"""
+    if chunk_store is not None:
+        return compact_json({'backend': 'chunks', **chunk_store.stats()})
+    return compact_json({'backend': 'files', 'dedup': blob_store.enabled, 'files': catalog.count()})
+
+
+@app.route('/api/files')
+@login_required
+def api_files():
+    """Paginated JSON file listing
+
+    Query parameters: ``sort`` (name/size/mtime/type), ``order`` (asc/desc),
+    ``type`` (comma separated file types), ``limit`` and ``cursor`` (the
+    ``next`` value of the previous page). Rows are positional arrays in the
+    order given by ``fields`` to keep large pages small.
+    """
+    sort = request.args.get('sort', 'name')
+    if sort not in ('name', 'size', 'mtime', 'type'):
+        return compact_json({'error': 'Invalid sort key'}, 400)
+    descending = request.args.get('order', 'asc') == 'desc'
+    limit = min(max(request.args.get('limit', API_PAGE_SIZE, type=int), 1), API_MAX_PAGE_SIZE)
+    
+    types = None
+    if request.args.get('type'):
+        types = [t for t in request.args['type'].split(',') if t]
+        if any(t not in FILE_TYPES for t in types):
+            return compact_json({'error': 'Invalid file type'}, 400)
+    
+    after = None
+    cursor = request.args.get('cursor')
+    if cursor:
+        after = decode_cursor(cursor, sort)
+        if after is None:
+            return compact_json({'error': 'Invalid cursor'}, 400)
+    
+    query_key = hashlib.sha256(request.query_string).hexdigest()[:16]
+    etag = f"{catalog.version()}-{query_key}"
+    cached = not_modified(etag, weak=True)
+    if cached is not None:
+        return cached
+    
+    rows, next_key = catalog.page(sort, descending, limit, after, types)
+    response = compact_json({
+        'fields': ['name', 'size', 'mtime', 'type'],
+        'files': [[row['name'], row['size'], int(row['mtime']), row['type']] for row in rows],
+        'total': catalog.count(types),
+        'next': encode_cursor(next_key) if next_key else None
+    })
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return set_validators(response, etag, weak=True)
+
+
+@app.route('/api/search')
+@login_required
+def api_search():
+    """Ranked filename search
+
+    ``q`` holds words that must all appear in the name, plus optional
+    ``ext:pdf`` / ``*.pdf`` extension filters. Exact names rank first, then
+    prefixes, word starts and plain substrings. Paginate with ``limit`` and
+    ``offset`` (the ``next`` value of the previous page).
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return compact_json({'error': 'Missing query'}, 400)
+    limit = min(max(request.args.get('limit', API_PAGE_SIZE, type=int), 1), API_MAX_PAGE_SIZE)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    
+    query_key = hashlib.sha256(request.query_string).hexdigest()[:16]
+    etag = f"{catalog.version()}-search-{query_key}"
+    cached = not_modified(etag, weak=True)
+    if cached is not None:
+        return cached
+    
+    names, total = catalog.index.search(query, limit, offset)
+    rows = [row for row in map(catalog.get, names) if row]
+    response = compact_json({
+        'fields': ['name', 'size', 'mtime', 'type'],
+        'files': [[row['name'], row['size'], int(row['mtime']), row['type']] for row in rows],
+        'total': total,
+        'next': offset + limit if offset + limit < total else None
+    })
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return set_validators(response, etag, weak=True)
+
+
+def upload_session_info(journal):
+    """Public view of an upload session journal"""
+    return {
+        'id': journal['id'],
+        'filename': journal['filename'],
+        'size': journal['size'],
+        'block_size': journal['block_size'],
+        'received': journal['received'],
+        'complete': upload_sessions.is_complete(journal)
+    }
+
+
+@app.route('/api/uploads', methods=['POST'])
+@login_required
+def api_create_upload():
+    """Start a resumable upload: JSON body with ``filename`` and ``size``
+
+    The file is preallocated on disk. Its chunks may then be sent in any
+    order and over several connections at once; the response gives the
+    ``block_size`` every chunk has to be aligned to.
+    """
+    payload = request.get_json(silent=True) or {}
+    filename = secure_filename(str(payload.get('filename', '')))
+    size = payload.get('size')
+    
+    if not filename or not allowed_file(filename):
+        return compact_json({'error': 'File type not allowed'}, 400)
+    if not isinstance(size, int) or size < 0:
+        return compact_json({'error': 'Invalid file size'}, 400)
+    
+    free_space = get_free_disk_space(UPLOAD_FOLDER)
+    if free_space is not None and size > free_space:
+        return compact_json({'error': 'Not enough disk space'}, 507)
+    
+    try:
+        journal = upload_sessions.create(filename, size)
+    except UploadSessionError as e:
+        return compact_json({'error': str(e)}, e.status)
+    except OSError as e:
+        app.logger.error(f"Error creating upload session: {e}")
+        return compact_json({'error': 'Error creating upload'}, 500)
+    return compact_json(upload_session_info(journal), 201)
+
+
+@app.route('/api/uploads/<session_id>', methods=['GET'])
+@login_required
+def api_upload_status(session_id):
+    """Report which byte ranges of an upload have been received"""
+    try:
+        return compact_json(upload_session_info(upload_sessions.get(session_id)))
+    except UploadSessionError as e:
+        return compact_json({'error': str(e)}, e.status)
+
+
+@app.route('/api/uploads/<session_id>', methods=['PUT'])
+@login_required
+def api_upload_chunk(session_id):
+    """Store one chunk of an upload
+
+    The chunk position comes from ``Content-Range: bytes start-end/size`` or
+    an ``offset`` query parameter; the body is the raw chunk bytes. A chunk
+    starts on a multiple of the session's ``block_size`` and covers whole
+    blocks (the last one may be short). Chunks of one upload can be sent
+    concurrently; each is written in place with positional writes.
+    """
+    length = request.content_length
+    if length is None:
+        return compact_json({'error': 'Content-Length required'}, 411)
+    
+    offset = request.args.get('offset', type=int)
+    content_range = request.headers.get('Content-Range')
+    if content_range:
+        try:
+            unit, _, spec = content_range.partition(' ')
+            span = spec.split('/')[0]
+            start, end = (int(value) for value in span.split('-'))
+        except ValueError:
+            return compact_json({'error': 'Invalid Content-Range'}, 400)
+        if unit != 'bytes' or end - start + 1 != length:
+            return compact_json({'error': 'Content-Range does not match body'}, 400)
+        offset = start
+    if offset is None:
+        return compact_json({'error': 'Chunk offset required'}, 400)
+    
+    try:
+        journal = upload_sessions.write_chunk(session_id, offset, request.stream, length)
+    except UploadSessionError as e:
+        return compact_json({'error': str(e)}, e.status)
+    except OSError as e:
+        app.logger.error(f"Error writing upload chunk: {e}")
+        return compact_json({'error': 'Error writing chunk'}, 500)
+    
+    return compact_json(upload_session_info(journal))
+
+
+@app.route('/api/uploads/<session_id>/commit', methods=['POST'])
+@login_required
+def api_commit_upload(session_id):
+    """Finish a complete upload and move it into the upload folder"""
+    try:
+        journal = upload_sessions.get(session_id)
+        filename, file_path = unique_upload_path(journal['filename'])
+    except UploadSessionError as e:
+        return compact_json({'error': str(e)}, e.status)
+    
+    try:
+        temp_path = os.path.join(UPLOAD_FOLDER, f"{TEMP_PREFIX}{secrets.token_hex(8)}")
+        upload_sessions.commit(session_id, temp_path)
+        # Chunks may arrive in any order, so the content is hashed once complete
+        content_hash = file_sha256(temp_path) if blob_store.enabled or chunk_store is not None else None
+        store_upload(temp_path, filename, file_path, content_hash)
+    except UploadSessionError as e:
+        return compact_json({'error': str(e)}, e.status)
+    except OSError as e:
+        app.logger.error(f"Error committing upload: {e}")
+        return compact_json({'error': 'Error saving file'}, 500)
+    finally:
+        server_state.release_name(filename)
+    
+    app.logger.info(f"Resumable upload committed: {filename}")
+    return compact_json({'name': filename, 'size': journal['size']})
+
+
+@app.route('/api/uploads/by-hash', methods=['POST'])
+@login_required
+def api_upload_by_hash():
+    """Store a file whose content the server already has, without its bytes
+
+    JSON body with ``filename``, ``size`` and ``sha256`` (hex). When a file
+    with that digest and size is stored, the new name is created from it on
+    the server and 201 returned with the stored ``name``; 404 means the
+    content is unknown and the file has to be uploaded as usual.
+    """
+    payload = request.get_json(silent=True) or {}
+    filename = secure_filename(str(payload.get('filename', '')))
+    size = payload.get('size')
+    digest = str(payload.get('sha256', '')).lower()
+    
+    if not filename or not allowed_file(filename):
+        return compact_json({'error': 'File type not allowed'}, 400)
+    if not isinstance(size, int) or size < 0:
+        return compact_json({'error': 'Invalid file size'}, 400)
+    if len(digest) != 64 or any(c not in '0123456789abcdef' for c in digest):
+        return compact_json({'error': 'Invalid SHA-256 digest'}, 400)
+    
+    if chunk_store is not None:
+        source = chunk_store.find_hash(digest, size)
+    elif blob_store.has(digest, size):
+        source = blob_store.blob_path(digest)
+    else:
+        source = catalog.find_hash(digest, size)
+    if source is None:
+        return compact_json({'stored': False}, 404)
+    if not blob_store.enabled and chunk_store is None:
+        free_space = get_free_disk_space(UPLOAD_FOLDER)
+        if free_space is not None and size > free_space:
+            return compact_json({'error': 'Not enough disk space'}, 507)
+    
+    filename, file_path = unique_upload_path(filename)
+    try:
+        if chunk_store is not None:
+            # A new chunk list pointing at the same chunks
+            if not chunk_store.copy(source, filename):
+                raise FileNotFoundError(source)
+            stats = chunk_store.stat(filename)
+            catalog.upsert(filename, stats.st_size, stats.st_mtime, digest)
+        else:
+            if blob_store.enabled and not blob_store.has(digest, size):
+                # Stored before dedup was switched on; make it the blob now
+                blob_store.store(source, digest)
+            if not blob_store.link(digest, file_path):
+                # Copied on the server: the bytes still skip the network
+                temp_path = os.path.join(UPLOAD_FOLDER, f"{TEMP_PREFIX}{secrets.token_hex(8)}")
+                try:
+                    shutil.copyfile(source, temp_path)
+                    os.replace(temp_path, file_path)
+                except OSError:
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+                    raise
+            catalog.add_path(filename, digest)
+            queue_thumbnail(filename, digest)
+    except OSError as e:
+        app.logger.error(f"Error storing known content: {e}")
+        return compact_json({'error': 'Error saving file'}, 500)
+    finally:
+        server_state.release_name(filename)
+    
+    app.logger.info(f"Stored {filename} from existing content without an upload")
+    return compact_json({'name': filename, 'size': size, 'stored': True}, 201)
+
+
+def signature_key(filename):
+    """Identifies the stored version of a file for the signature cache"""
+    stats = stored_stat(filename)
+    content_hash = stats.hash if chunk_store is not None else catalog.content_hash(filename, stats)
+    if content_hash:
+        return content_hash
+    if chunk_store is not None:
+        return f"{filename}-{stats.st_size:x}-{stats.st_mtime!r}"
+    return f"{stats.st_ino:x}-{stats.st_size:x}-{stats.st_mtime_ns:x}"
+
+
+@app.route('/api/delta/<filename>', methods=['GET'])
+@login_required
+def api_delta_signature(filename):
+    """Block signature of a stored file, the base for a delta upload
+
+    ``weak`` (Adler-32) and ``strong`` (BLAKE2b) list the checksums of each
+    ``block_size`` block; ``sha256`` identifies this version of the file.
+    """
+    filename = secure_filename(filename)
+    if not catalog.exists(filename):
+        return compact_json({'error': 'File not found'}, 404)
+    try:
+        key = signature_key(filename)
+        signature = delta_signatures.get(key)
+        if signature is None:
+            size = stored_stat(filename).st_size
+            body = open_stored(filename, 0, size)
+            try:
+                signature = file_signature(body, size)
+            finally:
+                body.close()
+            # Only kept when the file did not change while it was read
+            if signature_key(filename) == key:
+                delta_signatures.put(key, signature)
+    except FileNotFoundError:
+        return compact_json({'error': 'File not found'}, 404)
+    
+    response = compact_json({'name': filename, **signature})
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+@app.route('/api/delta/<filename>', methods=['PUT'])
+@login_required
+def api_delta_upload(filename):
+    """Replace a stored file with a new version sent as a delta
+
+    The body is a delta stream (see delta.py) built against the signature
+    from GET /api/delta/<filename>. ``X-Delta-Block-Size`` is that
+    signature's block size, ``X-Delta-Base`` its ``sha256`` and
+    ``X-Content-SHA256`` the digest of the new version. The file is rebuilt
+    into a temp file and swapped in only when the digest matches; 409 means
+    the stored file changed since the signature was taken.
+    """
+    filename = secure_filename(filename)
+    block_size = request.headers.get('X-Delta-Block-Size', type=int)
+    base_hash = request.headers.get('X-Delta-Base', '').lower()
+    expected_hash = request.headers.get('X-Content-SHA256', '').lower()
+    if not block_size or not expected_hash:
+        return compact_json({'error': 'Block size and content digest required'}, 400)
+    if not catalog.exists(filename):
+        return compact_json({'error': 'File not found'}, 404)
+    
+    try:
+        stats = stored_stat(filename)
+    except FileNotFoundError:
+        return compact_json({'error': 'File not found'}, 404)
+    old_hash = stats.hash if chunk_store is not None else catalog.content_hash(filename, stats)
+    if base_hash and old_hash and base_hash != old_hash:
+        return compact_json({'error': 'File changed since its signature was taken'}, 409)
+    
+    temp_path = os.path.join(UPLOAD_FOLDER, f"{TEMP_PREFIX}{secrets.token_hex(8)}")
+    try:
+        with open(temp_path, 'wb') as out:
+            size, literal_bytes, digest = apply_delta(
+                request.stream, lambda offset, length: open_stored(filename, offset, length),
+                stats.st_size, block_size, out, limit=MAX_FILE_SIZE)
+        if digest != expected_hash:
+            raise DeltaError('Rebuilt file does not match; fetch a new signature', 409)
+        # The temp file replaces the stored one in a single rename
+        store_upload(temp_path, filename, os.path.join(UPLOAD_FOLDER, filename), digest)
+    except DeltaError as e:
+        return compact_json({'error': str(e)}, e.status)
+    except OSError as e:
+        app.logger.error(f"Error applying delta upload: {e}")
+        return compact_json({'error': 'Error saving file'}, 500)
+    finally:
+        # Still here after any failure, a dropped client included
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    app.logger.info(f"Delta upload of {filename}: {format_file_size(literal_bytes)} sent "
+                    f"for {format_file_size(size)}")
+    return compact_json({'name': filename, 'size': size, 'sha256': digest, 'literal_bytes': literal_bytes})
+
+
+@app.route('/api/uploads/<session_id>', methods=['DELETE'])
+@login_required
+def api_abort_upload(session_id):
+    """Cancel an upload and discard its partial data"""
+    try:
+        upload_sessions.abort(session_id)
+    except UploadSessionError as e:
+        return compact_json({'error': str(e)}, e.status)
+    return compact_json({'id': session_id, 'aborted': True})
+
+
 @app.route('/api/server-info')
 def api_server_info():
     """API endpoint to get server information"""
-    global SERVER_URL, SERVER_PASSWORD
     return jsonify({
         'url': SERVER_URL,
         'password': SERVER_PASSWORD,
@@ -510,18 +1315,17 @@ def file_too_large(error):
     return redirect(url_for('files'))
 
 
-if __name__ == '__main__':
-    # Initialize server info
-    if not SERVER_PASSWORD:
-        SERVER_PASSWORD = generate_password()
-    if not SERVER_URL:
-        SERVER_URL = get_server_url()
-    
+def print_startup_banner():
+    """Print the connection details for this server run"""
     print(f"\n🚀 File Server Starting...")
     print(f"📍 Server URL: {SERVER_URL}")
     print(f"🔐 Password: {SERVER_PASSWORD}")
     print(f"📁 Upload Directory: {os.path.abspath(UPLOAD_FOLDER)}")
     print(f"🌐 Access from other devices: {SERVER_URL}")
     print(f"📱 QR Code available at: {SERVER_URL}/qr")
+
+
+if __name__ == '__main__':
+    print_startup_banner()
     
     app.run(host='0.0.0.0', port=SERVER_PORT, debug=True)
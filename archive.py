@@ -0,0 +1,215 @@
+"""
+Streaming archive export
+Builds store-mode ZIP (with ZIP64 where sizes or offsets need it) and tar
+archives on the fly from files on disk. The exact archive size is known
+before the first byte is sent, nothing is written to a temp file and memory
+use is one read buffer regardless of how many files are exported.
+"""
+import os
+import time
+import struct
+import tarfile
+import zlib
+import logging
+
+from transfer import TransferBody, CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP_COUNT_LIMIT = 0xFFFF
+
+# General purpose flags: sizes/CRC follow the data (bit 3), UTF-8 names (bit 11)
+ZIP_FLAGS = 0x0808
+
+TAR_BLOCK = 512
+
+
+class ArchiveEntry:
+    """A file planned into an archive"""
+
+    __slots__ = ('name', 'path', 'size', 'mtime', 'open_body')
+
+    def __init__(self, name, path, size, mtime, open_body=TransferBody):
+        self.name = name
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.open_body = open_body
+
+
+def plan_entries(folder, names):
+    """Stat the named files once and return ArchiveEntry records for those that exist"""
+    entries = []
+    seen = set()
+    for name in names:
+        if name in seen:
+            continue
+        seen.add(name)
+        path = os.path.join(folder, name)
+        try:
+            stats = os.stat(path)
+        except OSError:
+            continue
+        entries.append(ArchiveEntry(name, path, stats.st_size, stats.st_mtime))
+    return entries
+
+
+def _read_entry(entry):
+    """Yield exactly ``entry.size`` bytes of the file or fail loudly
+
+    The archive length was promised up front, so a file that shrank while
+    being exported must abort the response rather than corrupt it.
+    """
+    body = entry.open_body(entry.path, 0, entry.size)
+    try:
+        sent = 0
+        for chunk in body:
+            sent += len(chunk)
+            yield chunk
+        if sent != entry.size:
+            raise IOError(f"{entry.name} changed size during export")
+    finally:
+        body.close()
+
+
+def _dos_datetime(mtime):
+    """Pack a timestamp into the MS-DOS time and date fields"""
+    t = time.localtime(max(mtime, 315532800))  # DOS dates start in 1980
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+
+class ZipStream:
+    """Store-mode ZIP archive generated on the fly"""
+
+    mimetype = 'application/zip'
+    extension = 'zip'
+
+    def __init__(self, entries):
+        self.entries = entries
+        self._layout = []
+        offset = 0
+        for entry in entries:
+            name = entry.name.encode('utf-8')
+            local_zip64 = entry.size >= ZIP64_LIMIT
+            local_size = 30 + len(name) + (20 if local_zip64 else 0)
+            descriptor_size = 24 if local_zip64 else 16
+            self._layout.append((entry, name, offset, local_zip64))
+            offset += local_size + entry.size + descriptor_size
+        self._central_offset = offset
+        self._central_size = sum(46 + len(name) + self._central_extra_size(entry, entry_offset)
+                                 for entry, name, entry_offset, _ in self._layout)
+        self.length = self._central_offset + self._central_size + self._end_size()
+
+    @staticmethod
+    def _central_extra_size(entry, offset):
+        fields = 0
+        if entry.size >= ZIP64_LIMIT:
+            fields += 2
+        if offset >= ZIP64_LIMIT:
+            fields += 1
+        return 4 + 8 * fields if fields else 0
+
+    def _needs_zip64_end(self):
+        return (len(self.entries) >= ZIP_COUNT_LIMIT or self._central_offset >= ZIP64_LIMIT
+                or self._central_size >= ZIP64_LIMIT)
+
+    def _end_size(self):
+        return 22 + (56 + 20 if self._needs_zip64_end() else 0)
+
+    def __iter__(self):
+        records = []
+        for entry, name, offset, local_zip64 in self._layout:
+            dos_time, dos_date = _dos_datetime(entry.mtime)
+            version = 45 if local_zip64 or offset >= ZIP64_LIMIT else 20
+
+            header = struct.pack('<IHHHHHIIIHH', 0x04034b50, version, ZIP_FLAGS, 0, dos_time, dos_date,
+                                 0, ZIP64_LIMIT if local_zip64 else 0, ZIP64_LIMIT if local_zip64 else 0,
+                                 len(name), 20 if local_zip64 else 0)
+            header += name
+            if local_zip64:
+                header += struct.pack('<HHQQ', 0x0001, 16, 0, 0)
+            yield header
+
+            crc = 0
+            for chunk in _read_entry(entry):
+                crc = zlib.crc32(chunk, crc)
+                yield chunk
+
+            if local_zip64:
+                yield struct.pack('<IIQQ', 0x08074b50, crc, entry.size, entry.size)
+            else:
+                yield struct.pack('<IIII', 0x08074b50, crc, entry.size, entry.size)
+            records.append((entry, name, offset, crc, version, dos_time, dos_date))
+
+        central = bytearray()
+        for entry, name, offset, crc, version, dos_time, dos_date in records:
+            extra = b''
+            if entry.size >= ZIP64_LIMIT:
+                extra += struct.pack('<QQ', entry.size, entry.size)
+            if offset >= ZIP64_LIMIT:
+                extra += struct.pack('<Q', offset)
+            if extra:
+                extra = struct.pack('<HH', 0x0001, len(extra)) + extra
+            size_field = ZIP64_LIMIT if entry.size >= ZIP64_LIMIT else entry.size
+            central += struct.pack('<IHHHHHHIIIHHHHHII', 0x02014b50, (3 << 8) | version, version, ZIP_FLAGS,
+                                   0, dos_time, dos_date, crc, size_field, size_field, len(name), len(extra),
+                                   0, 0, 0, 0o100644 << 16, min(offset, ZIP64_LIMIT))
+            central += name + extra
+            if len(central) >= CHUNK_SIZE:
+                yield bytes(central)
+                central.clear()
+
+        count = len(records)
+        end = bytearray(central)
+        if self._needs_zip64_end():
+            zip64_end_offset = self._central_offset + self._central_size
+            end += struct.pack('<IQHHIIQQQQ', 0x06064b50, 44, 45, 45, 0, 0, count, count,
+                               self._central_size, self._central_offset)
+            end += struct.pack('<IIQI', 0x07064b50, 0, zip64_end_offset, 1)
+        end += struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, min(count, ZIP_COUNT_LIMIT), min(count, ZIP_COUNT_LIMIT),
+                           min(self._central_size, ZIP64_LIMIT), min(self._central_offset, ZIP64_LIMIT), 0)
+        yield bytes(end)
+
+
+class TarStream:
+    """POSIX (pax) tar archive generated on the fly"""
+
+    mimetype = 'application/x-tar'
+    extension = 'tar'
+
+    def __init__(self, entries):
+        self.entries = entries
+        self._headers = []
+        length = 0
+        for entry in entries:
+            info = tarfile.TarInfo(entry.name)
+            info.size = entry.size
+            info.mtime = int(entry.mtime)
+            info.mode = 0o644
+            header = info.tobuf(format=tarfile.PAX_FORMAT, encoding='utf-8', errors='surrogateescape')
+            self._headers.append(header)
+            length += len(header) + entry.size + self._padding(entry.size)
+        # End-of-archive marker: two empty blocks
+        self.length = length + 2 * TAR_BLOCK
+
+    @staticmethod
+    def _padding(size):
+        return -size % TAR_BLOCK
+
+    def __iter__(self):
+        for entry, header in zip(self.entries, self._headers):
+            yield header
+            yield from _read_entry(entry)
+            padding = self._padding(entry.size)
+            if padding:
+                yield b'\0' * padding
+        yield b'\0' * (2 * TAR_BLOCK)
+
+
+ARCHIVE_FORMATS = {
+    'zip': ZipStream,
+    'tar': TarStream,
+}
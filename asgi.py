@@ -0,0 +1,298 @@
+"""
+ASGI serving mode
+Runs the Flask app under an asyncio server such as uvicorn. Request handlers
+(login, listings, range parsing, uploads) still run in a thread pool, but as
+soon as a handler returns a file body the transfer continues on the event
+loop: a long download or media stream holds no thread while it runs, and each
+chunk is only read once the client has drained the previous one.
+
+Concurrency target: 1,000 concurrent /stream or /download connections per
+process, with listings still answering while they run. Memory per idle-but-
+open stream is bounded by STREAM_CHUNK plus the server's write buffer.
+Measure with bench_streams.py.
+
+Usage: python asgi.py [--host HOST] [--port PORT] [--workers N]
+"""
+import os
+import sys
+import asyncio
+import argparse
+import secrets
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Threads running Flask handlers; bounds concurrent non-streaming work
+HANDLER_THREADS = int(os.environ.get('ASGI_HANDLER_THREADS', '32'))
+
+# Threads doing the short blocking file reads for streamed bodies
+IO_THREADS = int(os.environ.get('ASGI_IO_THREADS', '8'))
+
+# Bytes read and sent per step of a streamed body
+STREAM_CHUNK = 256 * 1024
+
+
+class AsyncFileWrapper:
+    """``wsgi.file_wrapper`` that marks a body for streaming on the event loop
+
+    Iterating it synchronously still works, so handlers that consume their
+    own response (tests, middleware) are unaffected.
+    """
+
+    transfer_path = 'async'
+
+    def __init__(self, filelike, block_size=STREAM_CHUNK):
+        self.filelike = filelike
+        self.block_size = block_size
+
+    def __iter__(self):
+        while True:
+            chunk = self.filelike.read(self.block_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self):
+        if hasattr(self.filelike, 'close'):
+            self.filelike.close()
+
+
+class ReceiveStream:
+    """Blocking ``wsgi.input`` fed from the ASGI receive channel
+
+    Called from a handler thread; each refill waits on the event loop for the
+    next body message, so a slow upload never buffers more than one message.
+    """
+
+    def __init__(self, receive, loop):
+        self.receive = receive
+        self.loop = loop
+        self.buffer = bytearray()
+        self.more_body = True
+
+    def _fill(self):
+        """Append the next body message to the buffer"""
+        message = asyncio.run_coroutine_threadsafe(self.receive(), self.loop).result()
+        if message['type'] == 'http.disconnect':
+            self.more_body = False
+            return
+        self.buffer += message.get('body', b'')
+        self.more_body = message.get('more_body', False)
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            while self.more_body:
+                self._fill()
+            size = len(self.buffer)
+        while not self.buffer and self.more_body:
+            self._fill()
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def readline(self, size=-1):
+        while b'\n' not in self.buffer and self.more_body and (size < 0 or len(self.buffer) < size):
+            self._fill()
+        end = self.buffer.find(b'\n') + 1 or len(self.buffer)
+        if size >= 0:
+            end = min(end, size)
+        data = bytes(self.buffer[:end])
+        del self.buffer[:end]
+        return data
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                break
+            yield line
+
+
+def build_environ(scope, body):
+    """Translate an ASGI HTTP scope into a WSGI environ"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        'wsgi.file_wrapper': AsyncFileWrapper,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE' or name == 'CONTENT_LENGTH':
+            key = name
+        else:
+            key = f'HTTP_{name}'
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    if 'CONTENT_LENGTH' not in environ:
+        # Chunked bodies end when the stream does
+        environ['wsgi.input_terminated'] = True
+    return environ
+
+
+class ASGIBridge:
+    """ASGI application wrapping a WSGI app"""
+
+    def __init__(self, wsgi_app, handler_threads=HANDLER_THREADS, io_threads=IO_THREADS):
+        self.wsgi_app = wsgi_app
+        self.handlers = ThreadPoolExecutor(max_workers=handler_threads, thread_name_prefix='asgi-handler')
+        self.io = ThreadPoolExecutor(max_workers=io_threads, thread_name_prefix='asgi-io')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.handlers.shutdown(wait=False)
+                self.io.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _call_app(self, environ):
+        """Run the WSGI app in a handler thread; returns status, headers and body"""
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = status
+            started['headers'] = headers
+            return lambda data: None
+
+        app_iter = self.wsgi_app(environ, start_response)
+        first = None
+        if not started:
+            # start_response may legally wait for the first chunk
+            first = next(iter(app_iter), b'')
+        return started['status'], started['headers'], app_iter, first
+
+    async def _http(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        environ = build_environ(scope, ReceiveStream(receive, loop))
+        status, headers, app_iter, first = await loop.run_in_executor(self.handlers, self._call_app, environ)
+
+        disconnected = asyncio.Event()
+
+        async def watch_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            disconnected.set()
+
+        watcher = loop.create_task(watch_disconnect())
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(name.lower().encode('latin-1'), str(value).encode('latin-1'))
+                            for name, value in headers],
+            })
+            if first:
+                await send({'type': 'http.response.body', 'body': first, 'more_body': True})
+
+            if isinstance(app_iter, AsyncFileWrapper):
+                await self._send_file(app_iter.filelike, send, disconnected)
+            elif hasattr(app_iter, '__aiter__'):
+                await self._send_async_iterable(app_iter, send, disconnected)
+            elif isinstance(app_iter, (list, tuple)):
+                for chunk in app_iter:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            else:
+                await self._send_iterable(app_iter, send, disconnected)
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            watcher.cancel()
+            close = getattr(app_iter, 'close', None)
+            if close is not None:
+                await loop.run_in_executor(self.io, close)
+
+    async def _send_file(self, filelike, send, disconnected):
+        """Stream a file body one chunk at a time, reading only after each send drains"""
+        loop = asyncio.get_running_loop()
+        read = filelike.read
+        while not disconnected.is_set():
+            chunk = await loop.run_in_executor(self.io, read, STREAM_CHUNK)
+            if not chunk:
+                break
+            # The server suspends send() while its write buffer is full
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+
+    async def _send_async_iterable(self, app_iter, send, disconnected):
+        """Stream a body that can wait asynchronously (event streams)"""
+        iterator = app_iter.__aiter__()
+        stop = asyncio.ensure_future(disconnected.wait())
+        try:
+            while True:
+                next_chunk = asyncio.ensure_future(iterator.__anext__())
+                await asyncio.wait({next_chunk, stop}, return_when=asyncio.FIRST_COMPLETED)
+                if not next_chunk.done():
+                    # Client went away while the body was waiting
+                    next_chunk.cancel()
+                    await asyncio.gather(next_chunk, return_exceptions=True)
+                    break
+                try:
+                    chunk = next_chunk.result()
+                except StopAsyncIteration:
+                    break
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            stop.cancel()
+            await iterator.aclose()
+
+    async def _send_iterable(self, app_iter, send, disconnected):
+        """Stream a generic iterable (multipart ranges, archives) without holding a thread"""
+        loop = asyncio.get_running_loop()
+        iterator = iter(app_iter)
+        while not disconnected.is_set():
+            chunk = await loop.run_in_executor(self.io, next, iterator, None)
+            if chunk is None:
+                break
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+
+
+def create_app():
+    from app import app as flask_app
+    return ASGIBridge(flask_app)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the file server in ASGI mode')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', '5000')))
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit('ASGI mode needs uvicorn: pip install uvicorn')
+
+    # Workers started by uvicorn share this run's password and secrets
+    os.environ.setdefault('FILESERVER_BOOT_ID', secrets.token_hex(8))
+    uvicorn.run('asgi:create_app', factory=True, host=args.host, port=args.port,
+                workers=args.workers, timeout_keep_alive=30)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Concurrent streaming benchmark
+Opens many simultaneous /stream connections against a running server, reads
+them slowly like media players do, and times /files requests made while they
+are open. Compare a sync WSGI server (e.g. gunicorn) against `python server.py`.
+
+Usage: python bench_streams.py URL PASSWORD FILENAME [--streams N] [--rate KBPS]
+"""
+import time
+import asyncio
+import argparse
+from urllib.parse import urlsplit, quote
+
+
+async def request(host, port, raw):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(raw)
+    await writer.drain()
+    return reader, writer
+
+
+async def read_headers(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    return head.decode('latin-1')
+
+
+async def login(host, port, password):
+    body = f"password={quote(password)}".encode()
+    reader, writer = await request(host, port, (
+        f"POST /login HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/x-www-form-urlencoded\r\n"
+        f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n").encode() + body)
+    head = await read_headers(reader)
+    writer.close()
+    for line in head.split('\r\n'):
+        if line.lower().startswith('set-cookie:'):
+            return line.split(':', 1)[1].split(';', 1)[0].strip()
+    raise SystemExit('Login failed')
+
+
+async def stream(host, port, cookie, path, rate, stop):
+    """Read a stream at ``rate`` bytes per second until told to stop"""
+    reader, writer = await request(host, port, (
+        f"GET {path} HTTP/1.1\r\nHost: {host}\r\nCookie: {cookie}\r\nConnection: close\r\n\r\n").encode())
+    await read_headers(reader)
+    received = 0
+    while not stop.is_set():
+        chunk = await reader.read(rate // 10)
+        if not chunk:
+            break
+        received += len(chunk)
+        await asyncio.sleep(0.1)
+    writer.close()
+    return received
+
+
+async def time_listing(host, port, cookie):
+    started = time.perf_counter()
+    reader, writer = await request(host, port, (
+        f"GET /files HTTP/1.1\r\nHost: {host}\r\nCookie: {cookie}\r\nConnection: close\r\n\r\n").encode())
+    await reader.read()
+    writer.close()
+    return time.perf_counter() - started
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('url')
+    parser.add_argument('password')
+    parser.add_argument('filename')
+    parser.add_argument('--streams', type=int, default=1000)
+    parser.add_argument('--rate', type=int, default=256, help='per-stream read rate in KB/s')
+    parser.add_argument('--duration', type=float, default=10)
+    args = parser.parse_args()
+
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+    cookie = await login(host, port, args.password)
+    path = f"/stream/{quote(args.filename)}"
+
+    stop = asyncio.Event()
+    started = time.perf_counter()
+    streams = [asyncio.create_task(stream(host, port, cookie, path, args.rate * 1024, stop))
+               for _ in range(args.streams)]
+
+    latencies = []
+    while time.perf_counter() - started < args.duration:
+        await asyncio.sleep(1)
+        latencies.append(await time_listing(host, port, cookie))
+    stop.set()
+    results = await asyncio.gather(*streams, return_exceptions=True)
+
+    failed = sum(1 for r in results if isinstance(r, Exception))
+    total = sum(r for r in results if not isinstance(r, Exception))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    print(f"streams: {args.streams} ({failed} failed)")
+    print(f"throughput: {total / elapsed / 1024 / 1024:.1f} MB/s")
+    if latencies:
+        print(f"/files latency: median {latencies[len(latencies) // 2] * 1000:.0f} ms, "
+              f"max {latencies[-1] * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
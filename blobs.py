@@ -0,0 +1,173 @@
+"""
+Content-addressed upload storage
+Optional deduplication mode: every stored file is hard-linked to a blob named
+by its SHA-256 under uploads/.blobs, and a file whose digest is already there
+is replaced by another link to the existing blob instead of keeping a second
+copy. A blob's link count is its reference count, so files deleted by any
+means are accounted for without a separate index.
+
+Linked names share one inode, so they also share its modification time: a
+re-uploaded duplicate lists with the time of the first copy.
+"""
+import os
+import time
+import errno
+import secrets
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+BLOB_DIRNAME = '.blobs'
+
+# Temporary names a new link is made under before it replaces its target
+LINK_PREFIX = '.link-'
+
+# Seconds after which a leftover temporary link is swept; a live one only
+# exists for the moment between link() and the rename
+STALE_LINK_AGE = 60
+
+# Bytes read per step when hashing a file that was not hashed on the way in
+HASH_BLOCK = 1024 * 1024
+
+# Errors meaning the filesystem cannot hard-link at all
+NO_LINK_ERRORS = (errno.EPERM, errno.EXDEV, errno.EMLINK, errno.ENOTSUP)
+
+
+def file_sha256(path):
+    """SHA-256 hex digest of a file's contents"""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(HASH_BLOCK)
+            if not block:
+                break
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+class BlobStore:
+    """Hard-link blob store for one upload folder"""
+
+    def __init__(self, folder, enabled=True):
+        self.folder = folder
+        self.root = os.path.join(folder, BLOB_DIRNAME)
+        self.enabled = enabled
+        if enabled:
+            os.makedirs(self.root, exist_ok=True)
+
+    def blob_path(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def has(self, digest, size=None):
+        """Whether a blob with this digest (and size, if given) is stored"""
+        try:
+            stats = os.stat(self.blob_path(digest))
+        except FileNotFoundError:
+            return False
+        return size is None or stats.st_size == size
+
+    def store(self, path, digest=None):
+        """Deduplicate a file just placed at ``path``
+
+        Returns True when the file now shares an existing blob, False when it
+        became a new blob (or dedup is off or unsupported here).
+        """
+        if not self.enabled:
+            return False
+        digest = digest or file_sha256(path)
+        blob = self.blob_path(digest)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        if self.has(digest, os.stat(path).st_size) and self.link(digest, path):
+            return True
+        try:
+            os.link(path, blob)
+        except FileExistsError:
+            # Another upload of the same content won the race
+            return self.link(digest, path)
+        except OSError as e:
+            self._link_failed(e)
+        return False
+
+    def link(self, digest, target_path):
+        """Atomically make ``target_path`` another name for a stored blob
+
+        Returns False if the blob is gone or the link cannot be made.
+        """
+        if not self.enabled:
+            return False
+        temp_path = os.path.join(os.path.dirname(target_path), f"{LINK_PREFIX}{secrets.token_hex(8)}")
+        try:
+            os.link(self.blob_path(digest), temp_path)
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            self._link_failed(e)
+            return False
+        try:
+            os.replace(temp_path, target_path)
+        except OSError:
+            os.remove(temp_path)
+            raise
+        return True
+
+    def linked_digest(self, path, content_hash=None):
+        """Digest of the blob a stored file is a link to, or None
+
+        Call before replacing or removing ``path`` and pass the result to
+        release() afterwards. ``content_hash`` is used when the caller knows
+        it; otherwise a file that shares its inode with another name is
+        hashed, so its blob is not left behind until the next collect().
+        """
+        if not self.enabled:
+            return None
+        try:
+            if os.stat(path).st_nlink <= 1:
+                return None
+        except FileNotFoundError:
+            return None
+        return content_hash or file_sha256(path)
+
+    def release(self, digest):
+        """Drop a blob once no stored file links to it any more"""
+        if not self.enabled or not digest:
+            return
+        blob = self.blob_path(digest)
+        try:
+            if os.stat(blob).st_nlink <= 1:
+                os.remove(blob)
+        except FileNotFoundError:
+            pass
+
+    def collect(self):
+        """Remove blobs left unreferenced by files deleted outside the app
+
+        Also sweeps temporary links left by a crash between link() and its
+        rename; each one holds a reference that would keep a blob alive.
+        """
+        if not self.enabled:
+            return 0
+        cutoff = time.time() - STALE_LINK_AGE
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                # A link shares its blob's mtime; ctime changes when it is made
+                if entry.name.startswith(LINK_PREFIX) and entry.stat(follow_symlinks=False).st_ctime < cutoff:
+                    os.remove(entry.path)
+        removed = 0
+        for prefix in os.listdir(self.root):
+            prefix_dir = os.path.join(self.root, prefix)
+            for digest in os.listdir(prefix_dir):
+                blob = os.path.join(prefix_dir, digest)
+                if os.stat(blob).st_nlink <= 1:
+                    os.remove(blob)
+                    removed += 1
+        if removed:
+            logger.info(f"Removed {removed} unreferenced blobs")
+        return removed
+
+    def _link_failed(self, error):
+        if error.errno in NO_LINK_ERRORS:
+            logger.warning(f"Hard links are not supported in {self.root}; storing files without dedup")
+            self.enabled = False
+        else:
+            raise error
@@ -34,6 +34,7 @@ def build_exe():
             '--hidden-import=email.mime.text',     # Email text handling
             '--hidden-import=email.utils',         # Email utilities
             '--hidden-import=pkg_resources',       # Package resources
+            '--collect-submodules=uvicorn',        # Loops/protocols uvicorn imports by name
             '--collect-all=email',                 # Collect all email submodules
             'main.py'                              # Entry point
         ]
@@ -25,6 +25,21 @@ def create_portable_app():
         "app.py",
         "main.py", 
         "utils.py",
+        "catalog.py",
+        "transfer.py",
+        "resumable.py",
+        "ingest.py",
+        "archive.py",
+        "thumbnails.py",
+        "server_state.py",
+        "asgi.py",
+        "server.py",
+        "watcher.py",
+        "search.py",
+        "events.py",
+        "blobs.py",
+        "delta.py",
+        "chunkstore.py",
         "requirements.txt" if Path("requirements.txt").exists() else None,
         "local_requirements.txt" if Path("local_requirements.txt").exists() else None,
     ]
@@ -55,7 +70,7 @@ Werkzeug>=2.3.0
 Pillow>=9.0.0
 qrcode>=7.0.0
 netifaces>=0.11.0
-gunicorn>=21.0.0
+uvicorn>=0.30.0
 """
         requirements_file.write_text(requirements_content)
         print("Created requirements.txt")
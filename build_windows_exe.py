@@ -62,6 +62,7 @@ def build_nuitka_exe():
             '--include-module=PIL',
             '--include-module=email',
             '--include-module=pkg_resources',
+            '--include-package=uvicorn',
             '--output-filename=FileServer.exe',
             '--output-dir=dist_nuitka',
             'main.py'
@@ -112,6 +113,13 @@ a = Analysis(
         'werkzeug', 'werkzeug.security', 'flask', 'jinja2', 'markupsafe',
         'urllib', 'urllib.parse', 'socket', 'threading', 'logging',
         'datetime', 'io', 'secrets', 'string', 'os', 'sys',
+        # Server: uvicorn loads its loop, protocol and lifespan modules by name
+        'uvicorn', 'uvicorn.loops', 'uvicorn.loops.auto', 'uvicorn.loops.asyncio',
+        'uvicorn.protocols', 'uvicorn.protocols.http', 'uvicorn.protocols.http.auto',
+        'uvicorn.protocols.http.h11_impl', 'uvicorn.protocols.http.httptools_impl',
+        'uvicorn.protocols.websockets', 'uvicorn.protocols.websockets.auto',
+        'uvicorn.lifespan', 'uvicorn.lifespan.on', 'uvicorn.lifespan.off',
+        'asgi', 'server',
         # Windows-specific modules
         'win32api', 'win32con', 'win32gui', 'win32process',
     ],
@@ -19,7 +19,7 @@ def create_zipapp_executable():
         
         # Copy application files
         files_to_copy = [
-            'app.py', 'main.py', 'utils.py'
+            'app.py', 'main.py', 'utils.py', 'catalog.py', 'transfer.py', 'resumable.py', 'ingest.py', 'archive.py', 'thumbnails.py', 'server_state.py', 'asgi.py', 'server.py', 'watcher.py', 'search.py', 'events.py', 'blobs.py', 'chunkstore.py', 'delta.py'
         ]
         
         dirs_to_copy = [
@@ -57,14 +57,11 @@ def main():
         print("Starting WiFi File Server...")
         print("Loading application...")
         
-        # Import the app
-        from app import app
+        # The launcher imports the app inside each worker process
+        from server import main as serve
         
-        print("Server starting on http://0.0.0.0:5000")
         print("Press Ctrl+C to stop")
-        
-        # Run the app
-        app.run(host='0.0.0.0', port=5000, debug=False)
+        serve(sys.argv[1:])
         
     except KeyboardInterrupt:
         print("\\nServer stopped by user")
@@ -0,0 +1,603 @@
+"""
+Persistent file catalog for the upload folder
+Keeps name/size/mtime/type/hash rows in SQLite so listings never walk the
+directory, plus a compact in-memory mirror that serves the request path
+"""
+import os
+import sqlite3
+import hashlib
+import threading
+import logging
+from bisect import bisect_left, bisect_right, insort
+
+logger = logging.getLogger(__name__)
+
+CATALOG_FILENAME = '.catalog.sqlite3'
+
+# Sort keys exposed to callers mapped to indexed columns
+SORT_COLUMNS = {
+    'name': 'name COLLATE NOCASE',
+    'size': 'size',
+    'mtime': 'mtime',
+    'type': 'type',
+}
+
+FILE_TYPES = ('video', 'audio', 'image', 'other')
+
+# Seconds a removal stays in the change log before compaction may drop it
+TOMBSTONE_RETENTION = 30 * 24 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    name TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    type TEXT NOT NULL,
+    hash TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_files_name_sort ON files (name COLLATE NOCASE, name);
+CREATE INDEX IF NOT EXISTS idx_files_size ON files (size, name);
+CREATE INDEX IF NOT EXISTS idx_files_mtime ON files (mtime, name);
+CREATE INDEX IF NOT EXISTS idx_files_type ON files (type, name);
+CREATE INDEX IF NOT EXISTS idx_files_hash ON files (hash);
+
+-- Version counter bumped on every change, used as the listing validator
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+CREATE TRIGGER IF NOT EXISTS files_version_insert AFTER INSERT ON files
+BEGIN UPDATE meta SET value = value + 1 WHERE key = 'version'; END;
+CREATE TRIGGER IF NOT EXISTS files_version_update AFTER UPDATE ON files
+BEGIN UPDATE meta SET value = value + 1 WHERE key = 'version'; END;
+CREATE TRIGGER IF NOT EXISTS files_version_delete AFTER DELETE ON files
+BEGIN UPDATE meta SET value = value + 1 WHERE key = 'version'; END;
+
+-- Change log filled by triggers, so every writer in every process records
+-- each add/modify/remove exactly once with a shared sequence number
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    op TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER,
+    mtime REAL,
+    type TEXT,
+    hash TEXT,
+    time REAL NOT NULL
+);
+-- Cursors below the floor may have missed compacted removals
+INSERT OR IGNORE INTO meta (key, value) VALUES ('changes_floor', 0);
+-- A catalog that predates the log starts it with one add per existing file
+INSERT INTO changes (op, name, size, mtime, type, hash, time)
+SELECT 'add', name, size, mtime, type, hash, (julianday('now') - 2440587.5) * 86400.0 FROM files
+WHERE NOT EXISTS (SELECT 1 FROM changes);
+CREATE TRIGGER IF NOT EXISTS files_change_insert AFTER INSERT ON files
+BEGIN
+    INSERT INTO changes (op, name, size, mtime, type, hash, time)
+    VALUES ('add', NEW.name, NEW.size, NEW.mtime, NEW.type, NEW.hash, (julianday('now') - 2440587.5) * 86400.0);
+END;
+-- A hash learned after the file was first seen is logged too, so sync
+-- clients always end up with it
+CREATE TRIGGER IF NOT EXISTS files_change_update AFTER UPDATE OF size, mtime, hash ON files
+WHEN OLD.size IS NOT NEW.size OR OLD.mtime IS NOT NEW.mtime
+    OR (NEW.hash IS NOT NULL AND OLD.hash IS NOT NEW.hash)
+BEGIN
+    INSERT INTO changes (op, name, size, mtime, type, hash, time)
+    VALUES ('modify', NEW.name, NEW.size, NEW.mtime, NEW.type, NEW.hash, (julianday('now') - 2440587.5) * 86400.0);
+END;
+CREATE TRIGGER IF NOT EXISTS files_change_delete AFTER DELETE ON files
+BEGIN
+    INSERT INTO changes (op, name, size, mtime, type, hash, time)
+    VALUES ('remove', OLD.name, NULL, NULL, OLD.type, NULL, (julianday('now') - 2440587.5) * 86400.0);
+END;
+"""
+
+
+class FileCatalog:
+    """SQLite-backed index of the files stored in a folder"""
+
+    def __init__(self, folder, classify, db_path=None):
+        self.folder = folder
+        self.classify = classify
+        self.db_path = db_path or os.path.join(folder, CATALOG_FILENAME)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        """Return the calling thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def upsert(self, name, size, mtime, file_hash=None):
+        """Insert or refresh a catalog row"""
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO files (name, size, mtime, type, hash) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT(name) DO UPDATE SET size=excluded.size, mtime=excluded.mtime, '
+                'type=excluded.type, hash=excluded.hash',
+                (name, size, mtime, self.classify(name), file_hash)
+            )
+
+    def touch(self, name, size, mtime):
+        """Record a stat seen on disk, keeping the known hash if size and mtime still match"""
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO files (name, size, mtime, type, hash) VALUES (?, ?, ?, ?, NULL) '
+                'ON CONFLICT(name) DO UPDATE SET type=excluded.type, '
+                'hash=CASE WHEN size=excluded.size AND mtime=excluded.mtime THEN hash ELSE NULL END, '
+                'size=excluded.size, mtime=excluded.mtime',
+                (name, size, mtime, self.classify(name))
+            )
+
+    def add_path(self, name, file_hash=None):
+        """Stat a file in the folder and record it"""
+        stats = os.stat(os.path.join(self.folder, name))
+        self.upsert(name, stats.st_size, stats.st_mtime, file_hash)
+
+    def remove(self, name):
+        """Drop a file from the catalog"""
+        with self._connect() as conn:
+            conn.execute('DELETE FROM files WHERE name = ?', (name,))
+
+    def get(self, name):
+        """Return the row for a file or None"""
+        row = self._connect().execute(
+            'SELECT name, size, mtime, type, hash FROM files WHERE name = ?', (name,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def list_files(self, sort='name', descending=False, limit=None, offset=0):
+        """Return catalog rows ordered by an indexed column"""
+        column = SORT_COLUMNS.get(sort, SORT_COLUMNS['name'])
+        direction = 'DESC' if descending else 'ASC'
+        query = f'SELECT name, size, mtime, type, hash FROM files ORDER BY {column} {direction}, name {direction}'
+        params = ()
+        if limit is not None:
+            query += ' LIMIT ? OFFSET ?'
+            params = (limit, offset)
+        return [dict(row) for row in self._connect().execute(query, params)]
+
+    def page(self, sort='name', descending=False, limit=100, after=None, types=None):
+        """Return one keyset page of rows plus the key to resume after
+
+        ``after`` is the (sort value, name) pair of the last row of the
+        previous page, so each page is a single index range scan no matter
+        how deep into the listing the client is.
+        """
+        if sort not in SORT_COLUMNS:
+            sort = 'name'
+        column = SORT_COLUMNS[sort]
+        direction = 'DESC' if descending else 'ASC'
+        comparison = '<' if descending else '>'
+
+        clauses = []
+        params = []
+        if types:
+            clauses.append(f"type IN ({','.join('?' * len(types))})")
+            params.extend(types)
+        if after is not None:
+            clauses.append(f'({column}, name) {comparison} (?, ?)')
+            params.extend(after)
+
+        query = 'SELECT name, size, mtime, type, hash FROM files'
+        if clauses:
+            query += ' WHERE ' + ' AND '.join(clauses)
+        query += f' ORDER BY {column} {direction}, name {direction} LIMIT ?'
+        params.append(limit + 1)
+
+        rows = [dict(row) for row in self._connect().execute(query, params)]
+        next_key = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_key = (rows[-1][sort], rows[-1]['name'])
+        return rows, next_key
+
+    def count(self, types=None):
+        """Total number of catalogued files, optionally of some types only"""
+        if types:
+            query = f"SELECT COUNT(*) FROM files WHERE type IN ({','.join('?' * len(types))})"
+            return self._connect().execute(query, tuple(types)).fetchone()[0]
+        return self._connect().execute('SELECT COUNT(*) FROM files').fetchone()[0]
+
+    def version(self):
+        """Counter that changes whenever any row changes, in any process"""
+        return self._connect().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def changes_since(self, seq, limit=1000):
+        """Logged changes with a sequence number above ``seq``, oldest first"""
+        rows = self._connect().execute(
+            'SELECT seq, op, name, size, mtime, type, hash, time FROM changes WHERE seq > ? ORDER BY seq LIMIT ?',
+            (seq, limit)
+        )
+        return [dict(row) for row in rows]
+
+    def latest_change(self):
+        """Sequence number of the newest logged change, 0 if none"""
+        return self._connect().execute('SELECT COALESCE(MAX(seq), 0) FROM changes').fetchone()[0]
+
+    def change_floor(self):
+        """Oldest cursor that changes_since() still answers completely"""
+        return self._connect().execute("SELECT value FROM meta WHERE key = 'changes_floor'").fetchone()[0]
+
+    def compact_changes(self, retention=TOMBSTONE_RETENTION):
+        """Shrink the change log without changing what any cursor syncs to
+
+        Only the newest entry per name is kept, which every cursor still
+        replays to the same final state. Removals older than ``retention``
+        seconds are then dropped too and the floor raised past them, so
+        clients that were away longer start over from a full listing.
+        Returns the number of entries removed.
+        """
+        with self._connect() as conn:
+            removed = conn.execute(
+                'DELETE FROM changes WHERE seq NOT IN (SELECT MAX(seq) FROM changes GROUP BY name)'
+            ).rowcount
+            horizon = conn.execute(
+                "SELECT MAX(seq) FROM changes WHERE op = 'remove' "
+                "AND time < (julianday('now') - 2440587.5) * 86400.0 - ?", (retention,)
+            ).fetchone()[0]
+            if horizon is not None:
+                removed += conn.execute(
+                    "DELETE FROM changes WHERE op = 'remove' AND seq <= ?", (horizon,)
+                ).rowcount
+                conn.execute("UPDATE meta SET value = MAX(value, ?) WHERE key = 'changes_floor'", (horizon,))
+        if removed:
+            logger.info(f"Compacted change log: {removed} entries removed")
+        return removed
+
+    def content_hash(self, name, stats):
+        """Known SHA-256 of a file, provided the row still matches its stat"""
+        row = self.get(name)
+        if row and row['hash'] and row['size'] == stats.st_size and row['mtime'] == stats.st_mtime:
+            return row['hash']
+        return None
+
+    def find_hash(self, file_hash, size):
+        """Names of catalogued files with this SHA-256 and size"""
+        rows = self._connect().execute('SELECT name FROM files WHERE hash = ? AND size = ?', (file_hash, size))
+        return [row['name'] for row in rows]
+
+    def type_counts(self):
+        """Number of files per type"""
+        rows = self._connect().execute('SELECT type, COUNT(*) FROM files GROUP BY type')
+        return {file_type: total for file_type, total in rows}
+
+    def reconcile(self, on_disk=None):
+        """Bring the catalog in line with what is actually on disk
+
+        ``on_disk`` maps names to (size, mtime) for storage other than the
+        folder itself; by default the folder is scanned.
+        """
+        if on_disk is None:
+            on_disk = {}
+            with os.scandir(self.folder) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.') or not entry.is_file():
+                        continue
+                    stats = entry.stat()
+                    on_disk[entry.name] = (stats.st_size, stats.st_mtime)
+
+        conn = self._connect()
+        known = {row['name']: (row['size'], row['mtime'])
+                 for row in conn.execute('SELECT name, size, mtime FROM files')}
+
+        stale = [name for name in known if name not in on_disk]
+        changed = [(name, size, mtime, self.classify(name))
+                   for name, (size, mtime) in on_disk.items()
+                   if known.get(name) != (size, mtime)]
+
+        with conn:
+            conn.executemany('DELETE FROM files WHERE name = ?', [(name,) for name in stale])
+            conn.executemany(
+                'INSERT INTO files (name, size, mtime, type, hash) VALUES (?, ?, ?, ?, NULL) '
+                'ON CONFLICT(name) DO UPDATE SET size=excluded.size, mtime=excluded.mtime, '
+                'type=excluded.type, hash=NULL',
+                changed
+            )
+
+        logger.info(f"Catalog reconciled: {len(on_disk)} files, {len(changed)} updated, {len(stale)} removed")
+        return len(changed), len(stale)
+
+
+class FileRecord:
+    """One catalogued file; slots keep 200k entries to a few tens of MB"""
+
+    __slots__ = ('name', 'size', 'mtime', 'type', 'hash')
+
+    def __init__(self, name, size, mtime, file_type, file_hash=None):
+        self.name = name
+        self.size = size
+        self.mtime = mtime
+        self.type = file_type
+        self.hash = file_hash
+
+    def as_dict(self):
+        return {'name': self.name, 'size': self.size, 'mtime': self.mtime,
+                'type': self.type, 'hash': self.hash}
+
+    def digest(self):
+        """Stable 64-bit fingerprint, the same in every worker process"""
+        data = f"{self.name}\0{self.size}\0{self.mtime!r}\0{self.hash}".encode('utf-8', 'surrogateescape')
+        return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'big')
+
+
+def _nocase(name):
+    """Fold ASCII letters only, matching SQLite's NOCASE collation"""
+    return name.lower() if name.isascii() else ''.join(c.lower() if c < '\x80' else c for c in name)
+
+
+# Ordering of each sort key, consistent with FileCatalog's ORDER BY clauses
+SORT_KEYS = {
+    'name': lambda record: (_nocase(record.name), record.name),
+    'size': lambda record: (record.size, record.name),
+    'mtime': lambda record: (record.mtime, record.name),
+    'type': lambda record: (record.type, record.name),
+}
+
+
+class MemoryCatalog:
+    """In-process mirror of a FileCatalog
+
+    Reads (listings, counts, lookups) are answered from FileRecord objects
+    without touching the disk or the database; writes go to both. A
+    FolderWatcher calls refresh() and sync() to pick up changes made
+    outside the app. An optional search index is kept in step with the
+    set of names.
+    """
+
+    def __init__(self, store, index=None):
+        self.store = store
+        self.index = index
+        # Called with a file name after every in-memory change
+        self.listeners = []
+        self.folder = store.folder
+        self.classify = store.classify
+        self._records = {}
+        # Records in order for each sort key, built on first use and then
+        # kept in order by _put/_drop
+        self._sorted = {}
+        self._type_counts = {}
+        self._digest = 0
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Replace the in-memory state with the store's rows"""
+        records = {row['name']: FileRecord(row['name'], row['size'], row['mtime'], row['type'], row['hash'])
+                   for row in self.store.list_files()}
+        type_counts = {}
+        digest = 0
+        for record in records.values():
+            type_counts[record.type] = type_counts.get(record.type, 0) + 1
+            digest ^= record.digest()
+        with self._lock:
+            self._records = records
+            self._type_counts = type_counts
+            self._digest = digest
+            self._sorted = {}
+        if self.index is not None:
+            self.index.rebuild(records)
+
+    def reconcile(self, on_disk=None):
+        """Reconcile the store against the folder, then reload from it"""
+        result = self.store.reconcile(on_disk)
+        self.load()
+        return result
+
+    def _put(self, record):
+        with self._lock:
+            old = self._records.get(record.name)
+            if old is not None:
+                self._type_counts[old.type] -= 1
+                self._digest ^= old.digest()
+            self._records[record.name] = record
+            self._type_counts[record.type] = self._type_counts.get(record.type, 0) + 1
+            self._digest ^= record.digest()
+            for sort, records in self._sorted.items():
+                key = SORT_KEYS[sort]
+                if old is not None:
+                    del records[bisect_left(records, key(old), key=key)]
+                insort(records, record, key=key)
+        if old is None and self.index is not None:
+            self.index.add(record.name)
+        self._notify(record.name)
+
+    def _drop(self, name):
+        with self._lock:
+            old = self._records.pop(name, None)
+            if old is None:
+                return
+            self._type_counts[old.type] -= 1
+            self._digest ^= old.digest()
+            for sort, records in self._sorted.items():
+                key = SORT_KEYS[sort]
+                del records[bisect_left(records, key(old), key=key)]
+        if self.index is not None:
+            self.index.remove(name)
+        self._notify(name)
+
+    def _notify(self, name):
+        for listener in self.listeners:
+            listener(name)
+
+    def upsert(self, name, size, mtime, file_hash=None):
+        self.store.upsert(name, size, mtime, file_hash)
+        self._put(FileRecord(name, size, mtime, self.classify(name), file_hash))
+
+    def add_path(self, name, file_hash=None):
+        stats = os.stat(os.path.join(self.folder, name))
+        self.upsert(name, stats.st_size, stats.st_mtime, file_hash)
+
+    def remove(self, name):
+        self.store.remove(name)
+        self._drop(name)
+
+    def refresh(self, name, stats=None):
+        """Re-check one file after a change notification"""
+        if stats is None:
+            try:
+                stats = os.stat(os.path.join(self.folder, name))
+            except FileNotFoundError:
+                if name in self._records:
+                    self.remove(name)
+                return
+        record = self._records.get(name)
+        if record is not None and record.size == stats.st_size and record.mtime == stats.st_mtime:
+            return
+        self.store.touch(name, stats.st_size, stats.st_mtime)
+        self._put(FileRecord(name, stats.st_size, stats.st_mtime, self.classify(name)))
+
+    def sync(self):
+        """Compare the folder with memory and apply the differences
+
+        Used by the polling watcher and after a lost inotify queue.
+        """
+        seen = set()
+        changed = 0
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if entry.name.startswith('.') or not entry.is_file():
+                    continue
+                seen.add(entry.name)
+                stats = entry.stat()
+                record = self._records.get(entry.name)
+                if record is None or record.size != stats.st_size or record.mtime != stats.st_mtime:
+                    self.refresh(entry.name, stats)
+                    changed += 1
+        with self._lock:
+            names = list(self._records)
+        for name in names:
+            if name in seen:
+                continue
+            self.remove(name)
+            changed += 1
+        return changed
+
+    def apply_changes(self, rows):
+        """Bring the named files of change-log rows in line with the store
+
+        Other worker processes write to the same store; replaying their log
+        entries keeps this mirror current without a folder to watch. Each
+        name is re-read from the store rather than taken from the row, so a
+        stale entry never undoes a newer local change.
+        """
+        for name in dict.fromkeys(row['name'] for row in rows):
+            row = self.store.get(name)
+            if row is None:
+                self._drop(name)
+                continue
+            record = self._records.get(name)
+            if (record is None or record.size != row['size'] or record.mtime != row['mtime']
+                    or record.hash != row['hash']):
+                self._put(FileRecord(name, row['size'], row['mtime'], row['type'], row['hash']))
+
+    def exists(self, name):
+        return name in self._records
+
+    def get(self, name):
+        record = self._records.get(name)
+        return record.as_dict() if record else None
+
+    def content_hash(self, name, stats):
+        """Known SHA-256 of a file, provided the record still matches its stat"""
+        record = self._records.get(name)
+        if record is None or record.size != stats.st_size or record.mtime != stats.st_mtime:
+            return None
+        if record.hash is None:
+            # Another worker may have hashed it since this one saw the file
+            file_hash = self.store.content_hash(name, stats)
+            if file_hash is None:
+                return None
+            self._put(FileRecord(name, record.size, record.mtime, record.type, file_hash))
+            return file_hash
+        return record.hash
+
+    def find_hash(self, file_hash, size):
+        """Path of a stored file with this SHA-256 and size, or None
+
+        The file is checked against its record so a copy changed since it was
+        hashed is never offered as a match.
+        """
+        for name in self.store.find_hash(file_hash, size):
+            path = os.path.join(self.folder, name)
+            try:
+                stats = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if self.content_hash(name, stats) == file_hash:
+                return path
+        return None
+
+    def version(self):
+        """Fingerprint of the whole catalog; equal in every worker that sees the same files"""
+        return f"{self._digest:016x}"
+
+    def count(self, types=None):
+        if types:
+            return sum(self._type_counts.get(file_type, 0) for file_type in types)
+        return len(self._records)
+
+    def type_counts(self):
+        return {file_type: total for file_type, total in self._type_counts.items() if total}
+
+    def _sorted_records(self, sort):
+        """Records ordered by a sort key; call with the lock held
+
+        The list is updated in place by later changes, so readers finish
+        with it before releasing the lock.
+        """
+        records = self._sorted.get(sort)
+        if records is None:
+            records = sorted(self._records.values(), key=SORT_KEYS[sort])
+            self._sorted[sort] = records
+        return records
+
+    def list_files(self, sort='name', descending=False, limit=None, offset=0):
+        if sort not in SORT_KEYS:
+            sort = 'name'
+        with self._lock:
+            records = self._sorted_records(sort)
+            if descending:
+                stop = max(len(records) - offset, 0)
+                start = 0 if limit is None else max(stop - limit, 0)
+                selected = records[start:stop][::-1]
+            else:
+                selected = records[offset:] if limit is None else records[offset:offset + limit]
+        return [record.as_dict() for record in selected]
+
+    def page(self, sort='name', descending=False, limit=100, after=None, types=None):
+        """Keyset page with the same contract as FileCatalog.page"""
+        if sort not in SORT_KEYS:
+            sort = 'name'
+        key = SORT_KEYS[sort]
+        if after is not None:
+            after_key = (_nocase(after[0]) if sort == 'name' else after[0], after[1])
+
+        selected = []
+        with self._lock:
+            records = self._sorted_records(sort)
+            if descending:
+                end = len(records) if after is None else bisect_left(records, after_key, key=key)
+                positions = range(end - 1, -1, -1)
+            else:
+                start = 0 if after is None else bisect_right(records, after_key, key=key)
+                positions = range(start, len(records))
+            for position in positions:
+                record = records[position]
+                if types and record.type not in types:
+                    continue
+                selected.append(record)
+                if len(selected) > limit:
+                    break
+
+        rows = [record.as_dict() for record in selected]
+
+        next_key = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_key = (rows[-1][sort], rows[-1]['name'])
+        return rows, next_key
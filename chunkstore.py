@@ -0,0 +1,599 @@
+"""
+Chunk-level deduplicating storage
+Alternative storage backend that splits each file into content-defined
+chunks, keeps every distinct chunk once in packed segment files and records
+chunk locations and per-file chunk lists in an SQLite index. Files that
+share most of their bytes (re-exported documents, appended logs, edited
+videos) share those chunks on disk. Any byte range is reassembled from the
+chunk list, so downloads and media seeking behave as they do for plain files.
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import logging
+from bisect import bisect_right
+
+try:
+    import fcntl
+except ImportError:  # Windows builds run a single server process
+    fcntl = None
+
+from transfer import CHUNK_SIZE
+from archive import ArchiveEntry
+
+logger = logging.getLogger(__name__)
+
+CHUNK_DIRNAME = '.chunks'
+INDEX_NAME = 'index.sqlite3'
+SEGMENT_DIRNAME = 'segments'
+
+# Chunk size bounds; boundaries fall where the content says between them
+MIN_CHUNK = 16 * 1024
+MAX_CHUNK = 256 * 1024
+
+# A boundary follows the first run of BOUNDARY_RUN bytes that all come from
+# the marked half of the byte values, which starts about once every 2**16
+# positions in random data (chunks average roughly 80 KB). Mapping bytes to
+# their half and searching the mapped buffer runs at C speed through
+# bytes.translate and bytes.find instead of a per-byte Python rolling hash.
+# The marked half must never change or new uploads stop matching old chunks.
+BOUNDARY_RUN = 15
+_MARKED = set(sorted(range(256), key=lambda value: hashlib.sha256(bytes([value])).digest())[:128])
+_HALVES = bytes(0x31 if value in _MARKED else 0x30 for value in range(256))
+_MARKER = b'1' * BOUNDARY_RUN
+
+# Bytes read from an incoming file per step
+READ_SIZE = 4 * 1024 * 1024
+
+# A writer starts a new segment file once its current one reaches this size
+SEGMENT_SIZE = 64 * 1024 * 1024
+
+# Segments whose dead share reaches this are rewritten by compact()
+COMPACT_RATIO = 0.5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY,
+    size INTEGER NOT NULL DEFAULT 0,
+    dead INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY,
+    digest BLOB NOT NULL UNIQUE,
+    segment INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    refs INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_chunks_segment ON chunks (segment);
+CREATE TABLE IF NOT EXISTS files (
+    name TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    hash TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_files_hash ON files (hash);
+CREATE TABLE IF NOT EXISTS recipes (
+    name TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    chunk INTEGER NOT NULL,
+    PRIMARY KEY (name, position)
+) WITHOUT ROWID;
+"""
+
+
+def _boundary(halves, start, at_end):
+    """End of the chunk starting at ``start``, or None until more data arrives"""
+    available = len(halves)
+    if start >= available:
+        return None
+    limit = min(start + MAX_CHUNK, available)
+    found = halves.find(_MARKER, start + MIN_CHUNK - BOUNDARY_RUN, limit)
+    if found >= 0:
+        return found + BOUNDARY_RUN
+    if start + MAX_CHUNK <= available:
+        return start + MAX_CHUNK
+    return available if at_end else None
+
+
+def iter_chunks(f):
+    """Split a binary file object into content-defined chunks"""
+    buffer = b''
+    halves = b''
+    at_end = False
+    while not at_end:
+        data = f.read(READ_SIZE)
+        at_end = not data
+        buffer += data
+        halves += data.translate(_HALVES)
+        start = 0
+        while True:
+            end = _boundary(halves, start, at_end)
+            if end is None:
+                break
+            yield buffer[start:end]
+            start = end
+        buffer = buffer[start:]
+        halves = halves[start:]
+
+
+def chunk_digest(chunk):
+    return hashlib.blake2b(chunk, digest_size=20).digest()
+
+
+class ChunkStat:
+    """The os.stat_result fields the transfer code reads, for a chunked file"""
+
+    __slots__ = ('st_size', 'st_mtime', 'st_mtime_ns', 'st_ino', 'hash')
+
+    def __init__(self, size, mtime, file_hash):
+        self.st_size = size
+        self.st_mtime = mtime
+        self.st_mtime_ns = int(mtime * 1e9)
+        self.st_ino = 0
+        self.hash = file_hash
+
+
+class ChunkVanished(Exception):
+    """A chunk seen before a write was dropped before it could be referenced"""
+
+
+class ChunkBody:
+    """A byte window of a chunked file, read back from its segments
+
+    Has the read/readinto/iterate/close interface of transfer.TransferBody,
+    so the same range and multipart responses serve it (with no ``fileno()``
+    it always takes the buffered path); segment files are opened up front
+    so a concurrent compaction cannot pull them away mid-read.
+    """
+
+    def __init__(self, store, name, offset=0, length=None):
+        size, self.positions, self.locations = store.recipe(name)
+        if length is None:
+            length = size - offset
+        self.offset = offset
+        self.length = length
+        self.remaining = length
+        self.position = offset
+        self.files = {}
+        try:
+            for segment in {location[0] for location in self.locations}:
+                self.files[segment] = open(store.segment_path(segment), 'rb', buffering=0)
+        except FileNotFoundError:
+            self.close()
+            raise
+
+    def read(self, size=CHUNK_SIZE):
+        """Read up to ``size`` bytes without crossing the end of the window"""
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        parts = []
+        while size > 0:
+            index = bisect_right(self.positions, self.position) - 1
+            segment, offset, length = self.locations[index]
+            within = self.position - self.positions[index]
+            count = min(length - within, size)
+            f = self.files[segment]
+            f.seek(offset + within)
+            data = f.read(count)
+            if len(data) != count:
+                raise IOError(f"Segment {segment} is truncated")
+            parts.append(data)
+            self.position += count
+            self.remaining -= count
+            size -= count
+        return b''.join(parts)
+
+    def readinto(self, buffer):
+        """Fill ``buffer`` from the window; returns the number of bytes read"""
+        view = memoryview(buffer)
+        size = min(len(view), self.remaining)
+        filled = 0
+        while filled < size:
+            index = bisect_right(self.positions, self.position) - 1
+            segment, offset, length = self.locations[index]
+            within = self.position - self.positions[index]
+            count = min(length - within, size - filled)
+            f = self.files[segment]
+            f.seek(offset + within)
+            if f.readinto(view[filled:filled + count]) != count:
+                raise IOError(f"Segment {segment} is truncated")
+            filled += count
+            self.position += count
+            self.remaining -= count
+        return filled
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+
+
+class ChunkStore:
+    """Content-defined chunk store for the files of one upload folder
+
+    Each process appends new chunks to a segment file of its own, holding an
+    flock on it so compaction in other processes leaves it alone; the index
+    is shared through SQLite. A segment stays locked after it is sealed
+    until every write that appended to it has committed its index rows, so
+    chunks on their way into the index are never compacted away.
+    """
+
+    def __init__(self, folder):
+        self.root = os.path.join(folder, CHUNK_DIRNAME)
+        os.makedirs(os.path.join(self.root, SEGMENT_DIRNAME), exist_ok=True)
+        self.db_path = os.path.join(self.root, INDEX_NAME)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._segment = None
+        self._segment_file = None
+        self._segment_size = 0
+        # Segment -> operations with appended but uncommitted chunks in it,
+        # and the still-locked files of sealed segments among them
+        self._writers = {}
+        self._sealed = {}
+        self._compacting = threading.Lock()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        """Return the calling thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def segment_path(self, segment):
+        return os.path.join(self.root, SEGMENT_DIRNAME, f"{segment:08d}.pack")
+
+    def _seal_segment(self):
+        """Stop appending to the current segment (write lock held)"""
+        if self._segment_file is not None:
+            if self._segment in self._writers:
+                # Keep the lock until the pending writes are committed
+                self._sealed[self._segment] = self._segment_file
+            else:
+                self._segment_file.close()
+        self._segment = None
+        self._segment_file = None
+
+    def _open_segment(self):
+        """Start a new segment file owned by this process (write lock held)"""
+        self._seal_segment()
+        with self._connect() as conn:
+            segment = conn.execute('INSERT INTO segments DEFAULT VALUES').lastrowid
+        self._segment_file = open(self.segment_path(segment), 'ab', buffering=0)
+        if fcntl is not None:
+            fcntl.flock(self._segment_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._segment = segment
+        self._segment_size = 0
+
+    def _append(self, chunk, writing):
+        """Write a chunk to this process's segment and return its location
+
+        ``writing`` collects the segments the calling operation has pending
+        chunks in; it must be passed to _finish_writes() once they are
+        committed or abandoned.
+        """
+        with self._write_lock:
+            if self._segment is None or self._segment_size + len(chunk) > SEGMENT_SIZE:
+                self._open_segment()
+            if self._segment not in writing:
+                writing.add(self._segment)
+                self._writers[self._segment] = self._writers.get(self._segment, 0) + 1
+            offset = self._segment_size
+            self._segment_file.write(chunk)
+            self._segment_size += len(chunk)
+            return self._segment, offset, len(chunk)
+
+    def _finish_writes(self, writing):
+        """Drop an operation's claim on the segments it appended to"""
+        with self._write_lock:
+            for segment in writing:
+                self._writers[segment] -= 1
+                if not self._writers[segment]:
+                    del self._writers[segment]
+                    sealed = self._sealed.pop(segment, None)
+                    if sealed is not None:
+                        sealed.close()
+            writing.clear()
+
+    def _sync_segment(self):
+        with self._write_lock:
+            if self._segment_file is not None:
+                os.fsync(self._segment_file.fileno())
+
+    def put(self, name, path, file_hash=None, mtime=None):
+        """Store the file at ``path`` as ``name``, replacing any file of that name
+
+        Returns the number of bytes that were not already stored.
+        """
+        try:
+            return self._put(name, path, file_hash, mtime)
+        except ChunkVanished:
+            # A delete freed a chunk this file shares while it was being split
+            return self._put(name, path, file_hash, mtime)
+
+    def _put(self, name, path, file_hash, mtime):
+        writing = set()
+        try:
+            return self._put_chunks(name, path, file_hash, mtime, writing)
+        finally:
+            self._finish_writes(writing)
+
+    def _put_chunks(self, name, path, file_hash, mtime, writing):
+        conn = self._connect()
+        locations = {}
+        recipe = []
+        size = 0
+        with open(path, 'rb') as f:
+            for chunk in iter_chunks(f):
+                digest = chunk_digest(chunk)
+                recipe.append((size, digest))
+                size += len(chunk)
+                if digest in locations:
+                    continue
+                known = conn.execute('SELECT 1 FROM chunks WHERE digest = ?', (digest,)).fetchone()
+                locations[digest] = None if known else self._append(chunk, writing)
+        new_bytes = sum(location[2] for location in locations.values() if location)
+        if new_bytes:
+            self._sync_segment()
+
+        try:
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                self._account_written(conn, locations.values())
+                ids = {}
+                for digest, location in locations.items():
+                    if location is not None:
+                        inserted = conn.execute(
+                            'INSERT OR IGNORE INTO chunks (digest, segment, offset, length) VALUES (?, ?, ?, ?)',
+                            (digest, *location)
+                        ).rowcount
+                        if not inserted:
+                            # Another writer stored the same chunk first
+                            self._add_dead(conn, location[0], location[2])
+                    row = conn.execute('SELECT id FROM chunks WHERE digest = ?', (digest,)).fetchone()
+                    if row is None:
+                        raise ChunkVanished(digest.hex())
+                    ids[digest] = row['id']
+                released = self._take_recipe(conn, name)
+                conn.executemany('INSERT INTO recipes (name, position, chunk) VALUES (?, ?, ?)',
+                                 [(name, position, ids[digest]) for position, digest in recipe])
+                self._adjust_refs(conn, self._count(ids[digest] for _, digest in recipe), 1)
+                self._adjust_refs(conn, released, -1)
+                conn.execute('INSERT OR REPLACE INTO files (name, size, mtime, hash) VALUES (?, ?, ?, ?)',
+                             (name, size, mtime or time.time(), file_hash))
+        except ChunkVanished:
+            with conn:
+                for location in locations.values():
+                    if location is not None:
+                        self._add_dead(conn, location[0], location[2])
+                self._account_written(conn, locations.values())
+            raise
+
+        logger.debug(f"Chunked {name}: {size} bytes in {len(recipe)} chunks, {new_bytes} new")
+        return new_bytes
+
+    @staticmethod
+    def _count(ids):
+        counts = {}
+        for chunk_id in ids:
+            counts[chunk_id] = counts.get(chunk_id, 0) + 1
+        return counts
+
+    @staticmethod
+    def _account_written(conn, locations):
+        written = {}
+        for location in locations:
+            if location is not None:
+                written[location[0]] = written.get(location[0], 0) + location[2]
+        for segment, length in written.items():
+            conn.execute('UPDATE segments SET size = size + ? WHERE id = ?', (length, segment))
+
+    @staticmethod
+    def _add_dead(conn, segment, length):
+        conn.execute('UPDATE segments SET dead = dead + ? WHERE id = ?', (length, segment))
+
+    @staticmethod
+    def _take_recipe(conn, name):
+        """Delete a file's chunk list and return its chunk reference counts"""
+        counts = {row['chunk']: row['uses'] for row in conn.execute(
+            'SELECT chunk, COUNT(*) AS uses FROM recipes WHERE name = ? GROUP BY chunk', (name,))}
+        conn.execute('DELETE FROM recipes WHERE name = ?', (name,))
+        return counts
+
+    def _adjust_refs(self, conn, counts, sign):
+        conn.executemany('UPDATE chunks SET refs = refs + ? WHERE id = ?',
+                         [(sign * uses, chunk_id) for chunk_id, uses in counts.items()])
+        if sign < 0:
+            # Unreferenced chunks become dead space in their segment at once
+            for row in conn.execute('SELECT segment, SUM(length) AS length FROM chunks '
+                                    'WHERE refs <= 0 GROUP BY segment').fetchall():
+                self._add_dead(conn, row['segment'], row['length'])
+            conn.execute('DELETE FROM chunks WHERE refs <= 0')
+
+    def copy(self, source, name):
+        """Store ``name`` with the same content as ``source`` without writing data
+
+        Returns False if ``source`` is not stored.
+        """
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT size, hash FROM files WHERE name = ?', (source,)).fetchone()
+            if row is None:
+                return False
+            recipe = conn.execute('SELECT position, chunk FROM recipes WHERE name = ?', (source,)).fetchall()
+            released = self._take_recipe(conn, name)
+            conn.executemany('INSERT INTO recipes (name, position, chunk) VALUES (?, ?, ?)',
+                             [(name, entry['position'], entry['chunk']) for entry in recipe])
+            self._adjust_refs(conn, self._count(entry['chunk'] for entry in recipe), 1)
+            self._adjust_refs(conn, released, -1)
+            conn.execute('INSERT OR REPLACE INTO files (name, size, mtime, hash) VALUES (?, ?, ?, ?)',
+                         (name, row['size'], time.time(), row['hash']))
+        return True
+
+    def remove(self, name):
+        """Delete a file; returns False if it was not stored"""
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            if not conn.execute('DELETE FROM files WHERE name = ?', (name,)).rowcount:
+                return False
+            self._adjust_refs(conn, self._take_recipe(conn, name), -1)
+        if self._needs_compaction():
+            threading.Thread(target=self.compact, name='chunk-compaction', daemon=True).start()
+        return True
+
+    def find_hash(self, file_hash, size):
+        """Name of a stored file with this SHA-256 and size, or None"""
+        row = self._connect().execute('SELECT name FROM files WHERE hash = ? AND size = ? LIMIT 1',
+                                      (file_hash, size)).fetchone()
+        return row['name'] if row else None
+
+    def stat(self, name):
+        """ChunkStat for a stored file; raises FileNotFoundError if absent"""
+        row = self._connect().execute('SELECT size, mtime, hash FROM files WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            raise FileNotFoundError(name)
+        return ChunkStat(row['size'], row['mtime'], row['hash'])
+
+    def listing(self):
+        """{name: (size, mtime)} for every stored file"""
+        return {row['name']: (row['size'], row['mtime'])
+                for row in self._connect().execute('SELECT name, size, mtime FROM files')}
+
+    def plan_entries(self, names):
+        """ArchiveEntry records, read through this store, for the named files that exist"""
+        listing = self.listing()
+        return [ArchiveEntry(name, name, *listing[name], open_body=self.open_window)
+                for name in dict.fromkeys(names) if name in listing]
+
+    def recipe(self, name):
+        """(size, chunk start positions, (segment, offset, length) per chunk) of a file"""
+        conn = self._connect()
+        row = conn.execute('SELECT size FROM files WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            raise FileNotFoundError(name)
+        rows = conn.execute(
+            'SELECT r.position, c.segment, c.offset, c.length FROM recipes r JOIN chunks c ON c.id = r.chunk '
+            'WHERE r.name = ? ORDER BY r.position', (name,)
+        ).fetchall()
+        return row['size'], [r['position'] for r in rows], [(r['segment'], r['offset'], r['length']) for r in rows]
+
+    def open_window(self, name, offset=0, length=None):
+        """ChunkBody for a byte window of a stored file"""
+        try:
+            return ChunkBody(self, name, offset, length)
+        except FileNotFoundError:
+            # A segment was compacted between the index read and the open
+            return ChunkBody(self, name, offset, length)
+
+    def stats(self):
+        """Totals for the store, including the deduplication ratio"""
+        conn = self._connect()
+        files, logical = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM files').fetchone()
+        chunks, stored = conn.execute('SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks').fetchone()
+        disk, dead = conn.execute('SELECT COALESCE(SUM(size), 0), COALESCE(SUM(dead), 0) FROM segments').fetchone()
+        return {
+            'files': files,
+            'chunks': chunks,
+            'logical_bytes': logical,
+            'stored_bytes': stored,
+            'disk_bytes': disk,
+            'dead_bytes': dead,
+            'dedup_ratio': round(logical / stored, 3) if stored else 1.0
+        }
+
+    def _needs_compaction(self):
+        row = self._connect().execute(
+            'SELECT 1 FROM segments WHERE size > 0 AND dead >= size * ? LIMIT 1', (COMPACT_RATIO,)
+        ).fetchone()
+        return row is not None
+
+    def compact(self):
+        """Rewrite mostly-dead segments, moving their live chunks to a new segment
+
+        Segments any process is still appending to, or has uncommitted
+        chunks in, are skipped. Returns the number of bytes reclaimed.
+        """
+        if not self._compacting.acquire(blocking=False):
+            return 0
+        try:
+            conn = self._connect()
+            candidates = conn.execute(
+                'SELECT id, size FROM segments WHERE size > 0 AND dead >= size * ?', (COMPACT_RATIO,)
+            ).fetchall()
+            with self._write_lock:
+                if any(candidate['id'] == self._segment for candidate in candidates):
+                    # Live chunks move to a fresh segment of this process
+                    self._seal_segment()
+            reclaimed = 0
+            for candidate in candidates:
+                reclaimed += self._compact_segment(conn, candidate['id'], candidate['size'])
+            if reclaimed:
+                logger.info(f"Compacted chunk segments: {reclaimed} bytes reclaimed")
+            return reclaimed
+        finally:
+            self._compacting.release()
+
+    def _compact_segment(self, conn, segment, size):
+        path = self.segment_path(segment)
+        try:
+            source = open(path, 'rb')
+        except FileNotFoundError:
+            with conn:
+                conn.execute('DELETE FROM segments WHERE id = ?', (segment,))
+            return size
+        with source:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(source, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    # Still another process's active segment
+                    return 0
+            with self._write_lock:
+                if segment in self._writers:
+                    # Writes of this process into it are not committed yet
+                    return 0
+            if conn.execute('SELECT 1 FROM segments WHERE id = ?', (segment,)).fetchone() is None:
+                # Another process compacted it first
+                return 0
+            moved = []
+            writing = set()
+            try:
+                for row in conn.execute('SELECT id, offset, length FROM chunks WHERE segment = ?',
+                                        (segment,)).fetchall():
+                    source.seek(row['offset'])
+                    moved.append((row['id'], self._append(source.read(row['length']), writing)))
+                self._sync_segment()
+                with conn:
+                    conn.execute('BEGIN IMMEDIATE')
+                    self._account_written(conn, [location for _, location in moved])
+                    for chunk_id, (new_segment, offset, length) in moved:
+                        updated = conn.execute(
+                            'UPDATE chunks SET segment = ?, offset = ? WHERE id = ? AND segment = ?',
+                            (new_segment, offset, chunk_id, segment)
+                        ).rowcount
+                        if not updated:
+                            # Freed while it was being copied
+                            self._add_dead(conn, new_segment, length)
+                    conn.execute('DELETE FROM segments WHERE id = ?', (segment,))
+            finally:
+                self._finish_writes(writing)
+            os.remove(path)
+        return size - sum(location[2] for _, location in moved)
@@ -0,0 +1,200 @@
+"""
+Delta uploads
+rsync-style updates of a stored file. The server publishes the file's block
+signature (a weak Adler-32 and a strong BLAKE2b checksum per fixed-size
+block); a client holding a newer version scans it with a rolling Adler-32
+and sends references to blocks the server already has plus literal bytes for
+everything else. The server rebuilds the new version from the old one into a
+temp file and checks its SHA-256 before it replaces the stored file.
+
+Delta stream: a sequence of operations, each a one-byte opcode and a
+little-endian header, closed by OP_END:
+  C <first block:u32> <block count:u32>   copy consecutive base blocks
+  L <length:u32> <bytes>                  literal bytes
+  E                                       end of the delta
+"""
+import math
+import zlib
+import struct
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Block size bounds; in between, blocks are about the square root of the file
+# size so the signature and the literal overhead both grow slowly
+MIN_BLOCK_SIZE = 2048
+MAX_BLOCK_SIZE = 128 * 1024
+
+# Bytes of BLAKE2b kept per block; a false match is still caught by the
+# SHA-256 check of the rebuilt file
+STRONG_DIGEST_SIZE = 16
+
+OP_COPY = b'C'
+OP_LITERAL = b'L'
+OP_END = b'E'
+COPY_HEADER = struct.Struct('<II')
+LITERAL_HEADER = struct.Struct('<I')
+
+# Largest literal a single operation may carry
+MAX_LITERAL = 4 * 1024 * 1024
+
+# Bytes moved per step when copying base blocks or literals
+COPY_BLOCK = 1024 * 1024
+
+# Blocks kept across all cached signatures (roughly 100 bytes each)
+SIGNATURE_CACHE_BLOCKS = 200000
+
+
+class DeltaError(Exception):
+    """Raised for a malformed or stale delta; carries an HTTP status"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def block_size_for(size):
+    """Signature block size for a file of ``size`` bytes, a multiple of 1 KB"""
+    block_size = -(-math.isqrt(size) // 1024) * 1024
+    return min(max(block_size, MIN_BLOCK_SIZE), MAX_BLOCK_SIZE)
+
+
+def strong_checksum(block):
+    return hashlib.blake2b(block, digest_size=STRONG_DIGEST_SIZE).hexdigest()
+
+
+def file_signature(body, size):
+    """Block signature of a file read from ``body``
+
+    ``weak`` and ``strong`` hold the checksums of each block in order; the
+    last block may be short. ``sha256`` identifies the whole base file.
+    """
+    block_size = block_size_for(size)
+    weak = []
+    strong = []
+    hasher = hashlib.sha256()
+    while True:
+        block = body.read(block_size)
+        if not block:
+            break
+        # Stored files are read in whole blocks, short only at the end
+        while len(block) < block_size:
+            more = body.read(block_size - len(block))
+            if not more:
+                break
+            block += more
+        hasher.update(block)
+        weak.append(zlib.adler32(block))
+        strong.append(strong_checksum(block))
+    return {
+        'size': size,
+        'block_size': block_size,
+        'sha256': hasher.hexdigest(),
+        'weak': weak,
+        'strong': strong
+    }
+
+
+class SignatureCache:
+    """Recently computed signatures keyed by file version, least recently used evicted
+
+    Keys identify content (a SHA-256, or inode/size/mtime), so a changed file
+    simply misses and its old entry ages out.
+    """
+
+    def __init__(self, max_blocks=SIGNATURE_CACHE_BLOCKS):
+        self.max_blocks = max_blocks
+        self._entries = OrderedDict()
+        self._blocks = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            signature = self._entries.get(key)
+            if signature is not None:
+                self._entries.move_to_end(key)
+            return signature
+
+    def put(self, key, signature):
+        blocks = len(signature['weak'])
+        if blocks > self.max_blocks:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._blocks -= len(old['weak'])
+            self._entries[key] = signature
+            self._blocks += blocks
+            while self._blocks > self.max_blocks:
+                _, evicted = self._entries.popitem(last=False)
+                self._blocks -= len(evicted['weak'])
+
+
+def read_exact(stream, size):
+    """Read exactly ``size`` bytes from the delta stream"""
+    parts = []
+    while size > 0:
+        data = stream.read(min(size, COPY_BLOCK))
+        if not data:
+            raise DeltaError('Delta is truncated')
+        parts.append(data)
+        size -= len(data)
+    return b''.join(parts)
+
+
+def apply_delta(stream, open_base, base_size, block_size, out, limit=None):
+    """Rebuild a file from a delta stream, writing it to ``out``
+
+    ``open_base(offset, length)`` returns a readable window of the current
+    file. Returns (size, literal bytes, SHA-256 hex) of the rebuilt file.
+    """
+    if block_size < 1:
+        raise DeltaError('Invalid block size')
+    block_count = -(-base_size // block_size)
+    hasher = hashlib.sha256()
+    size = 0
+    literal_bytes = 0
+
+    def emit(data):
+        nonlocal size
+        size += len(data)
+        if limit is not None and size > limit:
+            raise DeltaError('Rebuilt file is too large', 413)
+        hasher.update(data)
+        out.write(data)
+
+    while True:
+        op = stream.read(1)
+        if op == OP_END:
+            break
+        if op == OP_COPY:
+            first, count = COPY_HEADER.unpack(read_exact(stream, COPY_HEADER.size))
+            if count == 0 or first + count > block_count:
+                raise DeltaError('Block reference out of range')
+            offset = first * block_size
+            length = min(count * block_size, base_size - offset)
+            body = open_base(offset, length)
+            try:
+                remaining = length
+                while remaining:
+                    data = body.read(min(remaining, COPY_BLOCK))
+                    if not data:
+                        raise DeltaError('File changed during the update', 409)
+                    emit(data)
+                    remaining -= len(data)
+            finally:
+                body.close()
+        elif op == OP_LITERAL:
+            (length,) = LITERAL_HEADER.unpack(read_exact(stream, LITERAL_HEADER.size))
+            if length > MAX_LITERAL:
+                raise DeltaError('Literal is too long')
+            literal_bytes += length
+            while length:
+                data = read_exact(stream, min(length, COPY_BLOCK))
+                emit(data)
+                length -= len(data)
+        elif not op:
+            raise DeltaError('Delta is truncated')
+        else:
+            raise DeltaError('Unknown delta operation')
+    return size, literal_bytes, hasher.hexdigest()
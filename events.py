@@ -0,0 +1,196 @@
+"""
+Server-Sent Events change feed
+Fans the catalog's change log out to long-lived /api/events connections.
+One thread per process tails the log; connections wait on it, either on a
+condition variable (threaded servers) or an asyncio event (ASGI mode), so an
+idle subscriber costs no thread under the ASGI server.
+"""
+import json
+import time
+import asyncio
+import threading
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Seconds between log checks when no local change woke the feed; changes
+# made by other worker processes are seen within this delay
+POLL_INTERVAL = 1.0
+
+# Idle seconds before a comment line keeps proxies from closing the stream
+HEARTBEAT_INTERVAL = 15
+
+# Client reconnect delay advertised in the stream, in milliseconds
+RETRY_MS = 3000
+
+# Recent changes kept in memory so subscribers rarely query the database
+BACKLOG = 1000
+
+# Changes sent per event batch
+BATCH_SIZE = 500
+
+# Seconds between change log compactions
+COMPACT_INTERVAL = 3600
+
+
+class ChangeFeed:
+    """Tails a FileCatalog change log and wakes subscribers on new entries
+
+    The tailing thread also compacts the log every COMPACT_INTERVAL, and
+    hands each batch of new entries to ``apply`` before subscribers see it,
+    so the in-memory catalog follows writes made by other processes.
+    """
+
+    def __init__(self, store, poll_interval=POLL_INTERVAL, backlog=BACKLOG, apply=None):
+        self.store = store
+        self.apply = apply
+        self.poll_interval = poll_interval
+        self._latest = store.latest_change()
+        # Every change after _complete_after is in _recent
+        self._complete_after = self._latest
+        self._recent = deque(maxlen=backlog)
+        self._cond = threading.Condition()
+        self._async_waiters = set()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def latest(self):
+        return self._latest
+
+    def wake(self, *args):
+        """Check the log now instead of at the next poll"""
+        self._wake.set()
+
+    def start(self):
+        """Start tailing now rather than on the first subscriber"""
+        self._ensure_running()
+
+    def _ensure_running(self):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='change-feed', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        next_compaction = time.monotonic() + COMPACT_INTERVAL
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            if time.monotonic() >= next_compaction:
+                next_compaction = time.monotonic() + COMPACT_INTERVAL
+                try:
+                    self.store.compact_changes()
+                except Exception as e:
+                    logger.error(f"Error compacting change log: {e}")
+            try:
+                rows = self.store.changes_since(self._latest, BACKLOG)
+            except Exception as e:
+                logger.error(f"Error reading change log: {e}")
+                continue
+            if not rows:
+                continue
+            if self.apply is not None:
+                try:
+                    self.apply(rows)
+                except Exception as e:
+                    logger.error(f"Error applying changes: {e}")
+            with self._cond:
+                self._recent.extend(rows)
+                if len(self._recent) == self._recent.maxlen:
+                    self._complete_after = max(self._complete_after, self._recent[0]['seq'] - 1)
+                self._latest = rows[-1]['seq']
+                self._cond.notify_all()
+                waiters = list(self._async_waiters)
+            for loop, event in waiters:
+                loop.call_soon_threadsafe(event.set)
+            if len(rows) == BACKLOG:
+                # More are waiting; read them straight away
+                self._wake.set()
+
+    def changes_after(self, seq, limit=BATCH_SIZE):
+        """Changes after ``seq``, or None when they are no longer in the log"""
+        with self._cond:
+            if seq >= self._complete_after:
+                return [row for row in self._recent if row['seq'] > seq][:limit]
+        rows = self.store.changes_since(seq, limit)
+        # Checked after the read so a compaction in between is noticed
+        if seq < self.store.change_floor():
+            return None
+        return rows
+
+    def wait(self, seq, timeout):
+        """Block until a change after ``seq`` arrives; False on timeout"""
+        self._ensure_running()
+        with self._cond:
+            return self._cond.wait_for(lambda: self._latest > seq, timeout)
+
+    async def wait_async(self, seq, timeout):
+        """Coroutine form of wait() that does not hold a thread"""
+        self._ensure_running()
+        event = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), event)
+        with self._cond:
+            if self._latest > seq:
+                return True
+            self._async_waiters.add(waiter)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._cond:
+                self._async_waiters.discard(waiter)
+
+
+def format_event(row):
+    """One change as an SSE message"""
+    payload = {'op': row['op'], 'name': row['name'], 'type': row['type']}
+    if row['op'] != 'remove':
+        payload['size'] = row['size']
+        payload['mtime'] = int(row['mtime'])
+    data = json.dumps(payload, separators=(',', ':'))
+    return f"id: {row['seq']}\nevent: change\ndata: {data}\n\n"
+
+
+class EventStream:
+    """text/event-stream response body
+
+    Iterates synchronously under threaded servers and asynchronously under
+    the ASGI bridge. Starts after ``last_id``; if that point has been
+    compacted out of the log the client gets a ``reset`` event and should
+    reload its listing.
+    """
+
+    def __init__(self, feed, last_id):
+        self.feed = feed
+        self.last_id = last_id
+
+    def _next_batch(self):
+        rows = self.feed.changes_after(self.last_id)
+        if rows is None:
+            self.last_id = self.feed.latest()
+            return f"id: {self.last_id}\nevent: reset\ndata: {{}}\n\n".encode('utf-8')
+        if rows:
+            self.last_id = rows[-1]['seq']
+            return ''.join(format_event(row) for row in rows).encode('utf-8')
+        return None
+
+    def __iter__(self):
+        yield f"retry: {RETRY_MS}\n\n".encode('utf-8')
+        while True:
+            batch = self._next_batch()
+            if batch:
+                yield batch
+            elif not self.feed.wait(self.last_id, HEARTBEAT_INTERVAL):
+                yield b': ping\n\n'
+
+    async def __aiter__(self):
+        yield f"retry: {RETRY_MS}\n\n".encode('utf-8')
+        while True:
+            batch = self._next_batch()
+            if batch:
+                yield batch
+            elif not await self.feed.wait_async(self.last_id, HEARTBEAT_INTERVAL):
+                yield b': ping\n\n'
@@ -37,6 +37,14 @@ a = Analysis(
         'flask', 'flask.templating', 'flask.json', 'jinja2', 'jinja2.ext',
         'markupsafe',
         
+        # Server: uvicorn loads its loop, protocol and lifespan modules by name
+        'uvicorn', 'uvicorn.loops', 'uvicorn.loops.auto', 'uvicorn.loops.asyncio',
+        'uvicorn.protocols', 'uvicorn.protocols.http', 'uvicorn.protocols.http.auto',
+        'uvicorn.protocols.http.h11_impl', 'uvicorn.protocols.http.httptools_impl',
+        'uvicorn.protocols.websockets', 'uvicorn.protocols.websockets.auto',
+        'uvicorn.lifespan', 'uvicorn.lifespan.on', 'uvicorn.lifespan.off',
+        'asgi', 'server',
+        
         # Standard library modules that might be missing
         'urllib', 'urllib.parse', 'socket', 'threading', 'logging',
         'datetime', 'io', 'secrets', 'string', 'os', 'sys', 'json',
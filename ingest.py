@@ -0,0 +1,125 @@
+"""
+Streaming upload ingestion
+Parses a multipart/form-data body incrementally and writes the file part
+straight into a temp file inside the upload folder, hashing as it goes, so
+each uploaded byte hits the disk once and memory use stays flat
+"""
+import os
+import time
+import hashlib
+import secrets
+import logging
+
+from werkzeug.sansio.multipart import MultipartDecoder, Data, Epilogue, File, NeedData
+
+logger = logging.getLogger(__name__)
+
+# Bytes pulled from the request body per read
+READ_SIZE = 1024 * 1024
+
+TEMP_PREFIX = '.ingest-'
+
+
+class IngestError(Exception):
+    """Raised when the upload body holds no acceptable file"""
+
+
+class IngestedFile:
+    """A file part that has been written to a temp file in the upload folder"""
+
+    __slots__ = ('filename', 'temp_path', 'size', 'sha256')
+
+    def __init__(self, filename, temp_path, size, sha256):
+        self.filename = filename
+        self.temp_path = temp_path
+        self.size = size
+        self.sha256 = sha256
+
+    def commit(self, target_path):
+        """Atomically move the temp file to its final name"""
+        os.replace(self.temp_path, target_path)
+
+    def discard(self):
+        try:
+            os.remove(self.temp_path)
+        except OSError:
+            pass
+
+
+def ingest_multipart(stream, boundary, folder, field_name='file', accept=None):
+    """Stream the ``field_name`` file part of a multipart body into ``folder``
+
+    ``accept`` is called with the client filename before any data is written
+    and may reject the part by returning False. Other parts are drained and
+    ignored. Returns an IngestedFile; the caller commits or discards it.
+    """
+    # Field values are never accumulated here, so the decoder's in-memory
+    # limit would only trip on its own read buffer
+    decoder = MultipartDecoder(boundary.encode('latin-1'))
+    result = None
+    target = None
+    hasher = None
+    size = 0
+    rejected_name = None
+
+    try:
+        finished = False
+        while not finished:
+            chunk = stream.read(READ_SIZE)
+            decoder.receive_data(chunk or None)
+            finished = not chunk
+
+            event = decoder.next_event()
+            while not isinstance(event, (Epilogue, NeedData)):
+                if isinstance(event, File):
+                    wanted = (result is None and target is None and event.name == field_name
+                              and event.filename)
+                    if wanted and accept is not None and not accept(event.filename):
+                        rejected_name = event.filename
+                        wanted = False
+                    if wanted:
+                        temp_path = os.path.join(folder, f"{TEMP_PREFIX}{secrets.token_hex(8)}")
+                        target = open(temp_path, 'wb')
+                        hasher = hashlib.sha256()
+                        size = 0
+                        result = IngestedFile(event.filename, temp_path, 0, None)
+                elif isinstance(event, Data) and target is not None and not target.closed:
+                    target.write(event.data)
+                    hasher.update(event.data)
+                    size += len(event.data)
+                    if not event.more_data:
+                        target.close()
+                        result.size = size
+                        result.sha256 = hasher.hexdigest()
+                event = decoder.next_event()
+    except Exception:
+        if target is not None:
+            target.close()
+        if result is not None:
+            result.discard()
+        raise
+
+    if result is None or result.sha256 is None:
+        if result is not None:
+            if target is not None:
+                target.close()
+            result.discard()
+        if rejected_name:
+            raise IngestError('File type not allowed.')
+        raise IngestError('No file selected.')
+
+    logger.debug(f"Ingested {result.filename}: {result.size} bytes, sha256 {result.sha256}")
+    return result
+
+
+def cleanup_temp_files(folder, max_age=3600):
+    """Remove temp files left behind by interrupted uploads"""
+    cutoff = time.time() - max_age
+    for name in os.listdir(folder):
+        if name.startswith(TEMP_PREFIX):
+            path = os.path.join(folder, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
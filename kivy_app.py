@@ -5,9 +5,18 @@ Replicates web app UI with media playback capabilities
 """
 
 import os
+import json
+import zlib
+import struct
+import hashlib
+import tempfile
+import itertools
+import queue
 import requests
 import threading
 import time
+from collections import deque
+from operator import itemgetter, ne, not_
 from datetime import datetime
 from urllib.parse import urljoin, quote
 import webbrowser
@@ -22,12 +31,16 @@ from kivy.uix.popup import Popup
 from kivy.uix.filechooser import FileChooserListView
 from kivy.uix.progressbar import ProgressBar
 from kivy.uix.scrollview import ScrollView
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
 from kivy.uix.image import Image
 from kivy.uix.video import Video
 from kivy.uix.slider import Slider
 from kivy.clock import Clock
 from kivy.core.window import Window
 from kivy.utils import platform
+from kivy.metrics import dp
 from kivy.network.urlrequest import UrlRequest
 from kivy.uix.screenmanager import ScreenManager, Screen
 from kivy.uix.dropdown import DropDown
@@ -41,6 +54,590 @@ except ImportError:
     filechooser = None
     notification = None
 
+def file_sha256(file_path, block_size=1024 * 1024):
+    """SHA-256 hex digest of a local file, read in blocks"""
+    hasher = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+# Files at least this large are uploaded as chunks over several connections
+PARALLEL_UPLOAD_MIN = 64 * 1024 * 1024
+
+# Concurrent connections and bytes per request for a parallel upload
+PARALLEL_STREAMS = 4
+PARALLEL_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Attempts per chunk before a parallel upload gives up
+PARALLEL_RETRIES = 3
+
+# Files smaller than this are re-sent whole rather than as a delta
+DELTA_MIN_SIZE = 1024 * 1024
+
+# Literal bytes gathered before they are written out as one delta operation
+DELTA_LITERAL_LIMIT = 1024 * 1024
+
+# Bytes of the local file held in memory at once while building a delta
+DELTA_WINDOW = 4 * 1024 * 1024
+
+
+def build_delta(file_path, signature, out, max_literal=None, progress=None):
+    """Write an rsync-style delta of a local file against a server signature
+
+    The file is scanned with a rolling Adler-32: wherever a block-sized
+    window matches a block of the server's copy a block reference is
+    written, everything else goes out as literal bytes (format in the
+    server's delta.py). Returns (literal bytes, SHA-256 of the file), or
+    None once more than ``max_literal`` bytes would have to be sent.
+    ``progress`` is called with the bytes read so far before each window
+    is scanned; an exception from it (a cancelled transfer) ends the scan.
+    """
+    block_size = signature['block_size']
+    last_block = len(signature['weak']) - 1
+    last_length = signature['size'] - last_block * block_size
+    blocks = {}
+    for index, (weak, strong) in enumerate(zip(signature['weak'], signature['strong'])):
+        blocks.setdefault(weak, {}).setdefault(strong, index)
+
+    hasher = hashlib.sha256()
+    literal = bytearray()
+    literal_total = 0
+    run = [0, 0]  # first block and length of the pending copy run
+
+    def flush_literal():
+        nonlocal literal_total
+        if literal:
+            out.write(b'L' + struct.pack('<I', len(literal)))
+            out.write(literal)
+            literal_total += len(literal)
+            literal.clear()
+
+    def flush_run():
+        if run[1]:
+            out.write(b'C' + struct.pack('<II', run[0], run[1]))
+            run[1] = 0
+
+    def copy_block(index):
+        flush_literal()
+        if run[1] and run[0] + run[1] == index:
+            run[1] += 1
+        else:
+            flush_run()
+            run[0], run[1] = index, 1
+
+    def match(window, weak):
+        candidates = blocks.get(weak)
+        if candidates:
+            index = candidates.get(hashlib.blake2b(window, digest_size=16).hexdigest())
+            # Only the server's last block may be short
+            if index is not None and (len(window) == block_size or index == last_block):
+                return index
+        return None
+
+    with open(file_path, 'rb') as f:
+        buffer = b''
+        pos = 0
+        eof = False
+        weak = None
+        scanned = 0
+        while True:
+            if len(buffer) - pos < block_size + 1 and not eof:
+                # Slide the window: drop what has been consumed and read on
+                data = f.read(DELTA_WINDOW)
+                hasher.update(data)
+                scanned += len(data)
+                if progress is not None:
+                    progress(scanned)
+                eof = not data
+                buffer = buffer[pos:] + data
+                pos = 0
+                continue
+            if len(buffer) - pos < block_size:
+                # The tail can only match the server's last block as a whole
+                tail = buffer[pos:]
+                index = match(tail, zlib.adler32(tail)) if tail and len(tail) == last_length else None
+                if index is not None:
+                    copy_block(index)
+                else:
+                    flush_run()
+                    literal += tail
+                break
+            if weak is None:
+                weak = zlib.adler32(buffer[pos:pos + block_size])
+                a, b = weak & 0xffff, weak >> 16
+            # Only a weak hit is worth slicing out the window for the strong check
+            index = match(buffer[pos:pos + block_size], weak) if weak in blocks else None
+            if index is not None:
+                copy_block(index)
+                pos += block_size
+                weak = None
+                continue
+            flush_run()
+            # No match here: emit one literal byte and roll the checksum on
+            old_byte = buffer[pos]
+            literal.append(old_byte)
+            if len(literal) >= DELTA_LITERAL_LIMIT:
+                flush_literal()
+                if max_literal is not None and literal_total > max_literal:
+                    return None
+            pos += 1
+            if pos + block_size > len(buffer):
+                weak = None
+                continue
+            a = (a - old_byte + buffer[pos + block_size - 1]) % 65521
+            b = (b - block_size * old_byte + a - 1) % 65521
+            weak = (b << 16) | a
+    flush_run()
+    flush_literal()
+    out.write(b'E')
+    return literal_total, hasher.hexdigest()
+
+
+# Concurrent connections and Range size for a segmented download
+DOWNLOAD_STREAMS = 4
+DOWNLOAD_SEGMENT_SIZE = 4 * 1024 * 1024
+
+# Attempts per segment before a download gives up
+DOWNLOAD_RETRIES = 3
+
+# Bytes written per step while a segment arrives
+DOWNLOAD_READ_SIZE = 256 * 1024
+
+
+class DownloadError(Exception):
+    """A download that cannot be completed as things stand"""
+
+
+class SegmentedDownload:
+    """Parallel, resumable download of one file
+
+    The file is fetched as DOWNLOAD_SEGMENT_SIZE Range requests spread over
+    DOWNLOAD_STREAMS connections of the shared session and written into a
+    sparse ``.part`` file next to the destination. Finished segments are
+    recorded in a ``.part.json`` state file, so starting the same download
+    again after a dropped connection, or a restart of the app, only fetches
+    the missing segments. The result is checked against the size and, when
+    the server's ETag carries it, the SHA-256 before it is renamed into place.
+    """
+
+    def __init__(self, session, url, save_path, progress=None):
+        self.session = session
+        self.url = url
+        self.save_path = save_path
+        self.part_path = save_path + '.part'
+        self.state_path = save_path + '.part.json'
+        self.progress = progress
+        self.lock = threading.Lock()
+        self.received = 0
+        self.failed = None
+
+    def run(self):
+        response = self.session.head(self.url, timeout=30)
+        if response.status_code != 200:
+            raise DownloadError(f"Server returned {response.status_code}")
+        size = int(response.headers.get('Content-Length', 0))
+        etag = response.headers.get('ETag')
+        # Without ranges or a validator the file can only come as one stream
+        ranged = response.headers.get('Accept-Ranges') == 'bytes' and bool(etag)
+        segment_size = DOWNLOAD_SEGMENT_SIZE if ranged else max(size, 1)
+
+        state = self._load_state(size, etag, segment_size)
+        if state is None:
+            state = {'url': self.url, 'size': size, 'etag': etag, 'segment_size': segment_size, 'done': []}
+            with open(self.part_path, 'wb') as f:
+                # Sparse until the segments land
+                f.truncate(size)
+            self._save_state(state)
+        done = set(state['done'])
+        pending = [index for index in range(-(-size // segment_size)) if index not in done]
+        self.received = size - sum(self._segment_length(index, size, segment_size) for index in pending)
+
+        def worker():
+            with open(self.part_path, 'r+b') as f:
+                while self.failed is None:
+                    with self.lock:
+                        if not pending:
+                            return
+                        index = pending.pop(0)
+                    try:
+                        self._fetch_segment(f, index, size, segment_size, etag if ranged else None)
+                        with self.lock:
+                            state['done'].append(index)
+                            self._save_state(state)
+                    except Exception as e:
+                        self.failed = e
+
+        workers = [threading.Thread(target=worker, daemon=True)
+                   for _ in range(min(DOWNLOAD_STREAMS, len(pending)))]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        if self.failed is not None:
+            raise self.failed
+        self._finish(size, etag)
+
+    @staticmethod
+    def _segment_length(index, size, segment_size):
+        return min(segment_size, size - index * segment_size)
+
+    def _load_state(self, size, etag, segment_size):
+        """Progress of an earlier attempt at the same version of the file"""
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (state.get('url') != self.url or state.get('size') != size or state.get('etag') != etag
+                or state.get('segment_size') != segment_size or not os.path.exists(self.part_path)):
+            return None
+        return state
+
+    def _save_state(self, state):
+        temp_path = self.state_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(temp_path, self.state_path)
+
+    def _advance(self, count):
+        with self.lock:
+            self.received += count
+            received = self.received
+        if self.progress:
+            self.progress(received)
+
+    def _fetch_segment(self, f, index, size, segment_size, etag):
+        start = index * segment_size
+        length = self._segment_length(index, size, segment_size)
+        headers = {}
+        if etag:
+            # If-Range: a changed file comes back whole instead of mixing versions
+            headers = {'Range': f"bytes={start}-{start + length - 1}", 'If-Range': etag}
+        for attempt in range(DOWNLOAD_RETRIES):
+            written = 0
+            try:
+                with self.session.get(self.url, headers=headers, stream=True, timeout=30) as response:
+                    if etag and response.status_code == 200:
+                        self._discard()
+                        raise DownloadError("File changed on the server; download it again")
+                    if response.status_code not in (200, 206):
+                        raise DownloadError(f"Server returned {response.status_code}")
+                    f.seek(start)
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_READ_SIZE):
+                        chunk = chunk[:length - written]
+                        f.write(chunk)
+                        written += len(chunk)
+                        self._advance(len(chunk))
+                if written == length:
+                    f.flush()
+                    os.fsync(f.fileno())
+                    return
+            except requests.RequestException:
+                pass
+            # Cut short: the segment starts over
+            self._advance(-written)
+        raise DownloadError("Connection lost; download again to resume")
+
+    def _finish(self, size, etag):
+        if os.path.getsize(self.part_path) != size:
+            self._discard()
+            raise DownloadError("Downloaded file has the wrong size")
+        validator = (etag or '').strip('"')
+        if validator.startswith('sha256-') and file_sha256(self.part_path) != validator[len('sha256-'):]:
+            self._discard()
+            raise DownloadError("Downloaded file is corrupt")
+        os.replace(self.part_path, self.save_path)
+        os.remove(self.state_path)
+
+    def _discard(self):
+        for path in (self.part_path, self.state_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+# Bytes of the source file held in memory at once while it is uploaded
+UPLOAD_READ_SIZE = 1024 * 1024
+
+# Seconds one write of a request body may stall before the upload fails, and
+# seconds to wait for the server's answer once the body is sent
+UPLOAD_STALL_TIMEOUT = 30
+UPLOAD_RESPONSE_TIMEOUT = 120
+
+
+class MultipartFileStream:
+    """Streaming multipart/form-data body carrying one file
+
+    Passed to ``requests`` as ``data``: the length is known up front, so the
+    request is sent with a Content-Length and the body is pulled through
+    ``read()`` as the socket drains. The file is read UPLOAD_READ_SIZE bytes
+    at a time, so memory stays flat however large it is, and ``progress``
+    gets the file bytes sent so far before each read; an exception it raises
+    (a cancel) aborts the request.
+    """
+
+    def __init__(self, file_path, filename, field='file', progress=None):
+        boundary = os.urandom(16).hex()
+        # Same escaping browsers use for names in a Content-Disposition
+        quoted = (filename.replace('\\', '\\\\').replace('"', '%22')
+                  .replace('\r', '%0D').replace('\n', '%0A'))
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+        self._head = (f'--{boundary}\r\n'
+                      f'Content-Disposition: form-data; name="{field}"; filename="{quoted}"\r\n'
+                      f'Content-Type: application/octet-stream\r\n\r\n').encode('utf-8')
+        self._tail = f'\r\n--{boundary}--\r\n'.encode('ascii')
+        self.file = open(file_path, 'rb')
+        self.file_size = os.fstat(self.file.fileno()).st_size
+        self.length = len(self._head) + self.file_size + len(self._tail)
+        self.progress = progress
+        self.sent = 0
+        self._stage = 'head'
+        self._block = b''
+        self._pos = 0
+
+    def __len__(self):
+        return self.length
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def read(self, size=-1):
+        if self._pos == len(self._block):
+            self._block = self._next_block()
+            self._pos = 0
+        end = len(self._block) if size is None or size < 0 else self._pos + size
+        data = self._block[self._pos:end]
+        self._pos += len(data)
+        return data
+
+    def _next_block(self):
+        if self._stage == 'head':
+            self._stage = 'file'
+            return self._head
+        if self._stage == 'file':
+            if self.sent < self.file_size:
+                if self.progress:
+                    self.progress(self.sent)
+                block = self.file.read(min(UPLOAD_READ_SIZE, self.file_size - self.sent))
+                if not block:
+                    raise IOError("File shrank while it was being uploaded")
+                self.sent += len(block)
+                return block
+            self._stage = 'done'
+            return self._tail
+        return b''
+
+# Transfers running at once; the rest wait in the queue
+TRANSFER_WORKERS = 3
+
+# Queue order: lower runs first, equal priorities in submission order
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 10
+
+# Seconds of history behind a transfer's throughput figure
+RATE_WINDOW = 5.0
+
+# Seconds between transfer status refreshes on screen
+TRANSFER_UI_INTERVAL = 0.5
+
+
+class TransferCancelled(Exception):
+    """Raised inside a transfer's work once it has been cancelled"""
+
+
+class TransferError(Exception):
+    """A transfer the server refused"""
+
+
+class Transfer:
+    """One queued upload, download or delete and its progress
+
+    The work function receives the transfer and reports bytes moved through
+    ``progress()``, which is also where a paused transfer waits and a
+    cancelled one stops.
+    """
+
+    def __init__(self, kind, name, work, total=0, priority=PRIORITY_NORMAL, on_finish=None):
+        self.kind = kind
+        self.name = name
+        self.work = work
+        self.total = total
+        self.priority = priority
+        self.on_finish = on_finish
+        self.state = 'queued'
+        self.phase = ''
+        self.done = 0
+        self.result = None
+        self.error = None
+        self.cancelled = False
+        self.started = None
+        self.finished = None
+        self._running = threading.Event()
+        self._running.set()
+        self._samples = deque()
+
+    def progress(self, done=None, phase=None):
+        """Record progress; blocks while paused, raises once cancelled"""
+        if done is not None:
+            self.done = done
+            now = time.monotonic()
+            self._samples.append((now, done))
+            while len(self._samples) > 2 and now - self._samples[0][0] > RATE_WINDOW:
+                self._samples.popleft()
+        if phase is not None:
+            self.phase = phase
+        if not self._running.is_set():
+            self.state = 'paused'
+            self._running.wait()
+        if self.cancelled:
+            raise TransferCancelled()
+        self.state = 'running'
+
+    def rate(self):
+        """Bytes per second over the last RATE_WINDOW seconds"""
+        if self.state != 'running' or len(self._samples) < 2:
+            return 0
+        (first_time, first_done), (last_time, last_done) = self._samples[0], self._samples[-1]
+        elapsed = last_time - first_time
+        return (last_done - first_done) / elapsed if elapsed > 0 else 0
+
+    def eta(self):
+        """Seconds left at the current rate, or None when unknown"""
+        rate = self.rate()
+        if not rate or not self.total:
+            return None
+        return max(self.total - self.done, 0) / rate
+
+    @property
+    def active(self):
+        return self.state in ('queued', 'running', 'paused')
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+
+class TransferManager:
+    """Runs transfers on a fixed pool of worker threads
+
+    Transfers wait in a priority queue so a bulk upload of hundreds of files
+    keeps only TRANSFER_WORKERS of them on the link at once. Finished
+    transfers call ``on_finish`` from the worker thread.
+    """
+
+    def __init__(self, workers=TRANSFER_WORKERS):
+        self.queue = queue.PriorityQueue()
+        self.order = itertools.count()
+        self.lock = threading.Lock()
+        self.transfers = []
+        for number in range(workers):
+            threading.Thread(target=self._worker, name=f'transfer-{number}', daemon=True).start()
+
+    def submit(self, kind, name, work, total=0, priority=PRIORITY_NORMAL, on_finish=None):
+        transfer = Transfer(kind, name, work, total, priority, on_finish)
+        with self.lock:
+            self.transfers.append(transfer)
+        self.queue.put((priority, next(self.order), transfer))
+        return transfer
+
+    def _worker(self):
+        while True:
+            transfer = self.queue.get()[2]
+            if transfer.cancelled:
+                continue
+            if transfer.paused:
+                # Paused before it started: resume() queues it again
+                transfer.state = 'paused'
+                continue
+            transfer.state = 'running'
+            transfer.started = time.monotonic()
+            try:
+                transfer.result = transfer.work(transfer)
+                transfer.state = 'done'
+            except TransferCancelled:
+                transfer.state = 'cancelled'
+            except Exception as e:
+                transfer.error = e
+                transfer.state = 'cancelled' if transfer.cancelled else 'failed'
+            transfer.finished = time.monotonic()
+            if transfer.on_finish:
+                transfer.on_finish(transfer)
+
+    def pause(self, transfer):
+        if transfer.active:
+            transfer._running.clear()
+
+    def resume(self, transfer):
+        was_waiting = transfer.state == 'paused' and transfer.started is None
+        transfer._running.set()
+        if was_waiting:
+            transfer.state = 'queued'
+            self.queue.put((transfer.priority, next(self.order), transfer))
+
+    def cancel(self, transfer):
+        if not transfer.active:
+            return
+        transfer.cancelled = True
+        if transfer.started is None:
+            transfer.state = 'cancelled'
+            transfer.finished = time.monotonic()
+            if transfer.on_finish:
+                transfer.on_finish(transfer)
+        # A paused transfer wakes up to notice the cancel
+        transfer._running.set()
+
+    def cancel_all(self):
+        for transfer in self.snapshot():
+            self.cancel(transfer)
+
+    def snapshot(self):
+        with self.lock:
+            # Finished transfers stay listed for a minute
+            now = time.monotonic()
+            self.transfers = [t for t in self.transfers if t.active or now - t.finished < 60]
+            return list(self.transfers)
+
+    def stats(self):
+        """Counts, combined throughput and ETA of the unfinished transfers"""
+        transfers = [t for t in self.snapshot() if t.active]
+        running = [t for t in transfers if t.state == 'running']
+        rate = sum(t.rate() for t in running)
+        remaining = sum(max(t.total - t.done, 0) for t in transfers)
+        return {
+            'running': len(running),
+            'queued': sum(1 for t in transfers if t.state == 'queued'),
+            'paused': sum(1 for t in transfers if t.state == 'paused'),
+            'rate': rate,
+            'eta': remaining / rate if rate else None
+        }
+
+
+def format_duration(seconds):
+    """Format an ETA as m:ss or h:mm:ss"""
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+def format_size(size_bytes):
+    """Format file size in human readable format"""
+    if size_bytes == 0:
+        return "0B"
+    size_names = ["B", "KB", "MB", "GB", "TB"]
+    i = 0
+    while size_bytes >= 1024 and i < len(size_names) - 1:
+        size_bytes /= 1024.0
+        i += 1
+    return f"{size_bytes:.1f}{size_names[i]}"
+
 class ServerConnectionScreen(BoxLayout):
     """Server connection and authentication screen - matches web app styling"""
     
@@ -212,16 +809,56 @@ class ServerConnectionScreen(BoxLayout):
         self.status_label.text = 'Connecting...'
         self.app_instance.connect_to_server(url, password)
 
-class FileListItem(BoxLayout):
-    """File list item matching web app design with media support"""
+# Listing refreshes touching more rows than this replace the list wholesale
+FILE_LIST_MAX_PATCH = 500
+
+
+def patch_file_list(rows, files):
+    """Bring ``rows`` (the file list's data) in line with ``files`` in place
+
+    Only removed, added and changed entries are touched, so the list view
+    redraws just those rows. Returns False, leaving ``rows`` as it was, when
+    the order changed or so much did that replacing the list is cheaper.
+    """
+    if rows == files:
+        return True
+    # Flags and positions come from map/compress: 100k rows stay well under a frame
+    old_list = list(map(itemgetter('name'), rows))
+    new_list = list(map(itemgetter('name'), files))
+    old_kept = list(map(set(new_list).__contains__, old_list))
+    new_kept = list(map(set(old_list).__contains__, new_list))
+    kept_old = list(itertools.compress(rows, old_kept))
+    kept_new = list(itertools.compress(files, new_kept))
+    if list(map(itemgetter('name'), kept_old)) != list(map(itemgetter('name'), kept_new)):
+        return False
+    removed = list(itertools.compress(range(len(rows)), map(not_, old_kept)))
+    added = list(itertools.compress(range(len(files)), map(not_, new_kept)))
+    changed = list(itertools.compress(itertools.compress(range(len(files)), new_kept),
+                                      map(ne, kept_old, kept_new)))
+    if len(removed) + len(added) + len(changed) > FILE_LIST_MAX_PATCH:
+        return False
+    
+    for index in reversed(removed):
+        del rows[index]
+    # Ascending inserts: every row before the position is already in place
+    for index in added:
+        rows.insert(index, files[index])
+    for index in changed:
+        rows[index] = files[index]
+    return True
+
+
+class FileListItem(RecycleDataViewBehavior, BoxLayout):
+    """File list row matching web app design with media support
+
+    Rows are recycled by the file list's RecycleView: only the visible ones
+    exist, and refresh_view_attrs points a row at another file's entry.
+    """
     
-    def __init__(self, file_info, app_instance, **kwargs):
+    def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.file_info = file_info
-        self.app_instance = app_instance
+        self.file_info = None
         self.orientation = 'vertical'
-        self.size_hint_y = None
-        self.height = '80dp'
         self.padding = 8
         self.spacing = 4
         
@@ -233,15 +870,12 @@ class FileListItem(BoxLayout):
         )
         
         # File icon (based on type)
-        icon_text = self.get_file_icon(file_info['name'])
-        icon = Label(
-            text=icon_text,
+        self.icon = Label(
             font_size='20sp',
             size_hint_x=None,
-            width='40dp',
-            color=self.get_file_color(file_info['name'])
+            width='40dp'
         )
-        main_row.add_widget(icon)
+        main_row.add_widget(self.icon)
         
         # File info section
         info_section = BoxLayout(
@@ -250,8 +884,7 @@ class FileListItem(BoxLayout):
         )
         
         # File name
-        name_label = Label(
-            text=file_info['name'],
+        self.name_label = Label(
             font_size='14sp',
             text_size=(None, None),
             halign='left',
@@ -260,9 +893,7 @@ class FileListItem(BoxLayout):
         )
         
         # File size and date
-        size_date = f"{file_info.get('size', 'Unknown')} • {file_info.get('modified', '')}"
-        details_label = Label(
-            text=size_date,
+        self.details_label = Label(
             font_size='10sp',
             color=(0.6, 0.6, 0.6, 1),
             text_size=(None, None),
@@ -271,8 +902,8 @@ class FileListItem(BoxLayout):
             size_hint_y=0.3
         )
         
-        info_section.add_widget(name_label)
-        info_section.add_widget(details_label)
+        info_section.add_widget(self.name_label)
+        info_section.add_widget(self.details_label)
         main_row.add_widget(info_section)
         
         # Action buttons
@@ -282,21 +913,9 @@ class FileListItem(BoxLayout):
             spacing=5
         )
         
-        # View/Play button
-        if self.is_media_file(file_info['name']):
-            view_btn = Button(
-                text='Play',
-                size_hint_x=0.5,
-                background_color=(0.2, 0.8, 0.2, 1)  # Green for media
-            )
-            view_btn.bind(on_press=self.play_media)
-        else:
-            view_btn = Button(
-                text='View',
-                size_hint_x=0.5,
-                background_color=(0.2, 0.6, 1.0, 1)  # Blue for documents
-            )
-            view_btn.bind(on_press=self.view_file)
+        # View/Play button, set up per file
+        self.view_btn = Button(size_hint_x=0.5)
+        self.view_btn.bind(on_press=self.open_file)
         
         # Download button
         download_btn = Button(
@@ -314,21 +933,27 @@ class FileListItem(BoxLayout):
         )
         delete_btn.bind(on_press=self.delete_file)
         
-        action_buttons.add_widget(view_btn)
+        action_buttons.add_widget(self.view_btn)
         action_buttons.add_widget(download_btn)
         action_buttons.add_widget(delete_btn)
         main_row.add_widget(action_buttons)
         
         self.add_widget(main_row)
-        
-        # Media controls (hidden by default)
-        self.media_controls = BoxLayout(
-            orientation='horizontal',
-            size_hint_y=None,
-            height='0dp',
-            spacing=5
-        )
-        self.add_widget(self.media_controls)
+    
+    def refresh_view_attrs(self, rv, index, data):
+        """Show the file entry ``data`` in this row"""
+        self.file_info = data
+        name = data['name']
+        self.icon.text = self.get_file_icon(name)
+        self.icon.color = self.get_file_color(name)
+        self.name_label.text = name
+        self.details_label.text = f"{data.get('size', 'Unknown')} • {data.get('modified', '')}"
+        if self.is_media_file(name):
+            self.view_btn.text = 'Play'
+            self.view_btn.background_color = (0.2, 0.8, 0.2, 1)  # Green for media
+        else:
+            self.view_btn.text = 'View'
+            self.view_btn.background_color = (0.2, 0.6, 1.0, 1)  # Blue for documents
     
     def get_file_icon(self, filename):
         """Get icon based on file type"""
@@ -362,21 +987,20 @@ class FileListItem(BoxLayout):
         ext = filename.lower().split('.')[-1] if '.' in filename else ''
         return ext in ['mp4', 'avi', 'mov', 'wmv', 'mkv', 'webm', 'mp3', 'wav', 'flac', 'aac', 'ogg']
     
-    def play_media(self, instance):
-        """Play media file with built-in player"""
-        self.app_instance.play_media_file(self.file_info)
-    
-    def view_file(self, instance):
-        """View file content"""
-        self.app_instance.view_file(self.file_info)
+    def open_file(self, instance):
+        """Play media files with the built-in player, view anything else"""
+        if self.is_media_file(self.file_info['name']):
+            App.get_running_app().play_media_file(self.file_info)
+        else:
+            App.get_running_app().view_file(self.file_info)
     
     def download_file(self, instance):
         """Download file to device"""
-        self.app_instance.download_file(self.file_info)
+        App.get_running_app().download_file(self.file_info)
     
     def delete_file(self, instance):
         """Delete file with confirmation"""
-        self.app_instance.confirm_delete(self.file_info)
+        App.get_running_app().confirm_delete(self.file_info)
 
 
 
@@ -446,6 +1070,12 @@ class FileManagerScreen(BoxLayout):
         )
         refresh_btn.bind(on_press=self.refresh_files)
         
+        transfers_btn = Button(
+            text='Transfers',
+            background_color=(0.6, 0.4, 0.9, 1)
+        )
+        transfers_btn.bind(on_press=self.show_transfers)
+        
         disconnect_btn = Button(
             text='Disconnect',
             background_color=(1, 0.4, 0.4, 1)
@@ -454,21 +1084,31 @@ class FileManagerScreen(BoxLayout):
         
         action_buttons.add_widget(upload_btn)
         action_buttons.add_widget(refresh_btn)
+        action_buttons.add_widget(transfers_btn)
         action_buttons.add_widget(disconnect_btn)
         header.add_widget(action_buttons)
         
         self.add_widget(header)
         
-        # File list with scroll
-        self.file_scroll = ScrollView()
-        self.file_list = BoxLayout(
+        # File list: a RecycleView only builds rows for what is on screen
+        self.file_area = BoxLayout()
+        self.file_list = RecycleView(viewclass=FileListItem)
+        file_layout = RecycleBoxLayout(
             orientation='vertical',
+            default_size=(None, dp(80)),
+            default_size_hint=(1, None),
             size_hint_y=None,
             spacing=1
         )
-        self.file_list.bind(minimum_height=self.file_list.setter('height'))
-        self.file_scroll.add_widget(self.file_list)
-        self.add_widget(self.file_scroll)
+        file_layout.bind(minimum_height=file_layout.setter('height'))
+        self.file_list.add_widget(file_layout)
+        self.no_files = Label(
+            text='No files on server',
+            color=(0.7, 0.7, 0.7, 1),
+            font_size='14sp'
+        )
+        self.file_area.add_widget(self.file_list)
+        self.add_widget(self.file_area)
         
         # Status bar matching web app
         status_bar = BoxLayout(
@@ -509,7 +1149,8 @@ class FileManagerScreen(BoxLayout):
             try:
                 filechooser.open_file(
                     on_selection=self.handle_file_selection,
-                    title="Select file to upload"
+                    title="Select files to upload",
+                    multiple=True
                 )
             except Exception as e:
                 self.show_popup("Error", f"File chooser error: {str(e)}")
@@ -520,7 +1161,7 @@ class FileManagerScreen(BoxLayout):
         """Fallback file chooser"""
         content = BoxLayout(orientation='vertical')
         
-        filechooser_widget = FileChooserListView()
+        filechooser_widget = FileChooserListView(multiselect=True)
         content.add_widget(filechooser_widget)
         
         buttons = BoxLayout(
@@ -544,7 +1185,7 @@ class FileManagerScreen(BoxLayout):
         
         def select_file(instance):
             if filechooser_widget.selection:
-                self.handle_file_selection([filechooser_widget.selection[0]])
+                self.handle_file_selection(filechooser_widget.selection)
             popup.dismiss()
         
         def cancel(instance):
@@ -556,9 +1197,8 @@ class FileManagerScreen(BoxLayout):
         popup.open()
     
     def handle_file_selection(self, selection):
-        """Handle selected file for upload"""
-        if selection:
-            file_path = selection[0]
+        """Queue every selected file for upload"""
+        for file_path in selection or []:
             self.app_instance.upload_file_to_server(file_path)
     
     def refresh_files(self, instance=None):
@@ -567,28 +1207,113 @@ class FileManagerScreen(BoxLayout):
         self.app_instance.load_files_from_server()
     
     def update_file_list(self, files):
-        """Update UI with file list from server"""
-        self.file_list.clear_widgets()
+        """Update UI with file list from server, changing only what differs"""
+        if not patch_file_list(self.file_list.data, files):
+            self.file_list.data = files
+        
+        shown = self.no_files if not files else self.file_list
+        if shown.parent is None:
+            self.file_area.clear_widgets()
+            self.file_area.add_widget(shown)
         
         if not files:
-            no_files = Label(
-                text='No files on server',
-                size_hint_y=None,
-                height='60dp',
-                color=(0.7, 0.7, 0.7, 1),
-                font_size='14sp'
-            )
-            self.file_list.add_widget(no_files)
             self.status_label.text = 'No files found'
             self.file_count.text = ''
         else:
-            for file_info in files:
-                file_item = FileListItem(file_info, self.app_instance)
-                self.file_list.add_widget(file_item)
-            
             self.status_label.text = 'Files loaded successfully'
             self.file_count.text = f'{len(files)} files'
     
+    def show_transfer_stats(self, stats):
+        """Combined progress of the active transfers in the status bar"""
+        parts = [f"{stats['running']} running"]
+        if stats['queued']:
+            parts.append(f"{stats['queued']} queued")
+        if stats['paused']:
+            parts.append(f"{stats['paused']} paused")
+        if stats['rate']:
+            parts.append(f"{format_size(stats['rate'])}/s")
+        if stats['eta'] is not None:
+            parts.append(f"ETA {format_duration(stats['eta'])}")
+        self.status_label.text = ' · '.join(parts)
+    
+    def show_transfers(self, instance=None):
+        """Popup listing transfers with their progress, pause and cancel"""
+        manager = self.app_instance.transfers
+        content = BoxLayout(orientation='vertical', spacing=5)
+        scroll = ScrollView()
+        rows_box = BoxLayout(orientation='vertical', size_hint_y=None, spacing=5)
+        rows_box.bind(minimum_height=rows_box.setter('height'))
+        scroll.add_widget(rows_box)
+        content.add_widget(scroll)
+        
+        buttons = BoxLayout(orientation='horizontal', size_hint_y=None, height='48dp', spacing=5)
+        cancel_all_btn = Button(text='Cancel all', background_color=(1, 0.4, 0.4, 1))
+        cancel_all_btn.bind(on_press=lambda instance: manager.cancel_all())
+        close_btn = Button(text='Close')
+        buttons.add_widget(cancel_all_btn)
+        buttons.add_widget(close_btn)
+        content.add_widget(buttons)
+        
+        popup = Popup(title='Transfers', content=content, size_hint=(0.95, 0.8))
+        rows = {}
+        
+        def toggle_pause(transfer):
+            if transfer.paused:
+                manager.resume(transfer)
+            else:
+                manager.pause(transfer)
+        
+        def add_row(transfer):
+            row = BoxLayout(orientation='horizontal', size_hint_y=None, height='56dp', spacing=5)
+            details = BoxLayout(orientation='vertical', size_hint_x=0.7)
+            label = Label(font_size='12sp', halign='left', valign='middle')
+            label.bind(size=lambda widget, size: setattr(widget, 'text_size', size))
+            bar = ProgressBar(max=100)
+            details.add_widget(label)
+            details.add_widget(bar)
+            pause_btn = Button(text='Pause', size_hint_x=0.15)
+            pause_btn.bind(on_press=lambda instance: toggle_pause(transfer))
+            cancel_btn = Button(text='Cancel', size_hint_x=0.15, background_color=(1, 0.5, 0.5, 1))
+            cancel_btn.bind(on_press=lambda instance: manager.cancel(transfer))
+            row.add_widget(details)
+            row.add_widget(pause_btn)
+            row.add_widget(cancel_btn)
+            rows_box.add_widget(row)
+            rows[transfer] = (row, label, bar, pause_btn, cancel_btn)
+        
+        def refresh(dt=None):
+            transfers = manager.snapshot()
+            for transfer in list(rows):
+                if transfer not in transfers:
+                    rows_box.remove_widget(rows.pop(transfer)[0])
+            for transfer in transfers:
+                if transfer not in rows:
+                    add_row(transfer)
+                row, label, bar, pause_btn, cancel_btn = rows[transfer]
+                percent = transfer.done * 100 // transfer.total if transfer.total else 0
+                status = transfer.phase if transfer.state == 'running' and transfer.phase else transfer.state
+                text = f"{transfer.kind.capitalize()} {transfer.name} - {status}"
+                if transfer.total:
+                    text += f" {percent}% of {format_size(transfer.total)}"
+                rate = transfer.rate()
+                if rate:
+                    text += f" · {format_size(rate)}/s"
+                    eta = transfer.eta()
+                    if eta is not None:
+                        text += f" · {format_duration(eta)} left"
+                if transfer.state == 'failed':
+                    text += f": {transfer.error}"
+                label.text = text
+                bar.value = 100 if transfer.state == 'done' else percent
+                pause_btn.text = 'Resume' if transfer.paused else 'Pause'
+                pause_btn.disabled = cancel_btn.disabled = not transfer.active
+        
+        refresh()
+        refresh_event = Clock.schedule_interval(refresh, TRANSFER_UI_INTERVAL)
+        popup.bind(on_dismiss=lambda instance: refresh_event.cancel())
+        close_btn.bind(on_press=popup.dismiss)
+        popup.open()
+    
     def disconnect(self, instance):
         """Disconnect from server"""
         self.app_instance.disconnect_from_server()
@@ -775,9 +1500,21 @@ class WiFiFileServerApp(App):
         super().__init__(**kwargs)
         self.title = 'WiFi File Server'
         self.server_url = None
-        self.session = requests.Session()
+        self.session = self.new_session()
         self.authenticated = False
         self.files_data = []
+        self.listing_cache = {}
+        self.transfers = TransferManager()
+        self.transfer_status_event = None
+    
+    def new_session(self):
+        """HTTP session whose connection pool has room for every transfer stream"""
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_maxsize=TRANSFER_WORKERS * max(PARALLEL_STREAMS, DOWNLOAD_STREAMS) + 2)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
     
     def build(self):
         """Build the app interface"""
@@ -857,30 +1594,59 @@ class WiFiFileServerApp(App):
     
     def disconnect_from_server(self):
         """Disconnect from server"""
+        self.transfers.cancel_all()
         self.server_url = None
         self.authenticated = False
-        self.session = requests.Session()
+        self.session = self.new_session()
+        self.listing_cache = {}
         self.show_connection_screen()
     
     def load_files_from_server(self):
-        """Load file list from server by scraping the files page"""
+        """Load file list from the paginated JSON listing API"""
         def load_thread():
             try:
-                response = self.session.get(f"{self.server_url}/files", timeout=10)
-                if response.status_code == 200:
-                    import re
-                    files_data = []
-                    download_pattern = r'href="/download/([^"]*)"'
-                    matches = re.findall(download_pattern, response.text)
+                files_data = []
+                cursor = None
+                while True:
+                    params = {'limit': 1000}
+                    if cursor:
+                        params['cursor'] = cursor
                     
-                    for filename in matches:
-                        from urllib.parse import unquote
-                        decoded_name = unquote(filename)
-                        files_data.append({'name': decoded_name, 'size': 'Unknown', 'modified': ''})
+                    # Revalidate pages we already hold instead of downloading them again
+                    headers = {}
+                    cached = self.listing_cache.get(cursor)
+                    if cached:
+                        headers['If-None-Match'] = cached[0]
                     
-                    Clock.schedule_once(lambda dt: self.files_loaded(files_data))
-                else:
-                    Clock.schedule_once(lambda dt: self.files_load_failed("Failed to load files"))
+                    response = self.session.get(f"{self.server_url}/api/files", params=params,
+                                                headers=headers, timeout=10)
+                    if response.status_code == 304 and cached:
+                        page = cached[1]
+                    elif response.status_code == 200 and 'json' in response.headers.get('Content-Type', ''):
+                        page = response.json()
+                        if response.headers.get('ETag'):
+                            self.listing_cache[cursor] = (response.headers['ETag'], page)
+                    else:
+                        Clock.schedule_once(lambda dt: self.files_load_failed("Failed to load files"))
+                        return
+                    
+                    fields = page['fields']
+                    for row in page['files']:
+                        entry = dict(zip(fields, row))
+                        files_data.append({
+                            'name': entry['name'],
+                            'size': format_size(entry['size']),
+                            'size_bytes': entry['size'],
+                            'mtime': entry['mtime'],
+                            'modified': datetime.fromtimestamp(entry['mtime']).strftime('%Y-%m-%d %H:%M'),
+                            'type': entry['type']
+                        })
+                    
+                    cursor = page.get('next')
+                    if not cursor:
+                        break
+                
+                Clock.schedule_once(lambda dt: self.files_loaded(files_data))
             except Exception as e:
                 Clock.schedule_once(lambda dt: self.files_load_failed(f"Connection error: {str(e)}"))
         
@@ -896,68 +1662,194 @@ class WiFiFileServerApp(App):
             self.current_file_manager.status_label.text = error_message
     
     def upload_file_to_server(self, file_path):
-        def upload_thread():
+        """Queue an upload; the transfer manager runs a few at a time"""
+        self.transfers.submit('upload', os.path.basename(file_path),
+                              lambda transfer: self.run_upload(transfer, file_path),
+                              total=os.path.getsize(file_path),
+                              on_finish=lambda transfer: self.transfer_finished(transfer, self.upload_success))
+        self.start_transfer_status()
+    
+    def run_upload(self, transfer, file_path):
+        """Upload one file, trying the cheapest way first; returns the stored name"""
+        filename = transfer.name
+        size = transfer.total
+        
+        # A new version of a file the server has: send only what changed
+        transfer.progress(phase='Comparing')
+        if self.upload_delta(file_path, filename, transfer):
+            transfer.progress(size)
+            return filename
+        
+        # Skip the transfer when the server already has this content
+        transfer.progress(phase='Checking')
+        response = self.session.post(f"{self.server_url}/api/uploads/by-hash", json={
+            'filename': filename,
+            'size': size,
+            'sha256': file_sha256(file_path)
+        }, timeout=30)
+        if response.status_code == 201:
+            transfer.progress(size)
+            return response.json()['name']
+        
+        transfer.progress(phase='Uploading')
+        # One stream rarely fills a fast link, so big files go over several
+        if size >= PARALLEL_UPLOAD_MIN:
+            stored_name = self.upload_parallel(file_path, filename, transfer.progress)
+            if stored_name:
+                return stored_name
+        
+        # Streamed body: progress as it goes, and only a stalled write times out
+        with MultipartFileStream(file_path, filename, progress=transfer.progress) as body:
+            response = self.session.post(f"{self.server_url}/upload", data=body,
+                                         headers={'Content-Type': body.content_type},
+                                         timeout=(UPLOAD_STALL_TIMEOUT, UPLOAD_RESPONSE_TIMEOUT))
+        if response.status_code != 200:
+            raise TransferError("Upload failed")
+        transfer.progress(size)
+        return filename
+    
+    def upload_parallel(self, file_path, filename, progress=None):
+        """Upload a large file as chunks sent over several connections at once
+
+        Uses a resumable upload session: the server preallocates the file and
+        writes each chunk in place. Returns the stored name, or None when the
+        upload could not be finished; an exception raised by ``progress``
+        (a cancel) abandons the upload and is raised again.
+        """
+        size = os.path.getsize(file_path)
+        response = self.session.post(f"{self.server_url}/api/uploads",
+                                     json={'filename': filename, 'size': size}, timeout=30)
+        if response.status_code != 201:
+            return None
+        upload = response.json()
+        upload_url = f"{self.server_url}/api/uploads/{upload['id']}"
+        # Chunks have to cover whole blocks of the session
+        block_size = upload['block_size']
+        chunk_size = max(PARALLEL_CHUNK_SIZE // block_size, 1) * block_size
+        offsets = list(range(0, size, chunk_size))
+        lock = threading.Lock()
+        failed = []
+        sent = [0]
+        
+        def send_chunks():
             try:
-                filename = os.path.basename(file_path)
-                Clock.schedule_once(lambda dt: self.update_upload_status(f"Uploading {filename}..."))
-                
-                with open(file_path, 'rb') as f:
-                    files = {'file': (filename, f)}
-                    response = self.session.post(f"{self.server_url}/upload", files=files, timeout=30)
-                
-                if response.status_code == 200:
-                    Clock.schedule_once(lambda dt: self.upload_success(filename))
-                else:
-                    Clock.schedule_once(lambda dt: self.upload_failed("Upload failed"))
+                send_from(open(file_path, 'rb'))
             except Exception as e:
-                Clock.schedule_once(lambda dt: self.upload_failed(f"Upload error: {str(e)}"))
-        
-        threading.Thread(target=upload_thread, daemon=True).start()
+                failed.append(e)
+        
+        def send_from(f):
+            with f:
+                while not failed:
+                    with lock:
+                        if not offsets:
+                            return
+                        offset = offsets.pop(0)
+                    f.seek(offset)
+                    chunk = f.read(chunk_size)
+                    headers = {'Content-Range': f"bytes {offset}-{offset + len(chunk) - 1}/{size}"}
+                    for attempt in range(PARALLEL_RETRIES):
+                        try:
+                            if self.session.put(upload_url, data=chunk, headers=headers, timeout=60).status_code == 200:
+                                break
+                        except requests.RequestException:
+                            pass
+                    else:
+                        failed.append(None)
+                        return
+                    with lock:
+                        sent[0] += len(chunk)
+                        total_sent = sent[0]
+                    if progress:
+                        progress(total_sent)
+        
+        workers = [threading.Thread(target=send_chunks, daemon=True)
+                   for _ in range(min(PARALLEL_STREAMS, len(offsets)))]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        
+        if not failed:
+            response = self.session.post(f"{upload_url}/commit", timeout=120)
+            if response.status_code == 200:
+                return response.json()['name']
+        self.session.delete(upload_url, timeout=30)
+        for error in failed:
+            if error is not None:
+                raise error
+        return None
     
-    def update_upload_status(self, message):
-        if hasattr(self, 'current_file_manager'):
-            self.current_file_manager.status_label.text = message
+    def upload_delta(self, file_path, filename, transfer):
+        """Replace the server's copy of ``filename`` with a delta upload
+
+        Returns False when there is no copy to update or too little of it
+        can be reused, so the caller uploads the whole file instead. The
+        listing's size and mtime decide whether a scan is worth starting.
+        """
+        stats = os.stat(file_path)
+        size = stats.st_size
+        existing = [f for f in getattr(self, 'files_data', []) if f['name'] == filename]
+        if not existing or size < DELTA_MIN_SIZE:
+            return False
+        server_size = existing[0]['size_bytes']
+        if server_size == size and int(stats.st_mtime) <= existing[0].get('mtime', 0):
+            # Not changed since the server's copy was stored; the hash check
+            # that follows finds it without reading the file twice
+            return False
+        if server_size < size - size // 2:
+            # At least half the file would be literal bytes
+            return False
+        
+        response = self.session.get(f"{self.server_url}/api/delta/{quote(filename)}", timeout=60)
+        if response.status_code != 200:
+            return False
+        signature = response.json()
+        
+        with tempfile.TemporaryFile() as delta:
+            result = build_delta(file_path, signature, delta, max_literal=size // 2,
+                                 progress=transfer.progress)
+            if result is None:
+                return False
+            literal_bytes, digest = result
+            delta.seek(0)
+            transfer.progress(phase=f"Uploading changes ({format_size(literal_bytes)})")
+            response = self.session.put(f"{self.server_url}/api/delta/{quote(filename)}", data=delta, headers={
+                'Content-Type': 'application/octet-stream',
+                'X-Delta-Block-Size': str(signature['block_size']),
+                'X-Delta-Base': signature['sha256'],
+                'X-Content-SHA256': digest
+            }, timeout=120)
+        # 409: the server's copy changed meanwhile; a full upload is still correct
+        return response.status_code == 200
     
     def upload_success(self, filename):
         if hasattr(self, 'current_file_manager'):
             self.current_file_manager.status_label.text = f"Uploaded: {filename}"
-            self.current_file_manager.refresh_files()
+            # One listing refresh once a batch of uploads has gone through
+            if not any(t.active and t.kind == 'upload' for t in self.transfers.snapshot()):
+                self.current_file_manager.refresh_files()
         if PLYER_AVAILABLE and notification:
             notification.notify(title='Upload Complete', message=f'Uploaded: {filename}', timeout=3)
     
-    def upload_failed(self, error_message):
-        if hasattr(self, 'current_file_manager'):
-            self.current_file_manager.status_label.text = error_message
-    
     def download_file(self, file_info):
-        def download_thread():
-            try:
-                filename = file_info['name']
-                Clock.schedule_once(lambda dt: self.update_download_status(f"Downloading {filename}..."))
-                
-                response = self.session.get(f"{self.server_url}/download/{quote(filename)}", stream=True, timeout=30)
-                
-                if response.status_code == 200:
-                    downloads_dir = '/storage/emulated/0/Download' if platform == 'android' else os.path.expanduser('~/Downloads')
-                    if not os.path.exists(downloads_dir):
-                        downloads_dir = os.path.expanduser('~')
-                    
-                    save_path = os.path.join(downloads_dir, filename)
-                    with open(save_path, 'wb') as f:
-                        for chunk in response.iter_content(chunk_size=8192):
-                            f.write(chunk)
-                    
-                    Clock.schedule_once(lambda dt: self.download_success(filename))
-                else:
-                    Clock.schedule_once(lambda dt: self.download_failed("Download failed"))
-            except Exception as e:
-                Clock.schedule_once(lambda dt: self.download_failed(f"Download error: {str(e)}"))
-        
-        threading.Thread(target=download_thread, daemon=True).start()
+        """Queue a download into the device's Downloads folder"""
+        filename = file_info['name']
+        self.transfers.submit('download', filename, lambda transfer: self.run_download(transfer, filename),
+                              total=file_info.get('size_bytes') or 0,
+                              on_finish=lambda transfer: self.transfer_finished(transfer, self.download_success))
+        self.start_transfer_status()
     
-    def update_download_status(self, message):
-        if hasattr(self, 'current_file_manager'):
-            self.current_file_manager.status_label.text = message
+    def run_download(self, transfer, filename):
+        downloads_dir = '/storage/emulated/0/Download' if platform == 'android' else os.path.expanduser('~/Downloads')
+        if not os.path.exists(downloads_dir):
+            downloads_dir = os.path.expanduser('~')
+        save_path = os.path.join(downloads_dir, filename)
+        
+        transfer.progress(phase='Downloading')
+        # Resumes from a .part file left by an earlier or cancelled attempt
+        SegmentedDownload(self.session, f"{self.server_url}/download/{quote(filename)}",
+                          save_path, transfer.progress).run()
+        return filename
     
     def download_success(self, filename):
         if hasattr(self, 'current_file_manager'):
@@ -965,10 +1857,31 @@ class WiFiFileServerApp(App):
         if PLYER_AVAILABLE and notification:
             notification.notify(title='Download Complete', message=f'Saved: {filename}', timeout=3)
     
-    def download_failed(self, error_message):
+    def transfer_finished(self, transfer, success):
+        """Report a finished transfer on the UI thread"""
+        if transfer.state == 'done':
+            Clock.schedule_once(lambda dt: success(transfer.result))
+        elif transfer.state == 'failed':
+            message = f"{transfer.kind.capitalize()} of {transfer.name} failed: {transfer.error}"
+            Clock.schedule_once(lambda dt: self.transfer_failed(message))
+    
+    def transfer_failed(self, error_message):
         if hasattr(self, 'current_file_manager'):
             self.current_file_manager.status_label.text = error_message
     
+    def start_transfer_status(self):
+        """Show combined transfer progress in the status bar while any is active"""
+        if self.transfer_status_event is None:
+            self.transfer_status_event = Clock.schedule_interval(self.show_transfer_status, TRANSFER_UI_INTERVAL)
+    
+    def show_transfer_status(self, dt):
+        stats = self.transfers.stats()
+        if not stats['running'] and not stats['queued'] and not stats['paused']:
+            self.transfer_status_event = None
+            return False
+        if hasattr(self, 'current_file_manager'):
+            self.current_file_manager.show_transfer_stats(stats)
+    
     def play_media_file(self, file_info):
         self.root_widget.clear_widgets()
         media_player = MediaPlayerScreen(self, file_info)
@@ -1007,29 +1920,23 @@ class WiFiFileServerApp(App):
         popup.open()
     
     def delete_file_from_server(self, file_info):
-        def delete_thread():
-            try:
-                filename = file_info['name']
-                response = self.session.post(f"{self.server_url}/delete/{quote(filename)}", timeout=10)
-                
-                if response.status_code == 200:
-                    Clock.schedule_once(lambda dt: self.delete_success(filename))
-                else:
-                    Clock.schedule_once(lambda dt: self.delete_failed("Delete failed"))
-            except Exception as e:
-                Clock.schedule_once(lambda dt: self.delete_failed(f"Delete error: {str(e)}"))
+        filename = file_info['name']
+        
+        def delete(transfer):
+            response = self.session.post(f"{self.server_url}/delete/{quote(filename)}", timeout=10)
+            if response.status_code != 200:
+                raise TransferError("Delete failed")
+            return filename
         
-        threading.Thread(target=delete_thread, daemon=True).start()
+        # Deletes are quick, so they go ahead of queued uploads and downloads
+        self.transfers.submit('delete', filename, delete, priority=PRIORITY_HIGH,
+                              on_finish=lambda transfer: self.transfer_finished(transfer, self.delete_success))
     
     def delete_success(self, filename):
         if hasattr(self, 'current_file_manager'):
             self.current_file_manager.status_label.text = f"Deleted: {filename}"
             self.current_file_manager.refresh_files()
     
-    def delete_failed(self, error_message):
-        if hasattr(self, 'current_file_manager'):
-            self.current_file_manager.status_label.text = error_message
-    
 
 
 if __name__ == '__main__':
@@ -4,13 +4,30 @@ Provides GUI startup and better user experience
 """
 import os
 import sys
-import threading
 import time
 import webbrowser
+import secrets
 from tkinter import *
 from tkinter import ttk, messagebox
 import subprocess
 
+# Worker processes for a desktop server; a handful of devices on the LAN
+# does not need one per core
+DESKTOP_WORKERS = 2
+
+
+def server_command():
+    """Command that starts the server in a child process
+
+    Re-runs this launcher with --serve: in a frozen build sys.executable is
+    the bundled exe itself, which has no Python interpreter to hand a
+    script to.
+    """
+    command = [sys.executable]
+    if not getattr(sys, 'frozen', False):
+        command.append(os.path.abspath(__file__))
+    return command + ['--serve', '--workers', str(DESKTOP_WORKERS)]
+
 class FileServerLauncher:
     def __init__(self):
         self.root = Tk()
@@ -114,19 +131,11 @@ The server runs locally - no internet connection required."""
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
     
     def start_server(self):
-        """Start the Flask server"""
+        """Start the production server in a child process"""
         try:
-            # Import and start the server
-            def run_server():
-                try:
-                    from app import app, SERVER_URL, SERVER_PASSWORD
-                    app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=False)
-                except Exception as e:
-                    messagebox.showerror("Server Error", f"Failed to start server: {e}")
-            
-            # Start server in separate thread
-            server_thread = threading.Thread(target=run_server, daemon=True)
-            server_thread.start()
+            self.boot_id = secrets.token_hex(8)
+            env = dict(os.environ, FILESERVER_BOOT_ID=self.boot_id)
+            self.server_process = subprocess.Popen(server_command(), env=env)
             
             self.server_running = True
             self.update_gui_state()
@@ -138,7 +147,14 @@ The server runs locally - no internet connection required."""
             messagebox.showerror("Error", f"Failed to start server: {e}")
     
     def stop_server(self):
-        """Stop the Flask server"""
+        """Stop the server process and its workers"""
+        if self.server_process is not None:
+            self.server_process.terminate()
+            try:
+                self.server_process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.server_process.kill()
+            self.server_process = None
         self.server_running = False
         self.update_gui_state()
         messagebox.showinfo("Server Stopped", "Server has been stopped")
@@ -150,16 +166,31 @@ The server runs locally - no internet connection required."""
     
     def update_server_info(self):
         """Update server URL and password display"""
+        if not self.server_running:
+            return
+        if self.server_process.poll() is not None:
+            self.server_running = False
+            self.update_gui_state()
+            messagebox.showerror("Server Error", "The server exited unexpectedly")
+            return
         try:
-            from app import SERVER_URL, SERVER_PASSWORD
-            self.url_var.set(SERVER_URL or "Starting...")
-            self.password_var.set(SERVER_PASSWORD or "Generating...")
-            
-            # Auto-open browser
-            if SERVER_URL and self.server_running:
-                self.root.after(1000, lambda: webbrowser.open(SERVER_URL))
-        except:
-            pass
+            # Workers publish this run's settings in the shared state store
+            from server_state import ServerState
+            state = ServerState('uploads', boot_id=self.boot_id)
+            server_url = state.get_boot_setting('server_url')
+            password = state.get_boot_setting('password')
+        except Exception:
+            server_url = password = ''
+        
+        if not server_url or not password:
+            # Workers are still starting
+            self.root.after(500, self.update_server_info)
+            return
+        self.url_var.set(server_url)
+        self.password_var.set(password)
+        
+        # Auto-open browser
+        self.root.after(1000, lambda: webbrowser.open(server_url))
     
     def update_gui_state(self):
         """Update GUI based on server state"""
@@ -190,10 +221,17 @@ The server runs locally - no internet connection required."""
         self.root.mainloop()
 
 if __name__ == "__main__":
+    if '--serve' in sys.argv:
+        # Child started by start_server
+        from server import main as serve
+        sys.argv.remove('--serve')
+        serve(sys.argv[1:])
+        sys.exit()
     try:
         launcher = FileServerLauncher()
         launcher.run()
     except Exception as e:
         print(f"Failed to start launcher: {e}")
         # Fallback to command line
-        import main
\ No newline at end of file
+        from main import run_web_server
+        run_web_server()
\ No newline at end of file
@@ -6,10 +6,13 @@ import sys
 import os
 
 def run_web_server():
-    """Run the Flask web server"""
-    from app import app
-    if __name__ == '__main__':
-        app.run(host='0.0.0.0', port=5000, debug=True)
+    """Run the production web server"""
+    # The launcher imports the app inside each worker process
+    from server import main as serve
+    if getattr(sys, 'frozen', False):
+        # Desktop builds serve a few devices; don't fork one worker per core
+        os.environ.setdefault('FILESERVER_WORKERS', '2')
+    serve(sys.argv[1:])
 
 def run_kivy_app():
     """Run the Kivy mobile app"""
@@ -17,13 +20,9 @@ def run_kivy_app():
     app = WiFiFileServerApp()
     app.run()
 
-# Import Flask app for Gunicorn
-from app import app
-
 # Check command line arguments or environment to decide which app to run
 if __name__ == '__main__':
     if '--kivy' in sys.argv or os.environ.get('RUN_KIVY'):
         run_kivy_app()
     else:
-        # Default to web server for Replit workflow
-        app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+        run_web_server()
\ No newline at end of file
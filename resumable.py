@@ -0,0 +1,305 @@
+"""
+Resumable chunked uploads
+Each upload session owns a directory under the upload folder holding the
+partial data file, preallocated to the declared size, and a block map with
+one byte per fixed-size block that is set once the block is on disk. Chunks
+are written with positional writes outside the session lock, so a client
+can send several byte ranges of one file at once over parallel
+connections, and an interrupted transfer resumes from the blocks still
+missing, even across restarts
+"""
+import os
+import json
+import time
+import errno
+import shutil
+import secrets
+import threading
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows builds run a single server process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+PARTIAL_DIRNAME = '.partial'
+JOURNAL_NAME = 'journal.json'
+DATA_NAME = 'data'
+BLOCKS_NAME = 'blocks'
+LOCK_NAME = 'lock'
+
+# Copy size when moving a chunk from the request body to disk
+WRITE_BLOCK_SIZE = 1024 * 1024
+
+# Completion is tracked per block of this size; very large files use a
+# multiple of it so the block map stays under MAX_BLOCKS entries
+MIN_BLOCK_SIZE = 1024 * 1024
+MAX_BLOCKS = 65536
+
+# Sessions untouched for this long are discarded by cleanup_expired()
+SESSION_TTL = 7 * 24 * 3600
+
+# Only flushes file data, not metadata, where the platform allows it
+_datasync = getattr(os, 'fdatasync', os.fsync)
+
+
+class UploadSessionError(Exception):
+    """Raised for invalid session operations; carries an HTTP status"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def merge_ranges(ranges):
+    """Merge overlapping or adjacent [start, end) ranges"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def preallocate(path, size):
+    """Create ``path`` with ``size`` bytes of disk space reserved
+
+    Uses fallocate where the platform and filesystem have it, so a full disk
+    is reported up front and parallel writes land in contiguous extents;
+    elsewhere the file is only extended.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        if size and hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(fd, 0, size)
+                return
+            except OSError as e:
+                if e.errno == errno.ENOSPC:
+                    raise UploadSessionError('Not enough disk space', 507)
+                if e.errno not in (errno.EINVAL, errno.EOPNOTSUPP):
+                    raise
+        os.ftruncate(fd, size)
+    finally:
+        os.close(fd)
+
+
+def write_at(fd, data, offset):
+    """Write all of ``data`` at ``offset`` without moving a shared file position"""
+    view = memoryview(data)
+    while view:
+        if hasattr(os, 'pwrite'):
+            written = os.pwrite(fd, view, offset)
+        else:
+            # Windows: writers of a session are serialized by its thread lock
+            os.lseek(fd, offset, os.SEEK_SET)
+            written = os.write(fd, view)
+        view = view[written:]
+        offset += written
+
+
+class SessionLock:
+    """Serializes work on one session across threads and worker processes
+
+    Chunk writes take the lock shared, so they run in parallel while commit
+    and abort, which take it exclusively, wait for them to finish.
+    """
+
+    def __init__(self, thread_lock, lock_path, shared=False):
+        self.thread_lock = thread_lock
+        self.lock_path = lock_path
+        # flock locks belong to each open of the lock file, so shared holders
+        # in one process still exclude an exclusive one; without flock every
+        # holder goes through the thread lock
+        self.use_thread_lock = not shared or fcntl is None
+        self.mode = fcntl.LOCK_SH if shared and fcntl is not None else getattr(fcntl, 'LOCK_EX', None)
+        self.lock_file = None
+
+    def __enter__(self):
+        if self.use_thread_lock:
+            self.thread_lock.acquire()
+        if fcntl is not None:
+            try:
+                self.lock_file = open(self.lock_path, 'a')
+            except OSError:
+                if self.use_thread_lock:
+                    self.thread_lock.release()
+                raise UploadSessionError('Unknown upload session', 404)
+            fcntl.flock(self.lock_file, self.mode)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.lock_file is not None:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+            self.lock_file.close()
+            self.lock_file = None
+        if self.use_thread_lock:
+            self.thread_lock.release()
+
+
+class UploadSessionStore:
+    """Journaled on-disk store of in-progress uploads"""
+
+    def __init__(self, folder):
+        self.root = os.path.join(folder, PARTIAL_DIRNAME)
+        os.makedirs(self.root, exist_ok=True)
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def _lock(self, session_id, shared=False):
+        with self._locks_guard:
+            thread_lock = self._locks.setdefault(session_id, threading.Lock())
+        return SessionLock(thread_lock, os.path.join(self._session_dir(session_id), LOCK_NAME), shared)
+
+    def _session_dir(self, session_id):
+        if not session_id or not session_id.isalnum():
+            raise UploadSessionError('Unknown upload session', 404)
+        return os.path.join(self.root, session_id)
+
+    def _read_journal(self, session_id):
+        try:
+            with open(os.path.join(self._session_dir(session_id), JOURNAL_NAME)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            raise UploadSessionError('Unknown upload session', 404)
+
+    def _write_journal(self, session_id, journal):
+        """Atomically replace the journal so a crash never leaves it half written"""
+        session_dir = self._session_dir(session_id)
+        temp_path = os.path.join(session_dir, JOURNAL_NAME + '.tmp')
+        journal['updated'] = time.time()
+        with open(temp_path, 'w') as f:
+            json.dump(journal, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, os.path.join(session_dir, JOURNAL_NAME))
+
+    def create(self, filename, size):
+        """Start a new upload session for a file of the given size"""
+        if size < 0:
+            raise UploadSessionError('Invalid file size')
+        session_id = secrets.token_hex(16)
+        session_dir = self._session_dir(session_id)
+        block_size = MIN_BLOCK_SIZE * max(1, -(-size // (MIN_BLOCK_SIZE * MAX_BLOCKS)))
+        os.makedirs(session_dir)
+        try:
+            preallocate(os.path.join(session_dir, DATA_NAME), size)
+            with open(os.path.join(session_dir, BLOCKS_NAME), 'wb') as f:
+                f.write(bytes(-(-size // block_size)))
+            journal = {'id': session_id, 'filename': filename, 'size': size,
+                       'block_size': block_size, 'created': time.time()}
+            self._write_journal(session_id, journal)
+        except BaseException:
+            shutil.rmtree(session_dir, ignore_errors=True)
+            raise
+        journal['received'] = []
+        return journal
+
+    def get(self, session_id):
+        """Return the journal of a session, with the byte ranges received so far"""
+        journal = self._read_journal(session_id)
+        try:
+            with open(os.path.join(self._session_dir(session_id), BLOCKS_NAME), 'rb') as f:
+                blocks = f.read()
+        except OSError:
+            raise UploadSessionError('Unknown upload session', 404)
+        size, block_size = journal['size'], journal['block_size']
+        journal['received'] = merge_ranges([index * block_size, min((index + 1) * block_size, size)]
+                                           for index, done in enumerate(blocks) if done)
+        return journal
+
+    def write_chunk(self, session_id, offset, stream, length):
+        """Copy ``length`` bytes from ``stream`` into the session at ``offset``
+
+        Chunks start on a block boundary and cover whole blocks, apart from
+        the last block of the file. Any number may be written concurrently.
+        """
+        journal = self._read_journal(session_id)
+        size, block_size = journal['size'], journal['block_size']
+        if offset < 0 or length < 0 or offset + length > size:
+            raise UploadSessionError('Chunk outside of declared file size', 416)
+        if offset % block_size or (length % block_size and offset + length != size):
+            raise UploadSessionError(f'Chunks must cover whole {block_size}-byte blocks')
+
+        session_dir = self._session_dir(session_id)
+        with self._lock(session_id, shared=True):
+            try:
+                fd = os.open(os.path.join(session_dir, DATA_NAME), os.O_WRONLY)
+            except FileNotFoundError:
+                # Committed or aborted while this request was on its way
+                raise UploadSessionError('Unknown upload session', 404)
+            written = 0
+            try:
+                while written < length:
+                    block = stream.read(min(WRITE_BLOCK_SIZE, length - written))
+                    if not block:
+                        break
+                    write_at(fd, block, offset + written)
+                    written += len(block)
+                _datasync(fd)
+            finally:
+                os.close(fd)
+
+            # Only mark blocks that are wholly on disk; a short body is a
+            # dropped connection and the client resends the missing blocks
+            end = offset + written
+            first = offset // block_size
+            last = -(-end // block_size) if end == size else end // block_size
+            if last > first:
+                fd = os.open(os.path.join(session_dir, BLOCKS_NAME), os.O_WRONLY)
+                try:
+                    # One byte per block: concurrent writers never share a byte
+                    write_at(fd, b'\x01' * (last - first), first)
+                    _datasync(fd)
+                finally:
+                    os.close(fd)
+        return self.get(session_id)
+
+    def is_complete(self, journal):
+        return journal['size'] == 0 or journal['received'] == [[0, journal['size']]]
+
+    def commit(self, session_id, target_path):
+        """Move a complete upload into place with an atomic rename"""
+        with self._lock(session_id):
+            journal = self.get(session_id)
+            if not self.is_complete(journal):
+                raise UploadSessionError('Upload is incomplete', 409)
+            session_dir = self._session_dir(session_id)
+            os.replace(os.path.join(session_dir, DATA_NAME), target_path)
+            shutil.rmtree(session_dir, ignore_errors=True)
+        with self._locks_guard:
+            self._locks.pop(session_id, None)
+        return journal
+
+    def abort(self, session_id):
+        """Discard a session and its partial data"""
+        session_dir = self._session_dir(session_id)
+        if not os.path.isdir(session_dir):
+            raise UploadSessionError('Unknown upload session', 404)
+        with self._lock(session_id):
+            shutil.rmtree(session_dir, ignore_errors=True)
+        with self._locks_guard:
+            self._locks.pop(session_id, None)
+
+    def cleanup_expired(self, ttl=SESSION_TTL):
+        """Remove sessions that have not received data within ``ttl`` seconds"""
+        now = time.time()
+        removed = 0
+        for session_id in os.listdir(self.root):
+            try:
+                journal = self._read_journal(session_id)
+                # Chunk writes only touch the block map
+                updated = max(journal.get('updated', journal.get('created', 0)),
+                              os.path.getmtime(os.path.join(self.root, session_id, BLOCKS_NAME)))
+                expired = now - updated > ttl
+            except (UploadSessionError, OSError):
+                expired = True
+            if expired:
+                shutil.rmtree(os.path.join(self.root, session_id), ignore_errors=True)
+                removed += 1
+        if removed:
+            logger.info(f"Removed {removed} expired upload sessions")
+        return removed
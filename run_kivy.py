@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """
 Run the Kivy mobile app
-Separate entry point to avoid conflicts with Flask/Gunicorn
+Separate entry point to avoid conflicts with the web server
 """
 
 import os
@@ -0,0 +1,208 @@
+"""
+Filename search
+A trigram index over catalogued filenames, updated one name at a time as the
+catalog changes. Answers substring, prefix and extension queries by scanning
+the posting list of the query's rarest trigram and verifying each candidate,
+so a query costs in proportion to the matches rather than the folder size.
+"""
+import re
+import threading
+from array import array
+
+# Characters that start a new "word" inside a filename for ranking
+WORD_SEPARATORS = ' _-.()[]'
+
+# Rebuild the postings once this share of the ids belongs to removed names
+COMPACT_RATIO = 0.25
+
+
+def fold(text):
+    return text.casefold()
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def extension_of(name):
+    return name.rsplit('.', 1)[1] if '.' in name else ''
+
+
+def parse_query(query):
+    """Split a query into folded substring terms and an extension filter
+
+    ``ext:pdf`` and ``*.pdf`` restrict results to that extension; every other
+    whitespace-separated word must appear somewhere in the name.
+    """
+    terms = []
+    extensions = set()
+    for word in fold(query).split():
+        if word.startswith('ext:') and len(word) > 4:
+            extensions.add(word[4:].lstrip('.'))
+        elif word.startswith('*.') and len(word) > 2:
+            extensions.add(word[2:])
+        else:
+            terms.append(word)
+    return terms, extensions
+
+
+def match_rank(term, name):
+    """Rank of one term in a folded name: 0 exact, 1 prefix, 2 word start, 3 substring"""
+    if name == term or name.rsplit('.', 1)[0] == term:
+        return 0
+    if name.startswith(term):
+        return 1
+    position = name.find(term)
+    while position > 0:
+        if name[position - 1] in WORD_SEPARATORS:
+            return 2
+        position = name.find(term, position + 1)
+    return 3
+
+
+class TrigramIndex:
+    """Incrementally maintained trigram index of filenames
+
+    Postings are compact ``array('I')`` lists of name ids. Removing a name
+    only clears its slot; the stale ids are skipped at query time and
+    dropped when the index is compacted.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._ids = {}
+        self._names = []
+        self._folded = []
+        self._grams = {}
+        self._extensions = {}
+        self._removed = 0
+
+    def rebuild(self, names):
+        """Replace the index contents with ``names``"""
+        with self._lock:
+            self._reset()
+            for name in names:
+                self._add(name)
+
+    def add(self, name):
+        with self._lock:
+            if name not in self._ids:
+                self._add(name)
+
+    def _add(self, name):
+        name_id = len(self._names)
+        folded = fold(name)
+        self._ids[name] = name_id
+        self._names.append(name)
+        self._folded.append(folded)
+        for gram in trigrams(folded):
+            postings = self._grams.get(gram)
+            if postings is None:
+                postings = self._grams[gram] = array('I')
+            postings.append(name_id)
+        extension = extension_of(folded)
+        postings = self._extensions.get(extension)
+        if postings is None:
+            postings = self._extensions[extension] = array('I')
+        postings.append(name_id)
+
+    def remove(self, name):
+        with self._lock:
+            name_id = self._ids.pop(name, None)
+            if name_id is None:
+                return
+            self._names[name_id] = None
+            self._folded[name_id] = None
+            self._removed += 1
+            if self._removed > len(self._names) * COMPACT_RATIO:
+                live = [n for n in self._names if n is not None]
+                self._reset()
+                for live_name in live:
+                    self._add(live_name)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _candidates(self, terms, extensions):
+        """Ids worth verifying: the smallest posting list the query can use"""
+        best = None
+        for term in terms:
+            for gram in trigrams(term):
+                postings = self._grams.get(gram)
+                if postings is None:
+                    return ()
+                if best is None or len(postings) < len(best):
+                    best = postings
+        if len(extensions) == 1:
+            # Several extensions are alternatives, so only one can narrow the scan
+            postings = self._extensions.get(next(iter(extensions)), ())
+            if best is None or len(postings) < len(best):
+                best = postings
+        if best is None:
+            # Only one- and two-character terms: scan every name
+            return range(len(self._names))
+        return best
+
+    def search(self, query, limit=50, offset=0):
+        """Return (ranked names for the requested window, total match count)
+
+        Results are ordered by rank, then alphabetically.
+        """
+        terms, extensions = parse_query(query)
+        if not terms and not extensions:
+            return [], 0
+        wanted = offset + limit
+
+        with self._lock:
+            names = self._names
+            folded_names = self._folded
+            # One comprehension per filter keeps the per-candidate work in C
+            matches = [i for i in self._candidates(terms, extensions) if folded_names[i] is not None]
+            for term in terms:
+                matches = [i for i in matches if term in folded_names[i]]
+            if extensions:
+                suffixes = tuple(f'.{extension}' for extension in extensions)
+                matches = [i for i in matches if folded_names[i].endswith(suffixes)]
+
+            alphabetical = folded_names.__getitem__
+            if not terms:
+                ordered = sorted(matches, key=alphabetical)
+            elif len(terms) == 1:
+                ordered = self._ordered_tiers(terms[0], matches, wanted)
+            else:
+                ordered = sorted(matches, key=lambda i: (sum(match_rank(term, folded_names[i]) for term in terms),
+                                                         folded_names[i]))
+            window = [names[i] for i in ordered[offset:wanted]]
+        return window, len(matches)
+
+    def _ordered_tiers(self, term, matches, wanted):
+        """Order single-term matches tier by tier, stopping once the window is full
+
+        Only the tiers needed to fill the first ``wanted`` results are sorted.
+        """
+        folded_names = self._folded
+        alphabetical = folded_names.__getitem__
+        stem = f"{term}."
+
+        prefixed = [i for i in matches if folded_names[i].startswith(term)]
+        exact = [i for i in prefixed if (folded := folded_names[i]) == term
+                 or (folded.startswith(stem) and '.' not in folded[len(stem):])]
+        if exact:
+            exact_ids = set(exact)
+            prefixed = [i for i in prefixed if i not in exact_ids]
+        ordered = sorted(exact, key=alphabetical) + sorted(prefixed, key=alphabetical)
+        if len(ordered) >= wanted:
+            return ordered
+
+        word_start = re.compile(f"[{re.escape(WORD_SEPARATORS)}]{re.escape(term)}")
+        rest = [i for i in matches if not folded_names[i].startswith(term)]
+        words = [i for i in rest if word_start.search(folded_names[i])]
+        ordered += sorted(words, key=alphabetical)
+        if len(ordered) >= wanted:
+            return ordered
+        word_ids = set(words)
+        ordered += sorted((i for i in rest if i not in word_ids), key=alphabetical)
+        return ordered
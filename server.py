@@ -0,0 +1,277 @@
+"""
+Production server launcher
+One entry point for Render, the desktop builds and the zipapp. Where the
+platform has fork() and SO_REUSEPORT it pre-forks worker processes that each
+own a listening socket bound to the same port, so the kernel spreads new
+connections across cores; elsewhere (Windows) it serves from one process.
+Workers run the app through the ASGI bridge under uvicorn, or a bounded
+thread-pool WSGI server when uvicorn is not installed (or --server threads
+is given). The thread-pool server writes file bodies straight to the client
+socket with sendfile; the ASGI bridge streams them on the event loop.
+
+Usage: python server.py [--port PORT] [--workers N] [--threads N] ...
+Every option can also be set with the environment variable shown in --help.
+"""
+import os
+import time
+import signal
+import socket
+import secrets
+import argparse
+import logging
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+from transfer import CHUNK_SIZE, HAS_SENDFILE
+
+logger = logging.getLogger(__name__)
+
+CAN_PREFORK = hasattr(os, 'fork') and hasattr(socket, 'SO_REUSEPORT')
+
+# Seconds to wait before replacing a worker that died, so a crash loop
+# cannot spin the CPU
+RESPAWN_DELAY = 1
+
+
+def env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Run the WiFi File Server')
+    parser.add_argument('--host', default=os.environ.get('FILESERVER_HOST', '0.0.0.0'),
+                        help='Address to listen on (FILESERVER_HOST)')
+    parser.add_argument('--port', type=int, default=env_int('PORT', 5000),
+                        help='Port to listen on (PORT)')
+    parser.add_argument('--workers', type=int, default=env_int('FILESERVER_WORKERS', os.cpu_count() or 1),
+                        help='Worker processes; forced to 1 without fork/SO_REUSEPORT (FILESERVER_WORKERS)')
+    parser.add_argument('--threads', type=int, default=env_int('FILESERVER_THREADS', 16),
+                        help='Request handler threads per worker (FILESERVER_THREADS)')
+    parser.add_argument('--keepalive', type=int, default=env_int('FILESERVER_KEEPALIVE', 5),
+                        help='Seconds an idle keep-alive connection stays open (FILESERVER_KEEPALIVE)')
+    parser.add_argument('--backlog', type=int, default=env_int('FILESERVER_BACKLOG', 2048),
+                        help='Listen queue length per worker socket (FILESERVER_BACKLOG)')
+    parser.add_argument('--max-request-size', type=int, default=env_int('FILESERVER_MAX_REQUEST_SIZE', 0),
+                        help='Largest accepted request body in bytes; 0 keeps the app default '
+                             '(FILESERVER_MAX_REQUEST_SIZE)')
+    parser.add_argument('--server', choices=('auto', 'asgi', 'threads'),
+                        default=os.environ.get('FILESERVER_SERVER', 'auto'),
+                        help='auto uses uvicorn when installed; threads serves downloads with '
+                             'sendfile (FILESERVER_SERVER)')
+    return parser
+
+
+def bind_socket(settings, reuse_port):
+    """Create a listening TCP socket for the configured address"""
+    family = socket.AF_INET6 if ':' in settings.host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((settings.host, settings.port))
+    sock.listen(settings.backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(settings, sock, index=0):
+    """Import the app and serve requests from ``sock`` until told to stop"""
+    import app as server_app
+    flask_app = server_app.app
+    if settings.max_request_size:
+        flask_app.config['MAX_CONTENT_LENGTH'] = settings.max_request_size
+    if index == 0:
+        server_app.print_startup_banner()
+
+    uvicorn = None
+    if settings.server != 'threads':
+        try:
+            import uvicorn
+        except ImportError:
+            if settings.server == 'asgi':
+                raise
+
+    if uvicorn is not None:
+        from asgi import ASGIBridge
+        config = uvicorn.Config(ASGIBridge(flask_app, handler_threads=settings.threads),
+                                timeout_keep_alive=settings.keepalive, backlog=settings.backlog,
+                                lifespan='on', log_level='info')
+        uvicorn.Server(config).run(sockets=[sock])
+    else:
+        if settings.server == 'auto':
+            logger.warning("uvicorn is not installed; serving with the thread-pool WSGI server")
+        server = make_pooled_server(settings, sock, flask_app)
+        # Stop the way Ctrl+C does
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.pool.shutdown(wait=False)
+            server.server_close()
+
+
+class SocketFileWrapper:
+    """``wsgi.file_wrapper`` that writes a file body straight to the client socket
+
+    Iterating it yields one empty chunk, which makes the server send the
+    status line and headers, then sends the body itself: with sendfile when
+    the body exposes ``fileno()``, ``offset`` and ``length``, otherwise
+    through one reused buffer. ``transfer_path`` names the path it takes.
+    """
+
+    def __init__(self, connection, filelike, block_size=CHUNK_SIZE):
+        self.connection = connection
+        self.filelike = filelike
+        self.block_size = block_size
+        can_sendfile = all(hasattr(filelike, name) for name in ('fileno', 'offset', 'length'))
+        self.transfer_path = 'sendfile' if HAS_SENDFILE and can_sendfile else 'buffered'
+
+    def __iter__(self):
+        yield b''
+        if self.transfer_path == 'sendfile':
+            body = self.filelike
+            self.connection.sendfile(body, body.offset, body.length)
+        else:
+            self._copy()
+
+    def _copy(self):
+        buffer = bytearray(self.block_size)
+        view = memoryview(buffer)
+        readinto = getattr(self.filelike, 'readinto', None)
+        while True:
+            if readinto is not None:
+                count = readinto(buffer)
+                data = view[:count]
+            else:
+                data = self.filelike.read(self.block_size)
+                count = len(data)
+            if not count:
+                break
+            self.connection.sendall(data)
+
+    def close(self):
+        if hasattr(self.filelike, 'close'):
+            self.filelike.close()
+
+
+def make_pooled_server(settings, sock, wsgi_app):
+    """Werkzeug WSGI server with a fixed pool of handler threads"""
+    from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+    class RequestHandler(WSGIRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Idle time allowed between requests on a keep-alive connection
+        timeout = settings.keepalive
+
+        def make_environ(self):
+            environ = super().make_environ()
+            environ['wsgi.file_wrapper'] = partial(SocketFileWrapper, self.connection)
+            return environ
+
+    class PooledWSGIServer(BaseWSGIServer):
+        multithread = True
+
+        def __init__(self):
+            super().__init__(settings.host, settings.port, wsgi_app, RequestHandler, fd=sock.fileno())
+            self.pool = ThreadPoolExecutor(max_workers=settings.threads, thread_name_prefix='wsgi-handler')
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self._handle, request, client_address)
+
+        def _handle(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    return PooledWSGIServer()
+
+
+class Supervisor:
+    """Parent process that forks workers and replaces any that die"""
+
+    def __init__(self, settings):
+        self.settings = settings
+        # One socket per worker, all bound to the same port; created here so
+        # a port conflict fails before any worker starts and a restarted
+        # worker picks up connections queued on its predecessor's socket
+        self.sockets = [bind_socket(settings, reuse_port=True) for _ in range(settings.workers)]
+        self.children = {}
+        self.stopping = False
+
+    def spawn(self, index):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = index
+            return
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        for other, sock in enumerate(self.sockets):
+            if other != index:
+                sock.close()
+        code = 0
+        try:
+            run_worker(self.settings, self.sockets[index], index)
+        except BaseException:
+            logger.exception(f"Worker {index} failed")
+            code = 1
+        finally:
+            os._exit(code)
+
+    def stop(self, signum, frame):
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for index in range(self.settings.workers):
+            self.spawn(index)
+        logger.info(f"Started {self.settings.workers} workers on port {self.settings.port}")
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            index = self.children.pop(pid, None)
+            if index is None or self.stopping:
+                continue
+            logger.warning(f"Worker {index} (pid {pid}) exited with status {status}; restarting")
+            time.sleep(RESPAWN_DELAY)
+            if not self.stopping:
+                self.spawn(index)
+
+        for sock in self.sockets:
+            sock.close()
+
+
+def serve(settings):
+    """Run the server with the given settings until interrupted"""
+    # Every worker of this run shares one password, URL and session secret
+    os.environ.setdefault('FILESERVER_BOOT_ID', secrets.token_hex(8))
+    if settings.workers > 1 and CAN_PREFORK:
+        Supervisor(settings).run()
+        return
+    if settings.workers > 1:
+        logger.info("Pre-forking is not available on this platform; running one worker process")
+    run_worker(settings, bind_socket(settings, reuse_port=False))
+
+
+def main(argv=None):
+    if not logging.getLogger().handlers:
+        logging.basicConfig(level=logging.INFO)
+    serve(build_parser().parse_args(argv))
+
+
+if __name__ == '__main__':
+    main()
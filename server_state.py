@@ -0,0 +1,147 @@
+"""
+Cross-process server state
+Settings, upload name reservations and rate-limit counters live in a small
+SQLite database so every worker process and thread sees the same values
+"""
+import os
+import time
+import secrets
+import sqlite3
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+STATE_FILENAME = '.server_state.sqlite3'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS reservations (
+    name TEXT PRIMARY KEY,
+    expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS counters (
+    key TEXT PRIMARY KEY,
+    window_start REAL NOT NULL,
+    hits INTEGER NOT NULL
+);
+"""
+
+
+class ServerState:
+    """Shared key/value settings plus reservation and counter tables
+
+    ``boot_id`` identifies one server run. A pre-forking parent sets
+    FILESERVER_BOOT_ID before starting workers so they all share it; a
+    single process just makes one up. Per-boot settings (password, URL,
+    session secret) are regenerated for every run, as they were when they
+    lived in module globals.
+    """
+
+    def __init__(self, folder, boot_id=None, db_path=None):
+        self.db_path = db_path or os.path.join(folder, STATE_FILENAME)
+        self.boot_id = boot_id or os.environ.get('FILESERVER_BOOT_ID') or secrets.token_hex(8)
+        self._local = threading.local()
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        # Settings of earlier runs are never read again
+        conn.execute("DELETE FROM settings WHERE key LIKE 'boot:%' AND key NOT LIKE ?",
+                     (f'boot:{self.boot_id}:%',))
+
+    def _connect(self):
+        """Return the calling thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def setting(self, key, default_factory):
+        """Return a shared setting, creating it with ``default_factory`` if absent
+
+        The first process to get here wins; every other process reads the
+        value it stored, so all workers agree on generated secrets.
+        """
+        conn = self._connect()
+        row = conn.execute('SELECT value FROM settings WHERE key = ?', (key,)).fetchone()
+        if row:
+            return row[0]
+        conn.execute('INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)', (key, default_factory()))
+        return conn.execute('SELECT value FROM settings WHERE key = ?', (key,)).fetchone()[0]
+
+    def boot_setting(self, key, default_factory):
+        """Like setting() but scoped to the current server run"""
+        return self.setting(f'boot:{self.boot_id}:{key}', default_factory)
+
+    def get_boot_setting(self, key):
+        """Return a per-run setting if a worker has stored it, else None"""
+        row = self._connect().execute('SELECT value FROM settings WHERE key = ?',
+                                      (f'boot:{self.boot_id}:{key}',)).fetchone()
+        return row[0] if row else None
+
+    def set_setting(self, key, value):
+        self._connect().execute(
+            'INSERT INTO settings (key, value) VALUES (?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET value = excluded.value', (key, value)
+        )
+
+    def reserve_name(self, name, ttl=3600):
+        """Claim a filename for an upload in progress; False if someone else holds it"""
+        conn = self._connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM reservations WHERE name = ? AND expires < ?', (name, now))
+            cursor = conn.execute('INSERT OR IGNORE INTO reservations (name, expires) VALUES (?, ?)',
+                                  (name, now + ttl))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return cursor.rowcount == 1
+
+    def release_name(self, name):
+        self._connect().execute('DELETE FROM reservations WHERE name = ?', (name,))
+
+    def hit(self, key, window, limit):
+        """Count one event against a fixed-window limit shared by all processes
+
+        Returns True while the number of events in the current window is
+        within ``limit``.
+        """
+        conn = self._connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT window_start, hits FROM counters WHERE key = ?', (key,)).fetchone()
+            if row is None or now - row[0] >= window:
+                hits = 1
+                conn.execute('INSERT OR REPLACE INTO counters (key, window_start, hits) VALUES (?, ?, 1)',
+                             (key, now))
+            else:
+                hits = row[1] + 1
+                conn.execute('UPDATE counters SET hits = ? WHERE key = ?', (hits, key))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return hits <= limit
+
+    def count(self, key, window):
+        """Events counted against ``key`` in its current window, 0 once it has passed"""
+        row = self._connect().execute('SELECT window_start, hits FROM counters WHERE key = ?', (key,)).fetchone()
+        if row is None or time.time() - row[0] >= window:
+            return 0
+        return row[1]
+
+    def purge_expired(self, max_window=3600):
+        """Drop stale reservations and counters"""
+        now = time.time()
+        conn = self._connect()
+        conn.execute('DELETE FROM reservations WHERE expires < ?', (now,))
+        conn.execute('DELETE FROM counters WHERE window_start < ?', (now - max_window,))
@@ -18,13 +18,15 @@ import os
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, current_dir)
 
-# Import and run the app
+# Run the production server
 try:
-    from app import app
     if __name__ == '__main__':
+        from server import main
+        # Desktop builds serve a few devices; don't fork one worker per core
+        os.environ.setdefault('FILESERVER_WORKERS', '2')
         print("Starting WiFi File Server...")
         print("Press Ctrl+C to stop the server")
-        app.run(host='0.0.0.0', port=5000, debug=False)
+        main()
 except KeyboardInterrupt:
     print("\\nServer stopped by user")
 except Exception as e:
@@ -54,6 +56,7 @@ def build_simple_exe():
         '--hidden-import=netifaces',
         '--hidden-import=qrcode',
         '--hidden-import=PIL',
+        '--collect-submodules=uvicorn',
         '--distpath=./dist_simple',
         '--workpath=./build_simple',
         '--specpath=./build_simple',
@@ -278,6 +278,154 @@ function initializeDragAndDrop() {
     }
 }
 
+// Largest file hashed in the browser before uploading; hashing in JavaScript
+// runs at tens of MB/s on phones, so past this it costs more than it saves
+const HASH_CHECK_LIMIT = 256 * 1024 * 1024;
+
+// Bytes of the file read and hashed per step
+const HASH_SLICE_SIZE = 4 * 1024 * 1024;
+
+const SHA256_K = new Int32Array([
+    0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+    0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+    0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+    0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+    0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+    0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+    0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+    0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2
+]);
+
+// Incremental SHA-256. crypto.subtle only exists in secure contexts (HTTPS
+// or localhost) and digests a whole buffer at once; this works over plain
+// HTTP on the LAN and takes the file a slice at a time.
+class Sha256 {
+    constructor() {
+        this.state = new Int32Array([
+            0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a, 0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19
+        ]);
+        this.words = new Int32Array(64);
+        this.pending = new Uint8Array(64);
+        this.pendingLength = 0;
+        this.length = 0;
+    }
+    
+    update(bytes) {
+        let offset = 0;
+        this.length += bytes.length;
+        if (this.pendingLength) {
+            offset = Math.min(64 - this.pendingLength, bytes.length);
+            this.pending.set(bytes.subarray(0, offset), this.pendingLength);
+            this.pendingLength += offset;
+            if (this.pendingLength < 64) return;
+            this.compress(this.pending, 0);
+            this.pendingLength = 0;
+        }
+        for (; offset + 64 <= bytes.length; offset += 64) {
+            this.compress(bytes, offset);
+        }
+        this.pending.set(bytes.subarray(offset));
+        this.pendingLength = bytes.length - offset;
+    }
+    
+    hexDigest() {
+        const bits = this.length * 8;
+        // 0x80, zeros up to 56 mod 64, then the length in bits
+        const padding = new Uint8Array((this.pendingLength < 56 ? 64 : 128) - this.pendingLength);
+        padding[0] = 0x80;
+        const view = new DataView(padding.buffer);
+        view.setUint32(padding.length - 8, Math.floor(bits / 0x100000000));
+        view.setUint32(padding.length - 4, bits >>> 0);
+        this.update(padding);
+        return Array.from(this.state, word => (word >>> 0).toString(16).padStart(8, '0')).join('');
+    }
+    
+    compress(bytes, offset) {
+        const w = this.words;
+        const state = this.state;
+        for (let i = 0; i < 16; i++, offset += 4) {
+            w[i] = (bytes[offset] << 24) | (bytes[offset + 1] << 16) | (bytes[offset + 2] << 8) | bytes[offset + 3];
+        }
+        for (let i = 16; i < 64; i++) {
+            const x = w[i - 15];
+            const y = w[i - 2];
+            const s0 = ((x >>> 7) | (x << 25)) ^ ((x >>> 18) | (x << 14)) ^ (x >>> 3);
+            const s1 = ((y >>> 17) | (y << 15)) ^ ((y >>> 19) | (y << 13)) ^ (y >>> 10);
+            w[i] = (w[i - 16] + s0 + w[i - 7] + s1) | 0;
+        }
+        let a = state[0], b = state[1], c = state[2], d = state[3];
+        let e = state[4], f = state[5], g = state[6], h = state[7];
+        for (let i = 0; i < 64; i++) {
+            const S1 = ((e >>> 6) | (e << 26)) ^ ((e >>> 11) | (e << 21)) ^ ((e >>> 25) | (e << 7));
+            const t1 = (h + S1 + ((e & f) ^ (~e & g)) + SHA256_K[i] + w[i]) | 0;
+            const S0 = ((a >>> 2) | (a << 30)) ^ ((a >>> 13) | (a << 19)) ^ ((a >>> 22) | (a << 10));
+            const t2 = (S0 + ((a & b) ^ (a & c) ^ (b & c))) | 0;
+            h = g; g = f; f = e; e = (d + t1) | 0;
+            d = c; c = b; b = a; a = (t1 + t2) | 0;
+        }
+        state[0] += a; state[1] += b; state[2] += c; state[3] += d;
+        state[4] += e; state[5] += f; state[6] += g; state[7] += h;
+    }
+}
+
+// SHA-256 of a File, read one slice at a time; onProgress gets bytes hashed
+async function hashFile(file, onProgress) {
+    const hash = new Sha256();
+    for (let offset = 0; offset < file.size; offset += HASH_SLICE_SIZE) {
+        const slice = file.slice(offset, offset + HASH_SLICE_SIZE);
+        hash.update(new Uint8Array(await slice.arrayBuffer()));
+        if (onProgress) onProgress(Math.min(offset + HASH_SLICE_SIZE, file.size));
+    }
+    return hash.hexDigest();
+}
+
+// Ask the server whether it already has a file's content before sending it
+function initializeHashCheck() {
+    const form = document.querySelector('#uploadModal form');
+    const fileInput = document.getElementById('file');
+    
+    if (!form || !fileInput) return;
+    
+    form.addEventListener('submit', async (event) => {
+        const file = fileInput.files[0];
+        if (!file || file.size > HASH_CHECK_LIMIT) return;
+        event.preventDefault();
+        
+        const button = form.querySelector('button[type="submit"]');
+        const originalContent = button.innerHTML;
+        button.innerHTML = '<i class="fas fa-spinner fa-spin me-1"></i>Checking...';
+        button.disabled = true;
+        
+        try {
+            const sha256 = await hashFile(file, done => {
+                const percent = Math.floor(done * 100 / file.size);
+                button.innerHTML = `<i class="fas fa-spinner fa-spin me-1"></i>Checking ${percent}%`;
+            });
+            const response = await fetch('/api/uploads/by-hash', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ filename: file.name, size: file.size, sha256 })
+            });
+            if (response.status === 201) {
+                const data = await response.json();
+                bootstrap.Modal.getInstance(document.getElementById('uploadModal')).hide();
+                form.reset();
+                updateFileInfo(fileInput);
+                button.innerHTML = originalContent;
+                button.disabled = false;
+                showToast(`"${data.name}" was already on the server and has been added instantly`, 'success');
+                return;
+            }
+        } catch (error) {
+            console.log('Hash check failed, uploading normally:', error);
+        }
+        
+        button.innerHTML = '<i class="fas fa-spinner fa-spin me-1"></i>Uploading...';
+        // Skips this handler and sends the file as a regular upload
+        form.submit();
+    });
+}
+
 // Format file size helper
 function formatFileSize(bytes) {
     if (bytes === 0) return '0 B';
@@ -292,26 +440,78 @@ function initializeSearch() {
     const searchInput = document.createElement('input');
     searchInput.type = 'text';
     searchInput.className = 'form-control mb-3';
-    searchInput.placeholder = 'Search files...';
+    searchInput.placeholder = 'Search files... (ext:pdf to filter by type)';
     searchInput.id = 'fileSearch';
     
     const fileGrid = document.getElementById('fileGrid');
     if (fileGrid) {
         fileGrid.parentNode.insertBefore(searchInput, fileGrid);
         
-        searchInput.addEventListener('input', (e) => {
-            const searchTerm = e.target.value.toLowerCase();
-            const fileItems = document.querySelectorAll('.file-item');
-            
-            fileItems.forEach(item => {
-                const fileName = item.dataset.name;
-                if (fileName.includes(searchTerm)) {
-                    item.style.display = 'block';
-                } else {
-                    item.style.display = 'none';
-                }
-            });
-        });
+        // Results come from the server index, so files on other pages are found too
+        const results = document.createElement('div');
+        results.id = 'searchResults';
+        results.className = 'list-group mb-3';
+        results.style.display = 'none';
+        fileGrid.parentNode.insertBefore(results, fileGrid);
+        
+        let pending = null;
+        const runSearch = Utils.debounce((searchTerm) => {
+            if (pending) {
+                pending.abort();
+            }
+            if (!searchTerm) {
+                results.style.display = 'none';
+                fileGrid.style.display = '';
+                return;
+            }
+            pending = new AbortController();
+            fetch('/api/search?limit=100&q=' + encodeURIComponent(searchTerm), {signal: pending.signal})
+                .then(response => response.json())
+                .then(data => renderSearchResults(results, data))
+                .then(() => {
+                    results.style.display = '';
+                    fileGrid.style.display = 'none';
+                })
+                .catch(error => {
+                    if (error.name !== 'AbortError') {
+                        console.error('Search failed:', error);
+                    }
+                });
+        }, 200);
+        
+        searchInput.addEventListener('input', (e) => runSearch(e.target.value.trim()));
+    }
+}
+
+// Render /api/search rows as links
+function renderSearchResults(container, data) {
+    container.innerHTML = '';
+    const files = data.files || [];
+    if (files.length === 0) {
+        const empty = document.createElement('div');
+        empty.className = 'list-group-item text-muted';
+        empty.textContent = 'No matching files';
+        container.appendChild(empty);
+        return;
+    }
+    files.forEach(([name, size, mtime, type]) => {
+        const link = document.createElement('a');
+        const path = (type === 'video' || type === 'audio') ? '/stream/' : '/download/';
+        link.href = path + encodeURIComponent(name);
+        link.className = 'list-group-item list-group-item-action d-flex justify-content-between';
+        const label = document.createElement('span');
+        label.textContent = name;
+        const detail = document.createElement('small');
+        detail.className = 'text-muted';
+        detail.textContent = formatFileSize(size);
+        link.append(label, detail);
+        container.appendChild(link);
+    });
+    if (data.total > files.length) {
+        const more = document.createElement('div');
+        more.className = 'list-group-item text-muted';
+        more.textContent = `Showing ${files.length} of ${data.total} matches`;
+        container.appendChild(more);
     }
 }
 
@@ -405,6 +605,7 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Initialize features
     initializeDragAndDrop();
+    initializeHashCheck();
     initializeSearch();
     setupMediaPlayer();
     initializeNetworkMonitoring();
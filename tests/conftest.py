@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def server(tmp_path_factory):
+    """The app module, serving an empty uploads folder in a scratch directory"""
+    # The app keeps its uploads and state relative to the working directory
+    previous = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('server'))
+    import app
+    yield app
+    os.chdir(previous)
+
+
+@pytest.fixture
+def client(server):
+    """A test client that is already logged in"""
+    client = server.app.test_client()
+    with client.session_transaction() as session:
+        session['authenticated'] = True
+    return client
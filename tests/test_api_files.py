@@ -0,0 +1,52 @@
+"""
+Paginated /api/files listing: walking every page with the returned cursors,
+and rejecting cursors whose position does not match the sort key
+"""
+import json
+import base64
+
+
+def make_cursor(key):
+    raw = json.dumps(key).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def list_all(client, **params):
+    names, cursor = [], None
+    while True:
+        query = dict(params, limit=2, **({'cursor': cursor} if cursor else {}))
+        page = client.get('/api/files', query_string=query).get_json()
+        names += [row[0] for row in page['files']]
+        cursor = page['next']
+        if not cursor:
+            return names
+
+
+def test_cursor_pages_cover_listing(server, client):
+    for index, size in enumerate([50, 10, 40, 20, 30]):
+        server.catalog.upsert(f'page-{index}.txt', size, 1000.0 + index)
+    by_name = list_all(client, sort='name')
+    assert [n for n in by_name if n.startswith('page-')] == [f'page-{i}.txt' for i in range(5)]
+    by_size = list_all(client, sort='size', order='desc')
+    assert [n for n in by_size if n.startswith('page-')] == [
+        'page-0.txt', 'page-2.txt', 'page-4.txt', 'page-3.txt', 'page-1.txt']
+
+
+def test_tampered_cursor_is_rejected(client):
+    bad = [
+        ('size', ['big', 'a.txt']),
+        ('mtime', [True, 'a.txt']),
+        ('name', [10, 'a.txt']),
+        ('type', [None, 'a.txt']),
+        ('size', [10, 7]),
+        ('size', [10]),
+        ('size', [float('nan'), 'a.txt']),
+    ]
+    for sort, key in bad:
+        response = client.get('/api/files', query_string={'sort': sort, 'cursor': make_cursor(key)})
+        assert response.status_code == 400, (sort, key)
+        assert response.get_json() == {'error': 'Invalid cursor'}
+    response = client.get('/api/files', query_string={'sort': 'size', 'cursor': 'not base64!'})
+    assert response.status_code == 400
+    response = client.get('/api/files', query_string={'sort': 'size', 'cursor': make_cursor([10, 'a.txt'])})
+    assert response.status_code == 200
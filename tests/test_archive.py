@@ -0,0 +1,55 @@
+"""
+Archive export: zip and tar streams match the Content-Length announced up
+front and unpack to the stored files
+"""
+import io
+import os
+import sys
+import tarfile
+import zipfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from archive import plan_entries, ARCHIVE_FORMATS
+
+FILES = {'one.txt': b'first file\n', 'two.txt': os.urandom(70000), 'empty.txt': b''}
+
+
+def unpack(archive_format, body):
+    if archive_format == 'zip':
+        with zipfile.ZipFile(io.BytesIO(body)) as archive:
+            assert archive.testzip() is None
+            return {name: archive.read(name) for name in archive.namelist()}
+    with tarfile.open(fileobj=io.BytesIO(body)) as archive:
+        return {member.name: archive.extractfile(member).read() for member in archive.getmembers()}
+
+
+@pytest.mark.parametrize('archive_format', sorted(ARCHIVE_FORMATS))
+def test_stream_length_and_contents(tmp_path, archive_format):
+    for name, data in FILES.items():
+        (tmp_path / name).write_bytes(data)
+    entries = plan_entries(str(tmp_path), list(FILES) + ['missing.txt', 'one.txt'])
+    assert [entry.name for entry in entries] == list(FILES)
+
+    stream = ARCHIVE_FORMATS[archive_format](entries)
+    body = b''.join(stream)
+    assert len(body) == stream.length
+    assert unpack(archive_format, body) == FILES
+
+
+@pytest.mark.parametrize('archive_format', sorted(ARCHIVE_FORMATS))
+def test_export_route(server, client, archive_format):
+    for name, data in FILES.items():
+        with open(os.path.join(server.UPLOAD_FOLDER, name), 'wb') as f:
+            f.write(data)
+        server.catalog.add_path(name)
+    response = client.get('/export', query_string={'format': archive_format, 'files': list(FILES)})
+    assert response.status_code == 200
+    assert int(response.headers['Content-Length']) == len(response.data)
+    assert unpack(archive_format, response.data) == FILES
+
+
+def test_export_rejects_unknown_format(client):
+    assert client.get('/export', query_string={'format': 'rar'}).status_code == 400
@@ -0,0 +1,90 @@
+"""
+Dedup blob store: a blob stays only while a stored file links to it, even
+when the file's content hash was never recorded, and temporary links left
+by a crash are swept
+"""
+import os
+import sys
+import hashlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import blobs
+from blobs import BlobStore, LINK_PREFIX
+
+
+def put(folder, name, data):
+    path = os.path.join(folder, name)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def blob_count(store):
+    return sum(len(files) for _, _, files in os.walk(store.root))
+
+
+def test_replaced_file_releases_its_blob_without_a_known_hash(tmp_path):
+    folder = str(tmp_path)
+    store = BlobStore(folder)
+    path = put(folder, 'a.txt', b'old content')
+    store.store(path)
+    assert blob_count(store) == 1
+
+    old_hash = store.linked_digest(path)
+    assert old_hash == hashlib.sha256(b'old content').hexdigest()
+    os.replace(put(folder, 'incoming', b'new content'), path)
+    store.store(path)
+    store.release(old_hash)
+    assert not store.has(old_hash)
+    assert store.has(hashlib.sha256(b'new content').hexdigest())
+
+
+def test_shared_blob_survives_one_release(tmp_path):
+    folder = str(tmp_path)
+    store = BlobStore(folder)
+    first = put(folder, 'a.txt', b'same')
+    second = put(folder, 'b.txt', b'same')
+    store.store(first)
+    assert store.store(second)
+    digest = store.linked_digest(first)
+    os.remove(first)
+    store.release(digest)
+    assert store.has(digest)
+    assert store.linked_digest(put(folder, 'plain.txt', b'unlinked')) is None
+
+
+def test_collect_sweeps_stale_temporary_links(tmp_path, monkeypatch):
+    folder = str(tmp_path)
+    store = BlobStore(folder)
+    path = put(folder, 'a.txt', b'content')
+    store.store(path)
+    digest = store.linked_digest(path)
+    # A crash between link() and its rename leaves an extra reference
+    os.link(store.blob_path(digest), os.path.join(folder, f'{LINK_PREFIX}0123'))
+    os.remove(path)
+
+    # A fresh one may belong to a link() in progress
+    store.collect()
+    assert os.path.exists(os.path.join(folder, f'{LINK_PREFIX}0123'))
+
+    monkeypatch.setattr(blobs, 'STALE_LINK_AGE', -60)
+    store.collect()
+    assert not os.path.exists(os.path.join(folder, f'{LINK_PREFIX}0123'))
+    assert blob_count(store) == 0
+
+
+def test_app_replace_and_delete_release_blobs(server, tmp_path, monkeypatch):
+    folder = server.UPLOAD_FOLDER
+    monkeypatch.setattr(server, 'blob_store', BlobStore(folder))
+    store = server.blob_store
+    old_digest = hashlib.sha256(b'version one').hexdigest()
+    # Stored without a content hash, as a plain form upload would be
+    server.store_upload(put(folder, 'incoming-1', b'version one'), 'doc.txt', os.path.join(folder, 'doc.txt'))
+    assert store.has(old_digest)
+
+    server.store_upload(put(folder, 'incoming-2', b'version two'), 'doc.txt', os.path.join(folder, 'doc.txt'))
+    assert not store.has(old_digest)
+
+    assert server.delete_stored('doc.txt')
+    assert blob_count(store) == 0
@@ -0,0 +1,72 @@
+"""
+Two processes sharing one catalog: changes made by one worker have to show
+up in the other's in-memory catalog through the change feed, with no folder
+watcher running (as in chunk storage mode).
+"""
+import os
+import sys
+import time
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import FileCatalog, MemoryCatalog
+from events import ChangeFeed
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the second process: writes to the catalog the way a worker does
+WRITER = """
+import sys
+from catalog import FileCatalog, MemoryCatalog
+catalog = MemoryCatalog(FileCatalog(sys.argv[1], lambda name: 'other'))
+catalog.load()
+for command in sys.argv[2:]:
+    op, name, size = command.split(':')
+    if op == 'put':
+        catalog.upsert(name, int(size), 1.0, 'hash-' + size)
+    else:
+        catalog.remove(name)
+"""
+
+
+def write_in_other_process(folder, *commands):
+    subprocess.run([sys.executable, '-c', WRITER, folder, *commands], cwd=ROOT, check=True)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return condition()
+
+
+def test_changes_from_another_process_reach_memory(tmp_path):
+    folder = str(tmp_path)
+    catalog = MemoryCatalog(FileCatalog(folder, lambda name: 'other'))
+    feed = ChangeFeed(catalog.store, poll_interval=0.05, apply=catalog.apply_changes)
+    catalog.load()
+    feed.start()
+
+    write_in_other_process(folder, 'put:a.txt:10', 'put:b.txt:20')
+    assert wait_for(lambda: catalog.exists('a.txt') and catalog.exists('b.txt'))
+    assert catalog.get('b.txt')['size'] == 20
+    assert catalog.count() == 2
+
+    write_in_other_process(folder, 'put:a.txt:11', 'del:b.txt:0')
+    assert wait_for(lambda: not catalog.exists('b.txt') and catalog.get('a.txt')['size'] == 11)
+    assert catalog.get('a.txt')['hash'] == 'hash-11'
+    assert [f['name'] for f in catalog.list_files()] == ['a.txt']
+
+
+def test_stale_log_entry_does_not_undo_newer_state(tmp_path):
+    folder = str(tmp_path)
+    catalog = MemoryCatalog(FileCatalog(folder, lambda name: 'other'))
+    catalog.load()
+    catalog.upsert('a.txt', 1, 1.0)
+    catalog.upsert('a.txt', 2, 1.0)
+    # Replaying the first (older) entry re-reads the store's current row
+    catalog.apply_changes(catalog.store.changes_since(0)[:1])
+    assert catalog.get('a.txt')['size'] == 2
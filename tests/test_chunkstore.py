@@ -0,0 +1,124 @@
+"""
+Chunk store: storing, reading back, removing and compacting, including a
+compaction that runs while an upload's chunks are written but not committed
+"""
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chunkstore
+from chunkstore import ChunkStore
+
+
+def write_file(folder, name, data):
+    path = os.path.join(folder, name)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def read_back(store, name):
+    body = store.open_window(name)
+    try:
+        return body.read(body.length)
+    finally:
+        body.close()
+
+
+def compact(store):
+    """Compact after any background compaction started by remove() is done"""
+    for thread in threading.enumerate():
+        if thread.name == 'chunk-compaction':
+            thread.join(10)
+    return store.compact()
+
+
+def test_put_read_and_dedup(tmp_path):
+    store = ChunkStore(str(tmp_path))
+    data = os.urandom(1024 * 1024)
+    store.put('a.bin', write_file(str(tmp_path), 'src', data))
+    assert read_back(store, 'a.bin') == data
+    # Identical content adds no new bytes
+    assert store.put('b.bin', write_file(str(tmp_path), 'src', data)) == 0
+    body = store.open_window('a.bin', 1000, 5000)
+    assert body.read(5000) == data[1000:6000]
+    body.close()
+
+
+def test_remove_and_compact_reclaims_space(tmp_path):
+    store = ChunkStore(str(tmp_path))
+    keep = os.urandom(512 * 1024)
+    store.put('old.bin', write_file(str(tmp_path), 'src', os.urandom(2 * 1024 * 1024)))
+    store.put('keep.bin', write_file(str(tmp_path), 'src', keep))
+    assert store.remove('old.bin')
+    assert not store.remove('old.bin')
+    compact(store)
+    assert read_back(store, 'keep.bin') == keep
+    assert store.stats()['dead_bytes'] == 0
+
+
+def test_compaction_skips_segments_with_uncommitted_writes(tmp_path, monkeypatch):
+    folder = str(tmp_path)
+    store = ChunkStore(folder)
+    store.put('old.bin', write_file(folder, 'old-src', os.urandom(1024 * 1024)))
+    new_data = os.urandom(1024 * 1024)
+    new_path = write_file(folder, 'new-src', new_data)
+
+    # Hold the upload between appending its chunks and committing them
+    appended = threading.Event()
+    resume = threading.Event()
+    sync_segment = ChunkStore._sync_segment
+
+    def paused_sync(self):
+        sync_segment(self)
+        if threading.current_thread().name == 'upload':
+            appended.set()
+            resume.wait(10)
+
+    monkeypatch.setattr(ChunkStore, '_sync_segment', paused_sync)
+    upload = threading.Thread(target=store.put, args=('new.bin', new_path), name='upload')
+    upload.start()
+    assert appended.wait(10)
+
+    # Removing the only committed file leaves the segment looking all dead
+    store.remove('old.bin')
+    compact(store)
+    resume.set()
+    upload.join(10)
+
+    assert read_back(store, 'new.bin') == new_data
+    # Once committed the segment compacts normally and the data moves intact
+    compact(store)
+    assert read_back(store, 'new.bin') == new_data
+
+
+def test_sealed_full_segment_stays_locked_until_commit(tmp_path, monkeypatch):
+    folder = str(tmp_path)
+    monkeypatch.setattr(chunkstore, 'SEGMENT_SIZE', 256 * 1024)
+    store = ChunkStore(folder)
+    store.put('old.bin', write_file(folder, 'old-src', os.urandom(64 * 1024)))
+    new_data = os.urandom(1024 * 1024)
+    new_path = write_file(folder, 'new-src', new_data)
+
+    appended = threading.Event()
+    resume = threading.Event()
+    sync_segment = ChunkStore._sync_segment
+
+    def paused_sync(self):
+        sync_segment(self)
+        if threading.current_thread().name == 'upload':
+            appended.set()
+            resume.wait(10)
+
+    monkeypatch.setattr(ChunkStore, '_sync_segment', paused_sync)
+    upload = threading.Thread(target=store.put, args=('new.bin', new_path), name='upload')
+    upload.start()
+    assert appended.wait(10)
+    # The upload filled and sealed several segments; none may be compacted yet
+    store.remove('old.bin')
+    compact(store)
+    resume.set()
+    upload.join(10)
+    assert read_back(store, 'new.bin') == new_data
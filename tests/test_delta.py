@@ -0,0 +1,100 @@
+"""
+Delta uploads: rebuilding a file from copied blocks and literals, rejecting
+malformed streams, and the upload route refusing a stale base or a wrong
+digest without leaving temp files behind
+"""
+import io
+import os
+import sys
+import hashlib
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from delta import (file_signature, apply_delta, DeltaError, OP_COPY, OP_LITERAL, OP_END,
+                   COPY_HEADER, LITERAL_HEADER)
+from ingest import TEMP_PREFIX
+
+
+def copy(first, count):
+    return OP_COPY + COPY_HEADER.pack(first, count)
+
+
+def literal(data):
+    return OP_LITERAL + LITERAL_HEADER.pack(len(data)) + data
+
+
+def base_opener(data):
+    return lambda offset, length: io.BytesIO(data[offset:offset + length])
+
+
+def rebuild(base, block_size, ops, limit=None):
+    out = io.BytesIO()
+    result = apply_delta(io.BytesIO(ops), base_opener(base), len(base), block_size, out, limit)
+    return out.getvalue(), result
+
+
+def test_signature_and_round_trip():
+    base = os.urandom(10000)
+    signature = file_signature(io.BytesIO(base), len(base))
+    block_size = signature['block_size']
+    assert signature['sha256'] == hashlib.sha256(base).hexdigest()
+    assert len(signature['weak']) == len(signature['strong']) == -(-len(base) // block_size)
+
+    # Insert bytes after the first block and keep the rest, short last block included
+    new = base[:block_size] + b'inserted' + base[block_size:]
+    ops = copy(0, 1) + literal(b'inserted') + copy(1, len(signature['weak']) - 1) + OP_END
+    rebuilt, (size, literal_bytes, digest) = rebuild(base, block_size, ops)
+    assert rebuilt == new
+    assert (size, literal_bytes, digest) == (len(new), 8, hashlib.sha256(new).hexdigest())
+
+
+@pytest.mark.parametrize('ops, status', [
+    (literal(b'ab'), 400),                    # no end marker
+    (copy(5, 1) + OP_END, 400),               # block past the base
+    (copy(0, 0) + OP_END, 400),
+    (OP_LITERAL + b'\x01', 400),              # truncated header
+    (b'X' + OP_END, 400),
+    (literal(b'y' * 100) + OP_END, 413),      # over the size limit
+])
+def test_malformed_delta_is_rejected(ops, status):
+    with pytest.raises(DeltaError) as error:
+        rebuild(b'a' * 4096, 2048, ops, limit=50)
+    assert error.value.status == status
+
+
+def temp_files(folder):
+    return [name for name in os.listdir(folder) if name.startswith(TEMP_PREFIX)]
+
+
+def test_delta_route(server, client):
+    folder = server.UPLOAD_FOLDER
+    base = os.urandom(8000)
+    temp_path = os.path.join(folder, 'incoming-delta')
+    with open(temp_path, 'wb') as f:
+        f.write(base)
+    # With a recorded hash a stale base is refused before the delta is read
+    server.store_upload(temp_path, 'delta.txt', os.path.join(folder, 'delta.txt'),
+                        hashlib.sha256(base).hexdigest())
+
+    signature = client.get('/api/delta/delta.txt').get_json()
+    block_size = signature['block_size']
+    new = base + b'appended'
+    ops = copy(0, len(signature['weak'])) + literal(b'appended') + OP_END
+    headers = {'X-Delta-Block-Size': str(block_size), 'X-Delta-Base': signature['sha256'],
+               'X-Content-SHA256': hashlib.sha256(new).hexdigest()}
+
+    stale = dict(headers, **{'X-Delta-Base': '0' * 64})
+    assert client.put('/api/delta/delta.txt', data=ops, headers=stale).status_code == 409
+    wrong = dict(headers, **{'X-Content-SHA256': '0' * 64})
+    assert client.put('/api/delta/delta.txt', data=ops, headers=wrong).status_code == 409
+    assert client.put('/api/delta/delta.txt', data=ops[:-1], headers=headers).status_code == 400
+    assert client.get('/download/delta.txt').data == base
+    assert not temp_files(folder)
+
+    response = client.put('/api/delta/delta.txt', data=ops, headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()['literal_bytes'] == len(b'appended')
+    assert client.get('/download/delta.txt').data == new
+    assert not temp_files(folder)
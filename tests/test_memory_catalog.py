@@ -0,0 +1,71 @@
+"""
+In-memory catalog: sorted listings kept in order across changes, and a
+folder sync that runs while another writer adds records
+"""
+import os
+import sys
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import FileCatalog, MemoryCatalog, SORT_KEYS
+
+
+def classify(name):
+    return 'video' if name.endswith('.mp4') else 'other'
+
+
+def test_sorted_listings_follow_changes(tmp_path):
+    catalog = MemoryCatalog(FileCatalog(str(tmp_path), classify))
+    catalog.load()
+    rng = random.Random(7)
+    names = [f"{rng.choice(['Clip', 'clip', 'note'])}-{i}.{rng.choice(['mp4', 'txt'])}" for i in range(60)]
+    for name in names:
+        catalog.upsert(name, rng.randrange(1000), float(rng.randrange(100)))
+    # Build every index, then change records underneath them
+    for sort in SORT_KEYS:
+        catalog.list_files(sort)
+    for name in rng.sample(names, 20):
+        catalog.remove(name)
+    for name in rng.sample(names, 30):
+        catalog.upsert(name, rng.randrange(1000), float(rng.randrange(100)))
+
+    records = list(catalog._records.values())
+    for sort, key in SORT_KEYS.items():
+        expected = [record.name for record in sorted(records, key=key)]
+        assert [row['name'] for row in catalog.list_files(sort)] == expected
+        assert [row['name'] for row in catalog.list_files(sort, descending=True)] == expected[::-1]
+        rows, after = catalog.page(sort, limit=10)
+        rows2, _ = catalog.page(sort, limit=10, after=after)
+        assert [row['name'] for row in rows + rows2] == expected[:20]
+
+
+class ChangingName(str):
+    """A record name whose lookup in sync()'s scan lets another writer in"""
+
+    def __hash__(self):
+        if self.on_lookup is not None:
+            on_lookup, self.on_lookup = self.on_lookup, None
+            on_lookup()
+        return str.__hash__(self)
+
+
+def test_sync_while_records_change(tmp_path):
+    folder = str(tmp_path)
+    catalog = MemoryCatalog(FileCatalog(folder, classify))
+    catalog.load()
+    with open(os.path.join(folder, 'kept.txt'), 'wb') as f:
+        f.write(b'x')
+    catalog.add_path('kept.txt')
+    catalog.upsert('gone.txt', 1, 1.0)
+
+    # Stands in for another thread adding a file while sync() looks for
+    # removed ones
+    name = ChangingName('kept.txt')
+    name.on_lookup = None
+    catalog._records[name] = catalog._records.pop('kept.txt')
+    name.on_lookup = lambda: catalog.upsert('new.txt', 2, 1.0)
+
+    catalog.sync()
+    assert not catalog.exists('gone.txt')
+    assert catalog.exists('new.txt') and catalog.exists('kept.txt')
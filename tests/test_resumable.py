@@ -0,0 +1,102 @@
+"""
+Resumable uploads: chunks written out of order and in parallel, the block
+map reported back, commits of incomplete sessions, and chunks that do not
+line up with the session's blocks
+"""
+import io
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import resumable
+from resumable import UploadSessionStore, UploadSessionError
+
+BLOCK = 1024
+
+
+@pytest.fixture(autouse=True)
+def small_blocks(monkeypatch):
+    monkeypatch.setattr(resumable, 'MIN_BLOCK_SIZE', BLOCK)
+
+
+def test_parallel_out_of_order_chunks_commit_intact(tmp_path):
+    store = UploadSessionStore(str(tmp_path))
+    data = os.urandom(BLOCK * 8 + 100)
+    session_id = store.create('a.txt', len(data))['id']
+    offsets = list(range(0, len(data), BLOCK * 2))[::-1]
+
+    def send(offset):
+        chunk = data[offset:offset + BLOCK * 2]
+        store.write_chunk(session_id, offset, io.BytesIO(chunk), len(chunk))
+
+    threads = [threading.Thread(target=send, args=(offset,)) for offset in offsets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    journal = store.get(session_id)
+    assert journal['received'] == [[0, len(data)]]
+    target = os.path.join(str(tmp_path), 'a.txt')
+    store.commit(session_id, target)
+    with open(target, 'rb') as f:
+        assert f.read() == data
+    with pytest.raises(UploadSessionError) as error:
+        store.get(session_id)
+    assert error.value.status == 404
+
+
+def test_short_body_marks_only_whole_blocks(tmp_path):
+    store = UploadSessionStore(str(tmp_path))
+    session_id = store.create('a.txt', BLOCK * 4)['id']
+    # The connection drops halfway through the second block
+    journal = store.write_chunk(session_id, 0, io.BytesIO(b'x' * (BLOCK + 10)), BLOCK * 2)
+    assert journal['received'] == [[0, BLOCK]]
+    assert not store.is_complete(journal)
+    with pytest.raises(UploadSessionError) as error:
+        store.commit(session_id, os.path.join(str(tmp_path), 'a.txt'))
+    assert error.value.status == 409
+
+
+@pytest.mark.parametrize('offset, length, status', [
+    (10, BLOCK, 400),             # not on a block boundary
+    (0, BLOCK + 10, 400),         # ends inside a block
+    (BLOCK * 3, BLOCK * 2, 416),  # past the declared size
+])
+def test_misaligned_or_oversize_chunks_are_rejected(tmp_path, offset, length, status):
+    store = UploadSessionStore(str(tmp_path))
+    session_id = store.create('a.txt', BLOCK * 4)['id']
+    with pytest.raises(UploadSessionError) as error:
+        store.write_chunk(session_id, offset, io.BytesIO(b'x' * length), length)
+    assert error.value.status == status
+    assert store.get(session_id)['received'] == []
+
+
+def test_upload_routes(server, client):
+    data = os.urandom(BLOCK * 3 + 7)
+    created = client.post('/api/uploads', json={'filename': 'resumed.txt', 'size': len(data)})
+    assert created.status_code == 201
+    session = created.get_json()
+    assert session['block_size'] == BLOCK
+    url = f"/api/uploads/{session['id']}"
+
+    # Last block first, by Content-Range, then the rest by offset
+    tail = data[BLOCK * 2:]
+    response = client.put(url, data=tail, headers={
+        'Content-Range': f'bytes {BLOCK * 2}-{len(data) - 1}/{len(data)}'})
+    assert response.get_json()['received'] == [[BLOCK * 2, len(data)]]
+    assert client.post(f'{url}/commit').status_code == 409
+    assert client.put(url, data=data[5:BLOCK + 5], query_string={'offset': 5}).status_code == 400
+
+    client.put(url, data=data[:BLOCK * 2], query_string={'offset': 0})
+    status = client.get(url).get_json()
+    assert status['complete'] and status['received'] == [[0, len(data)]]
+
+    committed = client.post(f'{url}/commit').get_json()
+    assert committed == {'name': 'resumed.txt', 'size': len(data)}
+    assert client.get('/download/resumed.txt').data == data
+    assert client.get(url).status_code == 404
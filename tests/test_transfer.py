@@ -0,0 +1,115 @@
+"""
+Transfer engine: Range header parsing, and file windows sent to a client
+socket through server.py's file wrapper, by sendfile and by the buffered copy
+"""
+import os
+import sys
+import socket
+import threading
+
+import pytest
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server
+from server import SocketFileWrapper
+from transfer import TransferBody, parse_ranges
+
+
+def test_parse_ranges():
+    assert parse_ranges('bytes=0-9', 100) == [(0, 9)]
+    assert parse_ranges('bytes=90-', 100) == [(90, 99)]
+    assert parse_ranges('bytes=-10', 100) == [(90, 99)]
+    assert parse_ranges('bytes=50-500', 100) == [(50, 99)]
+    # Overlapping and adjacent ranges are coalesced
+    assert parse_ranges('bytes=20-29, 0-9,10-15', 100) == [(0, 15), (20, 29)]
+    # Unsatisfiable ranges are skipped while another one fits
+    assert parse_ranges('bytes=200-300,0-0', 100) == [(0, 0)]
+    with pytest.raises(RequestedRangeNotSatisfiable):
+        parse_ranges('bytes=100-', 100)
+
+
+@pytest.mark.parametrize('header', [
+    None, '', 'items=0-9', 'bytes=', 'bytes=9-0', 'bytes=abc', 'bytes=-', 'bytes=0-9,x-1',
+    # Characters str.isdigit() accepts but that are not ASCII digits
+    'bytes=\u00b2-5', 'bytes=0-\u00b9', 'bytes=-\uff15', 'bytes=\u0661-\u0662',
+])
+def test_malformed_ranges_are_ignored(header):
+    assert parse_ranges(header, 100) is None
+
+
+def test_too_many_ranges_are_ignored():
+    header = 'bytes=' + ','.join(f'{i * 2}-{i * 2}' for i in range(40))
+    assert parse_ranges(header, 1000) is None
+
+
+def test_superscript_range_gets_full_download(server, client):
+    with open(os.path.join(server.UPLOAD_FOLDER, 'range.txt'), 'wb') as f:
+        f.write(b'0123456789')
+    server.catalog.add_path('range.txt')
+    response = client.get('/download/range.txt', headers={'Range': 'bytes=\u00b2-5'})
+    assert response.status_code == 200
+    assert response.get_data() == b'0123456789'
+    response = client.get('/download/range.txt', headers={'Range': 'bytes=2-5'})
+    assert response.status_code == 206
+    assert response.get_data() == b'2345'
+
+
+def send_through_wrapper(body, block_size=64 * 1024):
+    """Run a wrapper over a socket pair; returns (transfer path, bytes received)"""
+    sender, receiver = socket.socketpair()
+    received = bytearray()
+
+    def receive():
+        while True:
+            data = receiver.recv(65536)
+            if not data:
+                break
+            received.extend(data)
+
+    reader = threading.Thread(target=receive)
+    reader.start()
+    wrapper = SocketFileWrapper(sender, body, block_size)
+    try:
+        # The server writes what the wrapper yields: only the empty header flush
+        assert [chunk for chunk in wrapper if chunk] == []
+    finally:
+        wrapper.close()
+        sender.close()
+    reader.join(10)
+    receiver.close()
+    return wrapper.transfer_path, bytes(received)
+
+
+def test_window_is_sent_with_sendfile(tmp_path):
+    data = os.urandom(300 * 1024)
+    path = tmp_path / 'video.txt'
+    path.write_bytes(data)
+    used, received = send_through_wrapper(TransferBody(str(path), 1000, 200 * 1024))
+    assert used == ('sendfile' if hasattr(os, 'sendfile') else 'buffered')
+    assert received == data[1000:1000 + 200 * 1024]
+
+
+def test_buffered_copy_without_sendfile(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, 'HAS_SENDFILE', False)
+    data = os.urandom(300 * 1024)
+    path = tmp_path / 'video.txt'
+    path.write_bytes(data)
+    used, received = send_through_wrapper(TransferBody(str(path), 5, len(data) - 10), block_size=4096)
+    assert used == 'buffered'
+    assert received == data[5:-5]
+
+
+def test_body_without_fileno_is_buffered():
+    class Body:
+        def __init__(self, data):
+            self.data = data
+
+        def read(self, size):
+            chunk, self.data = self.data[:size], self.data[size:]
+            return chunk
+
+    used, received = send_through_wrapper(Body(b'x' * 100000), block_size=4096)
+    assert used == 'buffered'
+    assert received == b'x' * 100000
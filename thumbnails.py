@@ -0,0 +1,168 @@
+"""
+Image thumbnails
+Renders fixed-size thumbnails in a process pool and keeps them in a
+content-keyed disk cache with a size bound and least-recently-used eviction
+"""
+import os
+import threading
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_DIRNAME = '.thumbnails'
+THUMBNAIL_SIZE = (256, 256)
+THUMBNAIL_QUALITY = 80
+
+# Disk budget for cached thumbnails; eviction trims to LOW_WATER of this
+CACHE_LIMIT = 64 * 1024 * 1024
+LOW_WATER = 0.9
+
+# Formats Pillow can rasterize (SVG is left to the browser)
+RASTER_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+
+
+def _output_format():
+    """WebP when this Pillow build supports it, JPEG otherwise"""
+    try:
+        from PIL import features
+        if features.check('webp'):
+            return 'WEBP', 'webp', 'image/webp'
+    except ImportError:
+        pass
+    return 'JPEG', 'jpg', 'image/jpeg'
+
+
+def render_thumbnail(source_path, target_path, size, image_format):
+    """Write a thumbnail of ``source_path`` to ``target_path`` (runs in a worker process)"""
+    from PIL import Image, ImageOps
+
+    with Image.open(source_path) as img:
+        # Lets the JPEG decoder downscale while decoding instead of after
+        img.draft('RGB', size)
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail(size)
+        has_alpha = img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info)
+        if image_format == 'JPEG' or not has_alpha:
+            img = img.convert('RGB')
+        elif img.mode != 'RGBA':
+            img = img.convert('RGBA')
+        temp_path = f"{target_path}.{os.getpid()}.tmp"
+        img.save(temp_path, image_format, quality=THUMBNAIL_QUALITY)
+    os.replace(temp_path, target_path)
+    return os.path.getsize(target_path)
+
+
+def is_thumbnailable(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in RASTER_EXTENSIONS
+
+
+class ThumbnailCache:
+    """Disk cache of thumbnails keyed by file content"""
+
+    def __init__(self, folder, max_bytes=CACHE_LIMIT, workers=2):
+        self.cache_dir = os.path.join(folder, THUMBNAIL_DIRNAME)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.image_format, self.extension, self.mimetype = _output_format()
+        self._executor = None
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._total = sum(entry.stat().st_size for entry in os.scandir(self.cache_dir)
+                          if entry.is_file() and entry.name.endswith(self.extension))
+
+    def _pool(self):
+        if self._executor is None:
+            try:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            except (OSError, NotImplementedError, ImportError) as e:
+                # Frozen builds and some sandboxes cannot fork helpers
+                logger.warning(f"Process pool unavailable for thumbnails, using threads: {e}")
+                self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    @staticmethod
+    def key_for(stats, content_hash=None):
+        """Cache key: the content hash when known, else inode/size/mtime"""
+        if content_hash:
+            return content_hash[:32]
+        return f"{stats.st_ino:x}{stats.st_size:x}{stats.st_mtime_ns:x}"
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, f"{key}.{self.extension}")
+
+    def schedule(self, source_path, key):
+        """Start rendering a thumbnail unless it is cached or already in flight
+
+        Returns a Future, or None when the thumbnail already exists. Callers
+        asking for the same key share one render.
+        """
+        target_path = self.path_for(key)
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future
+            if os.path.exists(target_path):
+                return None
+            future = self._pool().submit(render_thumbnail, source_path, target_path,
+                                         THUMBNAIL_SIZE, self.image_format)
+            self._inflight[key] = future
+        future.add_done_callback(lambda done: self._finished(key, done))
+        return future
+
+    def _finished(self, key, future):
+        try:
+            size = future.result()
+        except Exception as e:
+            logger.warning(f"Thumbnail render failed for {key}: {e}")
+            size = 0
+        with self._lock:
+            self._inflight.pop(key, None)
+            self._total += size
+        if self._total > self.max_bytes:
+            self._evict()
+
+    def get(self, source_path, key, timeout=30):
+        """Return the cached thumbnail path, rendering it first if needed"""
+        target_path = self.path_for(key)
+        if os.path.exists(target_path):
+            try:
+                # Bump mtime so eviction treats it as recently used
+                os.utime(target_path)
+            except OSError:
+                pass
+            return target_path
+        future = self.schedule(source_path, key)
+        try:
+            if future is not None:
+                future.result(timeout=timeout)
+        except Exception as e:
+            logger.warning(f"Thumbnail unavailable for {os.path.basename(source_path)}: {e}")
+            return None
+        return target_path if os.path.exists(target_path) else None
+
+    def _evict(self):
+        """Delete least recently used thumbnails until under the low-water mark"""
+        with self._lock:
+            entries = []
+            total = 0
+            for entry in os.scandir(self.cache_dir):
+                if entry.is_file() and entry.name.endswith(self.extension):
+                    stats = entry.stat()
+                    entries.append((stats.st_mtime, stats.st_size, entry.path))
+                    total += stats.st_size
+            entries.sort()
+            target = self.max_bytes * LOW_WATER
+            removed = 0
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                    removed += 1
+                except OSError:
+                    pass
+            self._total = total
+        logger.info(f"Evicted {removed} thumbnails, cache now {total} bytes")
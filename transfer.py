@@ -0,0 +1,279 @@
+"""
+File transfer engine for downloads and media streaming
+Hands file bodies to the server's ``wsgi.file_wrapper``, which sends them
+with sendfile where it can (server.py's thread-pool server), streams them on
+the event loop in ASGI mode, and otherwise copies them through a buffer
+"""
+import os
+import re
+import secrets
+import logging
+from datetime import datetime, timezone
+
+from flask import current_app, request
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+from werkzeug.http import http_date, is_resource_modified, parse_date, quote_etag, unquote_etag
+
+logger = logging.getLogger(__name__)
+
+# Read size for the buffered fallback path
+CHUNK_SIZE = 1024 * 1024
+
+HAS_SENDFILE = hasattr(os, 'sendfile')
+
+# Requests asking for more ranges than this are served as a full 200
+MAX_RANGES = 32
+
+# A byte position in a Range header: ASCII digits only
+DIGITS = re.compile(r'[0-9]+')
+
+
+class TransferBody:
+    """A byte window of an open file
+
+    Exposes ``fileno()``, ``offset`` and ``length`` so a server with a
+    sendfile ``wsgi.file_wrapper`` can hand the window to the kernel, and a
+    bounded ``read()``/``readinto()`` so every other consumer still stops at
+    the end of the window.
+    """
+
+    __slots__ = ('file', 'offset', 'length', 'remaining')
+
+    def __init__(self, path, offset=0, length=None):
+        self.file = open(path, 'rb', buffering=0)
+        if length is None:
+            length = os.fstat(self.file.fileno()).st_size - offset
+        self.offset = offset
+        self.length = length
+        self.remaining = length
+        self.file.seek(offset)
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def read(self, size=CHUNK_SIZE):
+        """Read up to ``size`` bytes without crossing the end of the window"""
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def readinto(self, buffer):
+        """Fill ``buffer`` from the window; returns the number of bytes read"""
+        view = memoryview(buffer)[:max(self.remaining, 0)]
+        if not view:
+            return 0
+        count = self.file.readinto(view)
+        self.remaining -= count
+        return count
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self):
+        self.file.close()
+
+
+def file_etag(stats, content_hash=None):
+    """Strong validator for a file
+
+    Uses the content hash when it is known, so the tag survives renames and
+    restores; otherwise falls back to inode, size and mtime.
+    """
+    if content_hash:
+        return f"sha256-{content_hash}"
+    return f"{stats.st_ino:x}-{stats.st_size:x}-{stats.st_mtime_ns:x}"
+
+
+def set_validators(response, etag, last_modified=None, weak=False):
+    """Attach ETag and Last-Modified headers to a response"""
+    response.headers['ETag'] = quote_etag(etag, weak)
+    if last_modified is not None:
+        response.headers['Last-Modified'] = http_date(int(last_modified))
+    return response
+
+
+def not_modified(etag, last_modified=None, weak=False):
+    """Return a 304 response if the request's validators still match, else None
+
+    If-None-Match takes precedence over If-Modified-Since as RFC 7232 asks.
+    Checking before building the real response means an unchanged resource
+    never opens its file or renders its template.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    if last_modified is not None:
+        last_modified = datetime.fromtimestamp(int(last_modified), timezone.utc)
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return None
+    response = current_app.response_class(status=304)
+    response.headers['ETag'] = quote_etag(etag, weak)
+    if last_modified is not None:
+        response.headers['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def parse_ranges(header, size):
+    """Resolve a Range header against a file size
+
+    Returns None when the header should be ignored (absent, another unit,
+    malformed or too many ranges), otherwise a sorted list of coalesced
+    inclusive (first, last) byte positions. Raises 416 when no range can be
+    satisfied.
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not spec:
+        return None
+
+    ranges = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        first, dash, last = item.partition('-')
+        first, last = first.strip(), last.strip()
+        if not dash or not (first or last):
+            return None
+        # str.isdigit() also accepts other scripts' digits and superscripts,
+        # which int() then rejects or reads differently
+        if (first and not DIGITS.fullmatch(first)) or (last and not DIGITS.fullmatch(last)):
+            return None
+
+        if not first:
+            # Suffix range: the final N bytes
+            suffix = int(last)
+            if suffix == 0 or size == 0:
+                continue
+            ranges.append((max(size - suffix, 0), size - 1))
+            continue
+
+        first = int(first)
+        if last and int(last) < first:
+            return None
+        if first >= size:
+            continue
+        last = int(last) if last else size - 1
+        ranges.append((first, min(last, size - 1)))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+    if not ranges:
+        raise RequestedRangeNotSatisfiable(length=size)
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for first, last in ranges[1:]:
+        if first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def if_range_matches(if_range, etag, mtime):
+    """Check an If-Range header against the file's strong validators"""
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith(('"', 'W/')):
+        value, weak = unquote_etag(if_range)
+        return not weak and value == etag
+    date = parse_date(if_range)
+    return date is not None and int(date.timestamp()) == int(mtime)
+
+
+def file_response(path, mimetype, offset=0, length=None, status=200, open_body=TransferBody):
+    """Build a response that streams ``length`` bytes of ``path`` from ``offset``
+
+    The caller is responsible for range/conditional headers; this sets
+    Content-Length and ``X-Transfer-Path`` reporting which path served it.
+    ``open_body(path, offset, length)`` supplies the body for storage that
+    is not a plain file.
+    """
+    body = open_body(path, offset, length)
+    wrapper = request.environ.get('wsgi.file_wrapper')
+    app_iter = wrapper(body, CHUNK_SIZE) if wrapper is not None else body
+    # Wrappers that know how they will send the body say so
+    path_used = getattr(app_iter, 'transfer_path', 'buffered')
+
+    response = current_app.response_class(app_iter, status, mimetype=mimetype, direct_passthrough=True)
+    response.headers['Content-Length'] = str(body.length)
+    response.headers['X-Transfer-Path'] = path_used
+    logger.debug(f"Serving {os.path.basename(path)} bytes {offset}+{body.length} via {path_used}")
+    return response
+
+
+class MultipartBody:
+    """multipart/byteranges body streamed from a list of file windows"""
+
+    def __init__(self, path, ranges, size, mimetype, open_body=TransferBody):
+        self.path = path
+        self.open_body = open_body
+        self.boundary = secrets.token_hex(16)
+        self.parts = []
+        for first, last in ranges:
+            head = (f"\r\n--{self.boundary}\r\n"
+                    f"Content-Type: {mimetype}\r\n"
+                    f"Content-Range: bytes {first}-{last}/{size}\r\n\r\n").encode('latin-1')
+            self.parts.append((head, first, last - first + 1))
+        self.tail = f"\r\n--{self.boundary}--\r\n".encode('latin-1')
+        self.length = sum(len(head) + length for head, _, length in self.parts) + len(self.tail)
+
+    def __iter__(self):
+        for head, offset, length in self.parts:
+            yield head
+            body = self.open_body(self.path, offset, length)
+            try:
+                yield from body
+            finally:
+                body.close()
+        yield self.tail
+
+
+def ranged_file_response(path, mimetype, stats=None, content_hash=None, open_body=TransferBody):
+    """Serve ``path`` honouring conditional headers, Range and If-Range
+
+    Answers 304 when the client's copy is current. Single ranges and full
+    bodies go through file_response (and so through sendfile where
+    available); several ranges are sent as multipart/byteranges. Sets
+    Accept-Ranges, ETag and Last-Modified. Non-file storage passes its own
+    ``stats`` and ``open_body``.
+    """
+    if stats is None:
+        stats = os.stat(path)
+    size = stats.st_size
+    etag = file_etag(stats, content_hash)
+
+    cached = not_modified(etag, stats.st_mtime)
+    if cached is not None:
+        return cached
+
+    ranges = None
+    if if_range_matches(request.headers.get('If-Range'), etag, stats.st_mtime):
+        ranges = parse_ranges(request.headers.get('Range'), size)
+
+    if not ranges:
+        response = file_response(path, mimetype, open_body=open_body)
+    elif len(ranges) == 1:
+        first, last = ranges[0]
+        response = file_response(path, mimetype, first, last - first + 1, 206, open_body)
+        response.headers['Content-Range'] = f'bytes {first}-{last}/{size}'
+    else:
+        body = MultipartBody(path, ranges, size, mimetype, open_body)
+        response = current_app.response_class(
+            body, 206, mimetype=f'multipart/byteranges; boundary={body.boundary}', direct_passthrough=True
+        )
+        response.headers['Content-Length'] = str(body.length)
+        response.headers['X-Transfer-Path'] = 'buffered'
+
+    response.headers['Accept-Ranges'] = 'bytes'
+    return set_validators(response, etag, stats.st_mtime)
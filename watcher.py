@@ -0,0 +1,138 @@
+"""
+Upload folder watcher
+Keeps a MemoryCatalog current when files are added, replaced or deleted by
+anything other than this app (rsync, a mounted disk, the Android app). Uses
+inotify on Linux and falls back to periodic rescans elsewhere.
+"""
+import os
+import sys
+import struct
+import select
+import ctypes
+import ctypes.util
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Seconds between rescans when inotify is unavailable
+POLL_INTERVAL = 5
+
+# inotify event flags (linux/inotify.h)
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF)
+
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def _open_inotify(folder):
+    """Return an inotify descriptor watching ``folder``, or None if unsupported"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        if libc.inotify_add_watch(fd, os.fsencode(folder), WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(errno, 'inotify_add_watch failed')
+        return fd
+    except (OSError, AttributeError) as e:
+        logger.warning(f"inotify unavailable, polling {folder} instead: {e}")
+        return None
+
+
+class FolderWatcher:
+    """Feeds filesystem changes in a folder to a MemoryCatalog
+
+    The inotify watch is registered in the constructor, so events that
+    happen while the catalog loads are queued by the kernel and applied once
+    start() is called.
+    """
+
+    def __init__(self, folder, catalog, poll_interval=POLL_INTERVAL):
+        self.folder = folder
+        self.catalog = catalog
+        self.poll_interval = poll_interval
+        self._fd = _open_inotify(folder)
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def mode(self):
+        return 'inotify' if self._fd is not None else 'polling'
+
+    def start(self):
+        target = self._run_inotify if self._fd is not None else self._run_polling
+        self._thread = threading.Thread(target=target, name='folder-watcher', daemon=True)
+        self._thread.start()
+        logger.info(f"Watching {self.folder} for changes ({self.mode})")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _run_polling(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.catalog.sync()
+            except Exception as e:
+                logger.error(f"Error rescanning {self.folder}: {e}")
+
+    def _run_inotify(self):
+        while not self._stop.is_set():
+            readable, _, _ = select.select([self._fd], [], [], 1.0)
+            if not readable:
+                continue
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            names, rescan = self._parse_events(data)
+            try:
+                if rescan:
+                    self.catalog.sync()
+                else:
+                    for name in names:
+                        self.catalog.refresh(name)
+            except Exception as e:
+                logger.error(f"Error applying changes in {self.folder}: {e}")
+
+    @staticmethod
+    def _parse_events(data):
+        """Return the changed file names in a read buffer and whether a full rescan is needed"""
+        names = set()
+        rescan = False
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & (IN_Q_OVERFLOW | IN_DELETE_SELF | IN_MOVE_SELF):
+                rescan = True
+            elif name and not mask & IN_ISDIR:
+                name = os.fsdecode(name)
+                # Dotfiles are our own databases, temp files and caches
+                if not name.startswith('.'):
+                    names.add(name)
+        return names, rescan